@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from savefile import append_changes, changes_between, write_save
+
+# after this many journal entries the next save is a full one again, so loading stays quick
+MAX_JOURNAL_ENTRIES = 20
+
+
+class Autosaver:
+    # writes snapshots of the game on a worker thread, so the game loop only pays for taking
+    # the snapshot. only the first save is a full one: the next ones append what changed
+    # since the previous save to the save's journal.
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1)  # one at a time, in order
+        self.pending = None
+        # the rest is only touched by the worker thread (or after wait())
+        self.error = None  # the first write that failed since the last wait
+        self.last_snapshot = None
+        self.save_id = None
+        self.journal_entries = 0
+
+    def save(self, snapshot, full=False):
+        # queue a snapshot to be written. with full=True (or if it can't be written as changes
+        # to the last one) the whole save file is rewritten
+        self.pending = self.executor.submit(self.write, snapshot, full)
+
+    def write(self, snapshot, full):
+        try:
+            self.write_snapshot(snapshot, full)
+        except Exception as error:
+            # (a later save that works doesn't make up for it: the journal it writes may not match the save file)
+            if self.error is None:
+                self.error = error
+            raise
+
+    def write_snapshot(self, snapshot, full):
+        changes = None
+        if not full and self.last_snapshot is not None and self.journal_entries < MAX_JOURNAL_ENTRIES:
+            changes = changes_between(self.last_snapshot, snapshot)
+
+        # forget the last snapshot while writing: if this write fails, the next one is a full save
+        self.last_snapshot = None
+        if changes is None:
+            self.save_id = write_save(self.path, snapshot)
+            self.journal_entries = 0
+        else:
+            append_changes(self.path, self.save_id, changes)
+            self.journal_entries += 1
+        self.last_snapshot = snapshot
+
+    def reset(self):
+        # the game was replaced (by loading a save...), so the next save must be a full one.
+        # queued like a save, so it happens after the saves already waiting
+        self.executor.submit(self.forget)
+
+    def forget(self):
+        self.last_snapshot = None
+
+    def wait(self):
+        # block until every queued save is written, raising the error of the first one that failed
+        if self.pending is not None:
+            pending = self.pending
+            self.pending = None
+            wait([pending])
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
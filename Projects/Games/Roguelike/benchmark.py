@@ -0,0 +1,492 @@
+import argparse
+import glob
+import os
+import random
+import shelve
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import game
+from bots import RandomWalker
+from levelgen import LevelGenerator
+from pathfinding import UNREACHABLE, distance_map
+from rooms import connect_rooms, place_rooms
+from routes import RouteGraph
+from savefile import read_save, write_save
+from scheduler import TurnScheduler
+from spatial import SpatialIndex
+
+
+def play_randomly(turns, seed):
+    # start a game and walk around at random for a while, so there is some explored map, messages, etc
+    random.seed(seed)
+    game.new_game()
+    for _ in range(turns):
+        if game.game_state != 'playing':
+            break
+        game.player_move_or_attack(random.randint(-1, 1), random.randint(-1, 1))
+        game.fov_recompute = True
+        game.update_fov()
+        game.monsters_take_turns()
+
+
+def shelve_save(path):
+    # how the game used to be saved: pickling the live objects into a shelve
+    file = shelve.open(path, 'n')
+    file['map'] = game.map
+    objects = list(game.objects)
+    file['objects'] = objects
+    file['player_index'] = objects.index(game.player)
+    file['stairs_index'] = objects.index(game.stairs)
+    file['inventory'] = game.inventory
+    file['game_msgs'] = list(game.game_msgs)
+    file['game_state'] = game.game_state
+    file['dungeon_level'] = game.dungeon_level
+    file.close()
+
+
+def shelve_load(path):
+    file = shelve.open(path, 'r')
+    game.map = file['map']
+    objects = file['objects']
+    game.objects = game.EntityStore(objects)
+    game.player = objects[file['player_index']]
+    game.stairs = objects[file['stairs_index']]
+    game.inventory = file['inventory']
+    game.game_msgs.restore(file['game_msgs'])
+    game.game_state = file['game_state']
+    game.dungeon_level = file['dungeon_level']
+    file.close()
+
+    game.object_index = SpatialIndex()
+    for obj in game.objects:
+        game.object_index.add(obj)
+    game.scheduler = TurnScheduler()
+
+
+def save_file_save(path):
+    write_save(path, game.snapshot_game())
+
+
+def save_file_load(path):
+    game.restore_game(read_save(path))
+
+
+def files_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def time_it(function, path, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(path)
+    return (time.perf_counter() - start) / repeat
+
+
+def benchmark_save(args):
+    # compare the save format with the old shelve saves: file size, and time to save and load
+    game.MAP_WIDTH = args.width
+    game.MAP_HEIGHT = args.height
+    play_randomly(args.turns, args.seed)
+    print('map %dx%d, %d objects on the map, %d turns played' % (game.MAP_WIDTH, game.MAP_HEIGHT, len(game.objects),
+                                                                args.turns))
+    print('%-10s %12s %12s %12s' % ('format', 'size (B)', 'save (ms)', 'load (ms)'))
+    # (shelve goes last: it pickles the objects and the inventory separately, so loading it splits
+    # the player from the equipment it wears, which the save file would then refuse)
+    for (name, save, load) in (('savefile', save_file_save, save_file_load), ('shelve', shelve_save, shelve_load)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'savegame')
+            save_time = time_it(save, path, args.repeat)
+            size = files_size(directory)
+            load_time = time_it(load, path, args.repeat)
+        print('%-10s %12d %12.2f %12.2f' % (name, size, save_time * 1000, load_time * 1000))
+
+
+def seed_range(text):
+    # "5" is just seed 5, "0-99" is seeds 0 to 99 (included)
+    (first, _, last) = text.partition('-')
+    return range(int(first), int(last or first) + 1)
+
+
+def benchmark_turns(args):
+    # play a headless game per seed with the random walking bot, and count turns per second
+    total_turns = 0
+    start = time.perf_counter()
+    for seed in args.seeds:
+        game.new_game(seed)
+        game.play_headless(RandomWalker(seed), args.turns)
+        total_turns += game.turn
+        if args.verbose:
+            print('seed %d: %d turns, dungeon level %d, %s' % (seed, game.turn, game.dungeon_level, game.game_state))
+    elapsed = time.perf_counter() - start
+    print('%d games, %d turns in %.2f s: %.0f turns/s' % (len(args.seeds), total_turns, elapsed, total_turns / elapsed))
+    if args.profile:
+        game.profiler.write(args.profile)
+
+
+def benchmark_replays(args):
+    # play every recorded game of a directory again, as fast as it goes: the corpus of real games
+    # that tells if a change made turns slower, or changed how games play out
+    paths = sorted(glob.glob(os.path.join(args.directory, '*.json')))
+    start = time.perf_counter()
+    passed = game.check_replays(paths)
+    elapsed = time.perf_counter() - start
+    print('%d replays in %.2f s, %s' % (len(paths), elapsed, 'all ended the same' if passed else 'NOT ALL ENDED THE SAME'))
+    if args.profile:
+        game.profiler.write(args.profile)
+    if not passed:
+        raise SystemExit(1)
+
+
+def benchmark_levels(args):
+    # generate a level per seed, the way next_level does, and count levels per second
+    game.MAP_WIDTH = args.width
+    game.MAP_HEIGHT = args.height
+    game.new_game(0)
+    start = time.perf_counter()
+    for seed in args.seeds:
+        game.seed_game(seed)
+        game.make_map()
+        game.initialize_fov()
+    elapsed = time.perf_counter() - start
+    print('%d levels of %dx%d in %.2f s: %.1f levels/s' % (len(args.seeds), game.MAP_WIDTH, game.MAP_HEIGHT, elapsed,
+                                                          len(args.seeds) / elapsed))
+
+
+def benchmark_caves(args):
+    # time to make a level of caves against a level of rooms, for a few map sizes
+    print('%-10s %12s %12s' % ('map', 'rooms (ms)', 'caves (ms)'))
+    cave_chance = game.CAVE_CHANCE
+    for size in args.sizes:
+        (game.MAP_WIDTH, game.MAP_HEIGHT) = (int(n) for n in size.split('x'))
+        game.new_game(0)
+        times = []
+        for chance in (0, 100):
+            game.CAVE_CHANCE = [[chance, 1]]
+            start = time.perf_counter()
+            for seed in args.seeds:
+                game.seed_game(seed)
+                game.make_map()
+            times.append((time.perf_counter() - start) / len(args.seeds))
+        print('%-10s %12.2f %12.2f' % (size, times[0] * 1000, times[1] * 1000))
+    game.CAVE_CHANCE = cave_chance
+
+
+def benchmark_rooms(args):
+    # time to place and connect the rooms of a level, and to make the whole level, for growing map
+    # sizes. the time per room should stay about the same as the rooms get more numerous
+    print('%-10s %8s %8s %12s %12s %12s %14s' % ('map', 'rooms', 'links', 'place (ms)', 'connect (ms)', 'level (ms)',
+                                                 'per room (us)'))
+    cave_chance = game.CAVE_CHANCE
+    game.CAVE_CHANCE = [[0, 1]]
+    for size in args.sizes:
+        (game.MAP_WIDTH, game.MAP_HEIGHT) = (int(n) for n in size.split('x'))
+        game.new_game(0)
+        attempts = max(game.MAX_ROOMS, game.MAX_ROOMS * game.MAP_WIDTH * game.MAP_HEIGHT // (80 * 43))
+        (rooms, links, place, connect, level) = (0, 0, 0, 0, 0)
+        for seed in args.seeds:
+            game.seed_game(seed)
+            start = time.perf_counter()
+            (placed, bins) = place_rooms(game.MAP_WIDTH, game.MAP_HEIGHT, attempts, game.ROOM_MIN_SIZE,
+                                         game.ROOM_MAX_SIZE, game.rng)
+            middle = time.perf_counter()
+            linked = connect_rooms(placed, bins, game.rng)
+            place += middle - start
+            connect += time.perf_counter() - middle
+            (rooms, links) = (rooms + len(placed), links + len(linked))
+
+            game.seed_game(seed)
+            start = time.perf_counter()
+            game.make_map()
+            level += time.perf_counter() - start
+        n = len(args.seeds)
+        print('%-10s %8d %8d %12.2f %12.2f %12.2f %14.1f' % (size, rooms / n, links / n, place / n * 1000,
+                                                             connect / n * 1000, level / n * 1000, level / rooms * 1e6))
+    game.CAVE_CHANCE = cave_chance
+
+
+def benchmark_routes(args):
+    # time to find the way between random floor tiles of a level, by a flood over the whole map
+    # against a route over the route graph (the first routes through a part of the level measure
+    # its clusters, the next ones reuse them), and how much longer the routes are
+    print('%-10s %12s %12s %12s %12s %8s' % ('map', 'graph (ms)', 'flood (ms)', 'first (ms)', 'again (ms)', 'length'))
+    cave_chance = game.CAVE_CHANCE
+    game.CAVE_CHANCE = [[args.caves, 1]]
+    random.seed(0)
+    for size in args.sizes:
+        (game.MAP_WIDTH, game.MAP_HEIGHT) = (int(n) for n in size.split('x'))
+        game.new_game(0)
+        (build, flood, first, again, found, shortest) = (0, 0, 0, 0, 0, 0)
+        for seed in args.seeds:
+            game.seed_game(seed)
+            game.make_map()
+            walkable = ~game.map.blocked
+            floor = list(zip(*walkable.nonzero()))
+            pairs = [random.sample(floor, 2) for _ in range(args.routes)]
+
+            start = time.perf_counter()
+            graph = RouteGraph(walkable)
+            build += time.perf_counter() - start
+            for ((x, y), (goal_x, goal_y)) in pairs:
+                start = time.perf_counter()
+                steps = distance_map(walkable, [(goal_x, goal_y)])[x, y]
+                flood += time.perf_counter() - start
+                start = time.perf_counter()
+                route = graph.route(x, y, goal_x, goal_y)
+                first += time.perf_counter() - start
+                if steps < UNREACHABLE:
+                    # the length of the route: the steps between its tiles, all inside one cluster
+                    for (x1, y1) in route:
+                        cluster = graph.cluster(x1, y1)
+                        (cx, cy, _, _) = graph.bounds(cluster)
+                        if graph.cluster(x, y) == cluster:
+                            found += graph.local_distance(cluster, x1, y1)[x - cx, y - cy]
+                        else:
+                            found += 1
+                        (x, y) = (x1, y1)
+                    shortest += steps
+            start = time.perf_counter()
+            for ((x, y), (goal_x, goal_y)) in pairs:
+                graph.route(x, y, goal_x, goal_y)
+            again += time.perf_counter() - start
+        n = len(args.seeds)
+        routes = n * args.routes
+        print('%-10s %12.2f %12.2f %12.2f %12.2f %8.3f' % (size, build / n * 1000, flood / routes * 1000,
+                                                           first / routes * 1000, again / routes * 1000,
+                                                           found / max(shortest, 1)))
+    game.CAVE_CHANCE = cave_chance
+
+
+def benchmark_explore(args):
+    # explore a level per seed with auto-explore, then travel to the stairs, the way the 'x' and 's'
+    # keys do (with no monsters, so only the items that come into view stop the runs). a run draws
+    # nothing until it stops, so it should take well under a second however many turns it lasts
+    print('%-10s %8s %8s %12s %16s %14s %10s' % ('map', 'turns', 'runs', 'run (ms)', 'longest (turns)',
+                                                'longest (ms)', 'turns/s'))
+    max_monsters = game.MAX_MONSTERS
+    game.MAX_MONSTERS = [[0, 1]]
+    for size in args.sizes:
+        (game.MAP_WIDTH, game.MAP_HEIGHT) = (int(n) for n in size.split('x'))
+        (turns, runs, elapsed, longest, longest_time) = (0, 0, 0, 0, 0)
+        for seed in args.seeds:
+            game.new_game(seed)
+            game.update_fov()
+            for steps in (game.explore_steps, game.stairs_steps):
+                while True:
+                    start = time.perf_counter()
+                    taken = game.run(steps())
+                    seconds = time.perf_counter() - start
+                    if not taken:
+                        break
+                    (turns, runs, elapsed) = (turns + taken, runs + 1, elapsed + seconds)
+                    if seconds > longest_time:
+                        (longest, longest_time) = (taken, seconds)
+        n = len(args.seeds)
+        print('%-10s %8d %8d %12.2f %16d %14.2f %10.0f' % (size, turns / n, runs / n, elapsed / max(runs, 1) * 1000,
+                                                          longest, longest_time * 1000, turns / max(elapsed, 1e-9)))
+    game.MAX_MONSTERS = max_monsters
+
+
+def time_stairs(levels):
+    # average time taken by next_level. with a level generator, it gets the time a player would
+    # spend on each level to make the next one
+    game.new_game(0)
+    total = 0
+    for _ in range(levels):
+        if game.level_generator is not None:
+            game.level_generator.pending[1].result()
+        start = time.perf_counter()
+        game.next_level()
+        total += time.perf_counter() - start
+    return total / levels
+
+
+def benchmark_stairs(args):
+    # how long the player waits on the stairs, with the next level generated then or in the background
+    game.MAP_WIDTH = args.width
+    game.MAP_HEIGHT = args.height
+    print('map %dx%d, %d levels' % (args.width, args.height, args.levels))
+    print('synchronous:  %8.2f ms' % (time_stairs(args.levels) * 1000))
+    game.level_generator = LevelGenerator(game.generate_level)
+    try:
+        print('pre-generated: %7.2f ms' % (time_stairs(args.levels) * 1000))
+    finally:
+        game.level_generator.shutdown()
+        game.level_generator = None
+
+
+def paint_tiles_per_call(visible, dirty):
+    # how render_all used to paint the map: a libtcod call per tile (of the view)
+    (dirty_x, dirty_y) = game.np.nonzero(dirty)
+    painted = 0
+    for (x, y) in zip(dirty_x.tolist(), dirty_y.tolist()):
+        wall = game.map.block_sight[x + game.camera_x, y + game.camera_y]
+        if visible[x, y]:
+            color = game.color_light_wall if wall else game.color_light_ground
+        elif game.map.explored[x + game.camera_x, y + game.camera_y]:
+            color = game.color_dark_wall if wall else game.color_dark_ground
+        else:
+            continue
+        game.libtcod.console_set_char_background(game.con, x, y, color, game.libtcod.BKGND_SET)
+        painted += 1
+    return painted
+
+
+def time_frames(frames, full):
+    # average time of render_all, and of tiles it repainted, with the player walking through the rooms.
+    # with full, every tile in view is repainted each frame, like the first frame on a level or when the view scrolls
+    walker = random.Random(0)
+    (total, tiles) = (0, 0)
+    for _ in range(frames):
+        game.player.move(walker.randint(-1, 1), walker.randint(-1, 1))
+        game.fov_recompute = True
+        if full:
+            game.camera_x = None
+        start = time.perf_counter()
+        game.render_all()
+        total += time.perf_counter() - start
+        tiles += game.tiles_repainted
+    return (total / frames, tiles / frames)
+
+
+def benchmark_render(args):
+    # frame time of render_all with the map painted tile by tile (before) and all at once (after).
+    # only the view is painted, so it should be about the same whatever the size of the map. tiles is
+    # the tiles repainted per frame: only the ones that look different, unless the whole view is repainted
+    print('%-10s %-8s %8s %12s %12s' % ('map', 'frames', 'tiles', 'before (ms)', 'after (ms)'))
+    paint_tiles = game.paint_tiles
+    game.mouse = game.libtcod.Mouse()  # (render_all shows what's under it)
+    for size in args.sizes:
+        (width, height) = (int(n) for n in size.split('x'))
+        game.MAP_WIDTH = width
+        game.MAP_HEIGHT = height
+        for full in (False, True):
+            times = []
+            for painter in (paint_tiles_per_call, paint_tiles):
+                game.paint_tiles = painter
+                game.new_game(0)
+                game.map.explored[:] = True  # (so there's something to paint outside the FOV too)
+                (seconds, tiles) = time_frames(args.frames, full)
+                times.append(seconds)
+            print('%-10s %-8s %8.0f %12.3f %12.3f' % (size, 'full' if full else 'walking', tiles, times[0] * 1000,
+                                                     times[1] * 1000))
+    game.paint_tiles = paint_tiles
+
+
+def benchmark_entities(args):
+    # memory taken by each monster, and the time to render and to play the monsters' turns with
+    # lots of them on the map (one big room, so they are all in reach)
+    game.MAP_WIDTH = args.width
+    game.MAP_HEIGHT = args.height
+    game.mouse = game.libtcod.Mouse()
+    game.new_game(0)
+    game.map.carve(1, 1, args.width - 1, args.height - 1)
+    game.initialize_fov()
+
+    tiles = [(x, y) for x in range(1, args.width - 1) for y in range(1, args.height - 1)
+             if (x, y) != (game.player.x, game.player.y)]
+    tiles = random.Random(0).sample(tiles, args.count)
+    tracemalloc.start()
+    monsters = [game.create_orc(x, y) for (x, y) in tiles]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for monster in monsters:
+        game.objects.append(monster)
+        game.object_index.add(monster)
+    print('%d monsters on a %dx%d map: %.0f bytes each' % (args.count, args.width, args.height, size / args.count))
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        game.fov_recompute = True
+        game.render_all()
+    print('render_all:          %8.2f ms' % ((time.perf_counter() - start) / args.frames * 1000))
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        game.monsters_take_turns()
+    print('monsters_take_turns: %8.2f ms' % ((time.perf_counter() - start) / args.frames * 1000))
+
+
+def main():
+    # libtcodpy warns about itself and its color constants, which would drown the results
+    warnings.simplefilter('ignore', DeprecationWarning)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    parser = argparse.ArgumentParser(description='Benchmarks for the roguelike, run without opening a window.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    save = commands.add_parser('save', help='save file size and save/load time, against shelve')
+    save.add_argument('--width', type=int, default=game.MAP_WIDTH)
+    save.add_argument('--height', type=int, default=game.MAP_HEIGHT)
+    save.add_argument('--turns', type=int, default=200, help='turns to play before saving')
+    save.add_argument('--repeat', type=int, default=20)
+    save.add_argument('--seed', type=int, default=0)
+    save.set_defaults(run=benchmark_save)
+
+    turns = commands.add_parser('turns', help='turns per second of headless games played by a bot')
+    turns.add_argument('--seeds', type=seed_range, default=seed_range('0-9'), help='a seed, or a range like 0-9')
+    turns.add_argument('--turns', type=int, default=1000, help='maximum turns per game')
+    turns.add_argument('--verbose', action='store_true', help='print how each game went')
+    turns.add_argument('--profile', metavar='FILE', help='write the time of each phase of each turn (.csv or JSON)')
+    turns.set_defaults(run=benchmark_turns)
+
+    replays = commands.add_parser('replays', help='turns per second replaying recorded games, checking they end the same')
+    replays.add_argument('--directory', default=game.REPLAYS_DIRECTORY, help='where the replays are')
+    replays.add_argument('--profile', metavar='FILE', help='write the time of each phase of each turn (.csv or JSON)')
+    replays.set_defaults(run=benchmark_replays)
+
+    levels = commands.add_parser('levels', help='levels generated per second')
+    levels.add_argument('--seeds', type=seed_range, default=seed_range('0-99'), help='a seed, or a range like 0-99')
+    levels.add_argument('--width', type=int, default=game.MAP_WIDTH)
+    levels.add_argument('--height', type=int, default=game.MAP_HEIGHT)
+    levels.set_defaults(run=benchmark_levels)
+
+    caves = commands.add_parser('caves', help='time taken to make a level of caves, against a level of rooms')
+    caves.add_argument('--seeds', type=seed_range, default=seed_range('0-19'), help='a seed, or a range like 0-19')
+    caves.add_argument('--sizes', nargs='+', default=['80x43', '200x200', '400x400'], help='map sizes, like 80x43')
+    caves.set_defaults(run=benchmark_caves)
+
+    rooms = commands.add_parser('rooms', help='time taken to place and connect rooms, for growing map sizes')
+    rooms.add_argument('--seeds', type=seed_range, default=seed_range('0-4'), help='a seed, or a range like 0-4')
+    rooms.add_argument('--sizes', nargs='+', default=['80x43', '200x200', '400x400', '800x800'],
+                       help='map sizes, like 80x43')
+    rooms.set_defaults(run=benchmark_rooms)
+
+    routes = commands.add_parser('routes', help='time taken to find the way across a level, flood against route graph')
+    routes.add_argument('--seeds', type=seed_range, default=seed_range('0-4'), help='a seed, or a range like 0-4')
+    routes.add_argument('--sizes', nargs='+', default=['80x43', '200x200', '400x400', '800x800'],
+                        help='map sizes, like 80x43')
+    routes.add_argument('--routes', type=int, default=20, help='routes per level')
+    routes.add_argument('--caves', type=int, default=0, help='chance (%%) that a level is caves')
+    routes.set_defaults(run=benchmark_routes)
+
+    explore = commands.add_parser('explore', help='time taken by auto-explore and travel to the stairs, for map sizes')
+    explore.add_argument('--seeds', type=seed_range, default=seed_range('0-4'), help='a seed, or a range like 0-4')
+    explore.add_argument('--sizes', nargs='+', default=['80x43', '200x200'], help='map sizes, like 80x43')
+    explore.set_defaults(run=benchmark_explore)
+
+    stairs = commands.add_parser('stairs', help='time taken by taking the stairs, with and without pre-generation')
+    stairs.add_argument('--levels', type=int, default=20)
+    stairs.add_argument('--width', type=int, default=game.MAP_WIDTH)
+    stairs.add_argument('--height', type=int, default=game.MAP_HEIGHT)
+    stairs.set_defaults(run=benchmark_stairs)
+
+    render = commands.add_parser('render', help='frame time, painting the map tile by tile or all at once')
+    render.add_argument('--sizes', nargs='+', default=['80x43', '400x300', '1000x1000'], help='map sizes, like 80x43')
+    render.add_argument('--frames', type=int, default=100)
+    render.set_defaults(run=benchmark_render)
+
+    entities = commands.add_parser('entities', help='memory per monster, and frame and turn time with many of them')
+    entities.add_argument('--count', type=int, default=20000)
+    entities.add_argument('--width', type=int, default=400)
+    entities.add_argument('--height', type=int, default=300)
+    entities.add_argument('--frames', type=int, default=10)
+    entities.set_defaults(run=benchmark_entities)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
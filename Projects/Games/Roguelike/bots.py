@@ -0,0 +1,153 @@
+import random
+
+import libtcodpy as libtcod
+
+import game
+from pathfinding import distance_map, step_downhill
+
+# the key that moves the player in each direction
+MOVE_KEYS = {
+    (0, -1): libtcod.KEY_UP, (0, 1): libtcod.KEY_DOWN, (-1, 0): libtcod.KEY_LEFT, (1, 0): libtcod.KEY_RIGHT,
+    (-1, -1): libtcod.KEY_HOME, (1, -1): libtcod.KEY_PAGEUP, (-1, 1): libtcod.KEY_END, (1, 1): libtcod.KEY_PAGEDOWN,
+}
+
+# names scripts can use for the keys that aren't characters
+KEY_NAMES = {
+    'up': libtcod.KEY_UP, 'down': libtcod.KEY_DOWN, 'left': libtcod.KEY_LEFT, 'right': libtcod.KEY_RIGHT,
+    'home': libtcod.KEY_HOME, 'pageup': libtcod.KEY_PAGEUP, 'end': libtcod.KEY_END, 'pagedown': libtcod.KEY_PAGEDOWN,
+    'wait': libtcod.KEY_KP5, 'escape': libtcod.KEY_ESCAPE,
+}
+
+
+def make_key(name):
+    # build the libtcod key event for a key name, or a single character
+    key = libtcod.Key()
+    if name in KEY_NAMES:
+        key.vk = KEY_NAMES[name]
+    else:
+        key.vk = libtcod.KEY_CHAR
+        key.c = ord(name)
+    return key
+
+
+def move_key(dx, dy):
+    key = libtcod.Key()
+    key.vk = MOVE_KEYS[(dx, dy)]
+    return key
+
+
+class ScriptedController:
+    # plays a fixed list of keys (names from KEY_NAMES, or characters), answering menus and
+    # targeting with the next entry of "choices" and "targets". exits once the keys run out.
+    def __init__(self, keys, choices=(), targets=()):
+        self.keys = iter(keys)
+        self.choices = iter(choices)
+        self.targets = iter(targets)
+
+    def next_key(self):
+        return make_key(next(self.keys, 'escape'))
+
+    def choose(self, header, options):
+        return next(self.choices, None)
+
+    def choose_target(self, max_range):
+        return next(self.targets, (None, None))
+
+
+class RandomWalker:
+    # a simple bot: walks in random directions, attacks monsters next to it, picks up whatever it
+    # steps on, takes the stairs, drinks potions when hurt and reads scrolls at monsters it can
+    # see. it has its own random generator, so with the game's seed it always plays the same game.
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+        self.choice = None  # the inventory item to pick in the next menu
+
+    def next_key(self):
+        player = game.player
+        if (game.stairs.x, game.stairs.y) == (player.x, player.y):
+            return make_key('<')
+        for obj in game.object_index.at(player.x, player.y):
+            if obj.item and len(game.inventory) < 26:
+                return make_key('g')
+
+        usable = [i for (i, obj) in enumerate(game.inventory) if obj.item.use_function is not None]
+        if player.fighter.hp < player.fighter.max_hp // 2:
+            potions = [i for i in usable if game.inventory[i].item.use_function is game.cast_heal]
+            if potions:
+                self.choice = potions[0]
+                return make_key('i')
+        scrolls = [i for i in usable if game.inventory[i].item.use_function is not game.cast_heal]
+        if scrolls and game.closest_monster(game.TORCH_RADIUS) is not None and self.random.random() < 0.2:
+            self.choice = self.random.choice(scrolls)
+            return make_key('i')
+
+        # fight back against a monster next to it, otherwise wander
+        for (dx, dy) in MOVE_KEYS:
+            for obj in game.object_index.at(player.x + dx, player.y + dy):
+                if obj.fighter and obj.ai:
+                    return move_key(dx, dy)
+        return self.wander_key()
+
+    def wander_key(self):
+        # the key to press when there's nothing else to do
+        return move_key(*self.wander())
+
+    def wander(self):
+        # the step to take when there's nothing else to do
+        return self.random.choice(list(MOVE_KEYS))
+
+    def choose(self, header, options):
+        if self.choice is not None:  # an item to use, chosen along with the key
+            choice = self.choice
+            self.choice = None
+            return choice
+        if header.startswith('Level up!'):
+            return self.random.randrange(len(options))
+        return None  # close any other menu
+
+    def choose_target(self, max_range):
+        # aim at the closest monster in range (fireballs may hit the bot itself, it doesn't care)
+        monster = game.closest_monster(max_range if max_range is not None else game.TORCH_RADIUS)
+        if monster is None:
+            return (None, None)
+        return (monster.x, monster.y)
+
+
+class Delver(RandomWalker):
+    # plays like RandomWalker, but instead of wandering it heads straight for the stairs down (it knows
+    # where they are, explored or not). it goes deep quickly, so it meets every kind of monster and
+    # item, which is what balance runs need
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.stairs_distance = None
+        self.stairs_key = None
+
+    def wander(self):
+        player = game.player
+        key = (game.dungeon_level, game.stairs.x, game.stairs.y, game.map.version)
+        if key != self.stairs_key:
+            self.stairs_distance = distance_map(~game.map.blocked, [(game.stairs.x, game.stairs.y)])
+            self.stairs_key = key
+        step = step_downhill(self.stairs_distance, player.x, player.y, lambda x, y: not game.is_blocked(x, y))
+        if step is None:  # (something stands in the way)
+            return super().wander()
+        return step
+
+
+class Explorer(RandomWalker):
+    # plays like RandomWalker, but instead of wandering it explores the level with the auto-explore
+    # command, and travels to the stairs down when that doesn't get it anywhere (the level is all
+    # explored). it only wanders when neither command takes a turn, like with monsters in view
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.state = None  # the level and turn the commands left to try are for
+        self.commands = []
+
+    def wander_key(self):
+        state = (game.dungeon_level, game.turn)
+        if state != self.state:  # (the last command went somewhere, start again with exploring)
+            self.state = state
+            self.commands = ['x', 's']
+        if self.commands:
+            return make_key(self.commands.pop(0))
+        return super().wander_key()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from pathfinding import UNREACHABLE, distance_map
+
+CAVE_FILL = 0.45  # the share of wall tiles in the noise the caves grow from
+CAVE_STEPS = 4  # smoothing steps
+CAVE_TRIES = 20  # tiles a cave search starts from, at most
+
+
+def neighbour_walls(walls):
+    # the number of walls among the 8 neighbours of every tile, all at once: the sum of the map shifted
+    # in each direction. outside the map counts as wall
+    padded = np.pad(walls, 1, constant_values=True).astype(np.uint8)
+    (width, height) = walls.shape
+    count = np.zeros((width, height), dtype=np.uint8)
+    for dx in (0, 1, 2):
+        for dy in (0, 1, 2):
+            if (dx, dy) != (1, 1):
+                count += padded[dx:dx + width, dy:dy + height]
+    return count
+
+
+def cave_walls(width, height, random, fill=CAVE_FILL, steps=CAVE_STEPS):
+    # the walls (a boolean array indexed [x, y]) of caves grown by a cellular automaton: random noise,
+    # smoothed by turning every tile with 5 or more walls around it into a wall, and every one with 3
+    # or less into floor. random is a numpy random generator. the border is always wall
+    walls = random.random((width, height)) < fill
+    for _ in range(steps):
+        count = neighbour_walls(walls)
+        walls = (count >= 5) | (walls & (count == 4))
+    walls[0, :] = walls[-1, :] = True
+    walls[:, 0] = walls[:, -1] = True
+    return walls
+
+
+def main_cave(floor, random, tries=CAVE_TRIES):
+    # the biggest cave (connected floor) among the ones reached from a few random floor tiles: the
+    # tile it was reached from, and the distance map from there (UNREACHABLE outside the cave).
+    # it stops as soon as a cave has more than half the floor, since no other can be bigger.
+    # None if there's no floor at all
+    (floor_x, floor_y) = np.nonzero(floor)
+    total = len(floor_x)
+    seen = np.zeros(floor.shape, dtype=bool)
+    best = None
+    for i in random.permutation(total)[:tries].tolist():
+        (x, y) = (int(floor_x[i]), int(floor_y[i]))
+        if seen[x, y]:
+            continue  # (in a cave already measured)
+        distance = distance_map(floor, [(x, y)])
+        reached = distance < UNREACHABLE
+        seen |= reached
+        size = np.count_nonzero(reached)
+        if best is None or size > best[0]:
+            best = (size, (x, y), distance)
+        if size * 2 > total:
+            break
+    if best is None:
+        return None
+    return best[1:]
@@ -0,0 +1,5 @@
+def pytest_configure(config):
+    # libtcodpy warns about itself, its color constants, and functions it may deprecate on every
+    # call: thousands of warnings that would hide any other
+    for category in ('DeprecationWarning', 'PendingDeprecationWarning', 'FutureWarning'):
+        config.addinivalue_line('filterwarnings', 'ignore::' + category)
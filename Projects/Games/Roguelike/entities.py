@@ -0,0 +1,44 @@
+# render layers, bottom to top: what's on a higher layer is drawn over what's on a lower one
+LAYER_STAIRS = 0
+LAYER_CORPSE = 1
+LAYER_ITEM = 2
+LAYER_ACTOR = 3
+LAYERS = 4
+
+
+class EntityStore:
+    # the objects on a level, kept by render layer. each layer is a dict used as an ordered set, so
+    # adding and removing an object, or moving it to another layer, don't shift a list around.
+    # iterating goes through the layers from the bottom up, in drawing order. it has the methods
+    # of a list the game used (append, remove, iterating...), so it can stand in for one.
+    def __init__(self, objects=()):
+        self.layers = [{} for _ in range(LAYERS)]
+        for obj in objects:
+            self.append(obj)
+
+    def append(self, obj):
+        # add an object on top of the others of its layer
+        self.layers[obj.layer][obj] = None
+
+    def remove(self, obj):
+        del self.layers[obj.layer][obj]
+
+    def set_layer(self, obj, layer):
+        # move an object to another layer, on top of the objects already there
+        del self.layers[obj.layer][obj]
+        obj.layer = layer
+        self.layers[layer][obj] = None
+
+    def layer(self, layer):
+        # the objects of one layer (the monsters are all on LAYER_ACTOR, with the player)
+        return self.layers[layer].keys()
+
+    def __iter__(self):
+        for layer in self.layers:
+            yield from layer
+
+    def __len__(self):
+        return sum(len(layer) for layer in self.layers)
+
+    def __contains__(self, obj):
+        return obj in self.layers[obj.layer]
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# use this as FOV_ALGO to pick the built-in shadowcasting instead of one of libtcod's algorithms
+FOV_SHADOWCAST = -1
+
+# multipliers that transform the coordinates of the first octant into each of the 8 octants
+OCTANTS = [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]
+
+
+def shadowcast(transparent, x, y, radius, light_walls=True):
+    # recursive shadowcasting. takes a boolean array of transparent tiles, indexed [x, y],
+    # and returns a boolean array (same shape) of the tiles visible from (x, y).
+    # a radius of 0 means there is no limit, like in libtcod.
+    (width, height) = transparent.shape
+    if radius <= 0:
+        radius = max(width, height)
+
+    # plain lists are a lot faster than numpy for one tile at a time
+    see_through = transparent.tolist()
+    visible = np.zeros((width, height), dtype=bool)
+    visible[x, y] = True
+
+    lit = []
+    for (xx, xy, yx, yy) in OCTANTS:
+        cast_light(see_through, width, height, x, y, 1, 1.0, 0.0, radius, xx, xy, yx, yy, light_walls, lit)
+
+    if lit:
+        (lit_x, lit_y) = zip(*lit)
+        visible[list(lit_x), list(lit_y)] = True
+    return visible
+
+
+def cast_light(see_through, width, height, cx, cy, row, start, end, radius, xx, xy, yx, yy, light_walls, lit):
+    # light one octant, row by row, starting from "row". start and end are the slopes
+    # that bound the part of the octant that is still unshadowed.
+    if start < end:
+        return
+    radius_squared = radius * radius
+    new_start = start
+    for j in range(row, radius + 1):
+        dx = -j - 1
+        dy = -j
+        blocked = False
+        while dx <= 0:
+            dx += 1
+            # translate the relative coordinates into map coordinates
+            map_x = cx + dx * xx + dy * xy
+            map_y = cy + dx * yx + dy * yy
+            # slopes of the left and right edges of this tile
+            left_slope = (dx - 0.5) / (dy + 0.5)
+            right_slope = (dx + 0.5) / (dy - 0.5)
+            if start < right_slope:
+                continue
+            elif end > left_slope:
+                break
+
+            # tiles outside the map are treated as walls that can't be seen
+            inside = 0 <= map_x < width and 0 <= map_y < height
+            opaque = not inside or not see_through[map_x][map_y]
+
+            # the tile is in the light cone, light it if it's in range
+            if inside and dx * dx + dy * dy <= radius_squared and (light_walls or not opaque):
+                lit.append((map_x, map_y))
+
+            if blocked:
+                # we're scanning a row of blocked tiles
+                if opaque:
+                    new_start = right_slope
+                    continue
+                else:
+                    blocked = False
+                    start = new_start
+            elif opaque and j < radius:
+                # this is a blocking tile, start a child scan for the part before it
+                blocked = True
+                cast_light(see_through, width, height, cx, cy, j + 1, start, left_slope, radius,
+                           xx, xy, yx, yy, light_walls, lit)
+                new_start = right_slope
+        # the row ended on a blocked tile, so nothing further out is lit
+        if blocked:
+            break
+
+
+class FovCache:
+    # remembers the most recent FOV results, keyed by (x, y, radius, algorithm, light walls, map version), so
+    # stepping back onto a tile doesn't mean computing its FOV again. results are shared,
+    # so they are made read-only.
+    def __init__(self, size=64):
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        # return the cached result for this key, or call compute() and cache what it returns
+        visible = self.results.get(key)
+        if visible is not None:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return visible
+
+        self.misses += 1
+        visible = compute()
+        visible.flags.writeable = False
+        self.results[key] = visible
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)  # forget the least recently used result
+        return visible
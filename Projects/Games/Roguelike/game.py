@@ -1,14 +1,39 @@
+import argparse
+import hashlib
+import itertools
 import math
-import shelve
-import textwrap
+from collections import Counter
+import os
+import sys
+import time
 
 import libtcodpy as libtcod
+import numpy as np
+
+from autosave import Autosaver
+from caves import cave_walls, main_cave
+from entities import LAYER_ACTOR, LAYER_CORPSE, LAYER_ITEM, LAYER_STAIRS, LAYERS, EntityStore
+from fov import FOV_SHADOWCAST, FovCache, shadowcast
+from levelgen import LevelGenerator
+from levelstore import LevelStore
+from messagelog import MessageLog
+from pathfinding import UNREACHABLE, distance_map, step_downhill
+from profiler import PERCENTILES, FrameProfiler
+from replay import Recorder, ReplayController, ReplayError, read_replay
+from rooms import Rect, connect_rooms, place_rooms
+from routes import RouteGraph
+from savefile import (ALWAYS_VISIBLE, BLOCKS, CARRIED, EQUIPPED, HAS_EQUIPMENT, HAS_FIGHTER, HAS_ITEM, IN_INVENTORY,
+                      EntityRecord, encode, read_save)
+from scheduler import ACTION_COST, NORMAL_SPEED, TurnScheduler
+from spawn import SpawnTable, from_level
+from spatial import SpatialIndex
+from tilemap import TileMap
 
 # actual size of the window
 SCREEN_WIDTH = 80
 SCREEN_HEIGHT = 50
 
-# size of the map
+# size of the map (it can be a lot bigger than the screen, which scrolls to follow the player)
 MAP_WIDTH = 80
 MAP_HEIGHT = 43
 
@@ -16,6 +41,8 @@ MAP_HEIGHT = 43
 BAR_WIDTH = 20
 PANEL_HEIGHT = 7
 PANEL_Y = SCREEN_HEIGHT - PANEL_HEIGHT
+VIEW_WIDTH = SCREEN_WIDTH  # the part of the map on screen, above the panel
+VIEW_HEIGHT = PANEL_Y
 MSG_X = BAR_WIDTH + 2
 MSG_WIDTH = SCREEN_WIDTH - BAR_WIDTH - 2
 MSG_HEIGHT = PANEL_HEIGHT - 1
@@ -27,6 +54,8 @@ LEVEL_SCREEN_WIDTH = 40
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
 MAX_ROOMS = 30
+CAVE_CHANCE = [[0, 1], [25, 3]]  # chance (%) that a level is a cave instead of rooms, from each dungeon level on
+CAVE_AREA = 14  # caves get monsters and items square by square: squares this big get about as many as rooms
 
 # spell values
 HEAL_AMOUNT = 40
@@ -37,17 +66,31 @@ CONFUSE_NUM_TURNS = 10
 FIREBALL_RADIUS = 3
 FIREBALL_DAMAGE = 25
 
+# monster activity: only monsters this close to the player, or alerted ones, take turns
+ACTIVATION_RADIUS = 15
+ALERT_TURNS = 20
+# monsters chasing the player find their way within this many tiles of them by the tiles around the
+# player. farther, they follow a route across the level (see routes.py)
+CHASE_RADIUS = 20
+
 # experience and level-ups
 LEVEL_UP_BASE = 200
 LEVEL_UP_FACTOR = 150
 
 
-FOV_ALGO = 0  # default FOV algorithm
+FOV_ALGO = 0  # default FOV algorithm (FOV_SHADOWCAST for the built-in one)
 FOV_LIGHT_WALLS = True  # light walls or not
 TORCH_RADIUS = 10
 
 LIMIT_FPS = 20  # 20 frames-per-second maximum
 
+SAVE_FILE = 'savegame.sav'
+AUTOSAVE_INTERVAL = 50  # turns between autosaves
+LEVEL_SEED_MAX = 0x7fffffff  # every level is generated from its own seed, up to this
+LEVELS_DIRECTORY = 'levels'  # where the levels the player left are kept (a directory per game), next to the save
+HISTORY_FILE = 'messages.log'  # every message of the game, for the message history
+REPLAYS_DIRECTORY = 'replays'  # a recording of every new game played, to play it again
+
 
 color_dark_wall = libtcod.Color(0, 0, 100)
 color_light_wall = libtcod.Color(130, 110, 50)
@@ -55,43 +98,20 @@ color_dark_ground = libtcod.Color(50, 50, 150)
 color_light_ground = libtcod.Color(200, 180, 50)
 
 
-class Tile:
-    # a tile of the map and its properties
-    def __init__(self, blocked, block_sight=None):
-        self.blocked = blocked
-
-        # all tiles start unexplored
-        self.explored = False
-
-        # by default, if a tile is blocked, it also blocks sight
-        if block_sight is None:
-            block_sight = blocked
-        self.block_sight = block_sight
-
-
-class Rect:
-    # a rectangle on the map. used to characterize a room.
-    def __init__(self, x, y, w, h):
-        self.x1 = x
-        self.y1 = y
-        self.x2 = x + w
-        self.y2 = y + h
-
-    def center(self):
-        center_x = (self.x1 + self.x2) // 2
-        center_y = (self.y1 + self.y2) // 2
-        return (center_x, center_y)
-
-    def intersect(self, other):
-        # returns true if this rectangle intersects with another one
-        return (self.x1 <= other.x2 and self.x2 >= other.x1 and
-                self.y1 <= other.y2 and self.y2 >= other.y1)
+# every object gets a different uid, so saves can tell which objects changed since the last one
+object_ids = itertools.count(1)
 
 
 class Object:
     # this is a generic object: the player, a monster, an item, the stairs...
-    # it's always represented by a character on screen.
-    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None, equipment=None):
+    # it's always represented by a character on screen. (objects and their components have slots
+    # instead of a dict each, so a level can hold lots of them)
+    __slots__ = ('uid', 'x', 'y', 'char', 'name', 'color', 'blocks', 'always_visible', 'layer', 'speed', 'energy',
+                 'fighter', 'ai', 'item', 'equipment', 'level', 'record')
+
+    def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None, equipment=None,
+                 speed=NORMAL_SPEED, layer=None):
+        self.uid = next(object_ids)
         self.x = x
         self.y = y
         self.char = char
@@ -99,6 +119,12 @@ class Object:
         self.color = color
         self.blocks = blocks
         self.always_visible = always_visible
+        if layer is None:  # items are drawn below the monsters (and the player)
+            layer = LAYER_ITEM if item or equipment else LAYER_ACTOR
+        self.layer = layer
+        self.speed = speed  # energy gained per tick; the turn scheduler lets it act once it has enough
+        self.energy = 0
+        self.record = None  # its save record while it's on the map, until it changes (see entity_records)
         self.fighter = fighter
         if self.fighter:  # let the fighter component know who owns it
             self.fighter.owner = self
@@ -122,8 +148,8 @@ class Object:
     def move(self, dx, dy):
         # move by the given amount, if the destination is not blocked
         if not is_blocked(self.x + dx, self.y + dy):
-            self.x += dx
-            self.y += dy
+            object_index.move(self, self.x + dx, self.y + dy)
+            self.changed()
 
     def move_towards(self, target_x, target_y):
         # vector from this object to the target, and distance
@@ -133,10 +159,23 @@ class Object:
 
         # normalize it to length 1 (preserving direction), then round it and
         # convert to integer so the movement is restricted to the map grid
-        dx = int(round(dx // distance))
-        dy = int(round(dy // distance))
+        dx = int(round(dx / distance))
+        dy = int(round(dy / distance))
         self.move(dx, dy)
 
+    def move_along(self, distance, origin=(0, 0)):
+        # take one step down a distance map (towards its goal), going around walls and blocking objects.
+        # the map may only cover part of the level, from origin on
+        step = step_downhill(distance, self.x, self.y, lambda x, y: not is_blocked(x, y), origin)
+        if step is not None:
+            self.move(*step)
+
+    def travel_towards(self, x, y):
+        # take one step on the way to a tile anywhere on the level, following the route graph
+        step = get_route_graph().step(self.x, self.y, x, y, lambda tx, ty: not is_blocked(tx, ty))
+        if step is not None:
+            self.move(*step)
+
     def distance_to(self, other):
         # return the distance to another object
         dx = other.x - self.x
@@ -147,27 +186,39 @@ class Object:
         # return the distance to some coordinates
         return math.sqrt((x - self.x) ** 2 + (y - self.y) ** 2)
 
-    def send_to_back(self):
-        # make this object be drawn first, so all others appear above it if they're in the same tile.
-        global objects
-        objects.remove(self)
-        objects.insert(0, self)
+    def set_layer(self, layer):
+        # draw this object on another layer, on top of the others already there
+        object_index.remove(self)
+        objects.set_layer(self, layer)
+        object_index.add(self)  # (where the layer puts it among the objects on its tile)
+        self.changed()
+
+    def changed(self):
+        # call this when something its save record holds changes: the next save makes the record again
+        self.record = None
 
     def draw(self):
-        # only show if it's visible to the player; or it's set to "always visible" and on an explored tile
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or
-                (self.always_visible and map[self.x][self.y].explored)):
+        # only show if it's in view, and visible to the player; or it's set to "always visible" and on an
+        # explored tile. returns whether it was drawn
+        (x, y) = (self.x - camera_x, self.y - camera_y)  # (where the view shows it)
+        if 0 <= x < VIEW_WIDTH and 0 <= y < VIEW_HEIGHT and (
+                is_in_fov(self.x, self.y) or (self.always_visible and map.explored[self.x, self.y])):
             # set the color and then draw the character that represents this object at its position
             libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
+            libtcod.console_put_char(con, x, y, self.char, libtcod.BKGND_NONE)
+            return True
+        return False
 
     def clear(self):
-        # erase the character that represents this object
-        libtcod.console_put_char(con, self.x, self.y, ' ', libtcod.BKGND_NONE)
+        # erase the character that represents this object (where it was drawn)
+        libtcod.console_put_char(con, self.x - camera_x, self.y - camera_y, ' ', libtcod.BKGND_NONE)
 
 
 class Fighter:
     # combat-related properties and methods (monster, player, NPC).
+    __slots__ = ('base_max_hp', 'hp', 'base_defense', 'base_power', 'xp', 'death_function', 'equipment_slots', 'bonuses',
+                 'owner')
+
     def __init__(self, hp, defense, power, xp, death_function=None):
         self.base_max_hp = hp
         self.hp = hp
@@ -176,20 +227,29 @@ class Fighter:
         self.xp = xp
         self.death_function = death_function
 
+        self.equipment_slots = {}  # the equipment worn in each slot, by slot name
+        self.bonuses = None  # total (power, defense, max_hp) bonuses of that equipment, None if out of date
+
+    def get_bonuses(self):
+        # sum up the bonuses from all equipped items, only when something was equipped or dequipped since last time
+        if self.bonuses is None:
+            equipped = self.equipment_slots.values()
+            self.bonuses = (sum(equipment.power_bonus for equipment in equipped),
+                            sum(equipment.defense_bonus for equipment in equipped),
+                            sum(equipment.max_hp_bonus for equipment in equipped))
+        return self.bonuses
+
     @property
-    def power(self):  # return actual power, by summing up the bonuses from all equipped items
-        bonus = sum(equipment.power_bonus for equipment in get_all_equipped(self.owner))
-        return self.base_power + bonus
+    def power(self):  # return actual power, including the bonuses from all equipped items
+        return self.base_power + self.get_bonuses()[0]
 
     @property
-    def defense(self):  # return actual defense, by summing up the bonuses from all equipped items
-        bonus = sum(equipment.defense_bonus for equipment in get_all_equipped(self.owner))
-        return self.base_defense + bonus
+    def defense(self):  # return actual defense, including the bonuses from all equipped items
+        return self.base_defense + self.get_bonuses()[1]
 
     @property
-    def max_hp(self):  # return actual max_hp, by summing up the bonuses from all equipped items
-        bonus = sum(equipment.max_hp_bonus for equipment in get_all_equipped(self.owner))
-        return self.base_max_hp + bonus
+    def max_hp(self):  # return actual max_hp, including the bonuses from all equipped items
+        return self.base_max_hp + self.get_bonuses()[2]
 
     def attack(self, target):
         # a simple formula for attack damage
@@ -198,17 +258,21 @@ class Fighter:
         if damage > 0:
             # make the target take some damage
             message(self.owner.name.capitalize() + ' attacks ' + target.name + ' for ' + str(damage) + ' hit points.')
-            target.fighter.take_damage(damage)
+            target.fighter.take_damage(damage, self.owner.name)
         else:
             message(self.owner.name.capitalize() + ' attacks ' + target.name + ' but it has no effect!')
 
-    def take_damage(self, damage):
-        # apply damage if possible
+    def take_damage(self, damage, source=None):
+        # apply damage if possible. source is the name of what does it, remembered if it kills the player
+        global killed_by
         if damage > 0:
             self.hp -= damage
+            self.owner.changed()
 
             # check for death. if there's a death function, call it
             if self.hp <= 0:
+                if self.owner is player:
+                    killed_by = source
                 function = self.death_function
                 if function is not None:
                     function(self.owner)
@@ -216,39 +280,82 @@ class Fighter:
                 if self.owner != player:  # yield experience to the player
                     player.fighter.xp += self.xp
 
+            elif self.owner.ai:  # getting hurt wakes monsters up, wherever they are
+                wake_monster(self.owner)
+
     def heal(self, amount):
         # heal by the given amount, without going over the maximum
         self.hp += amount
         if self.hp > self.max_hp:
             self.hp = self.max_hp
+        self.owner.changed()
 
 
 class BasicMonster:
     # AI for a basic monster.
+    __slots__ = ('alert_turns', 'owner')
+
+    def __init__(self):
+        self.alert_turns = 0  # while above 0, the monster keeps hunting the player even out of sight
+
+    @property
+    def alerted(self):
+        return self.alert_turns > 0
+
+    def alert(self):
+        self.alert_turns = ALERT_TURNS
+
     def take_turn(self):
         # a basic monster takes its turn. if you can see it, it can see you
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
+        if is_in_fov(monster.x, monster.y):
+            self.alert()
 
             # move towards player if far away
             if monster.distance_to(player) >= 2:
-                monster.move_towards(player.x, player.y)
+                self.chase()
 
             # close enough, attack! (if the player is still alive.)
             elif player.fighter.hp > 0:
                 monster.fighter.attack(player)
 
+        elif self.alerted:
+            # it lost sight of the player, but keeps tracking them down for a while
+            self.alert_turns -= 1
+            self.chase()
+
+    def chase(self):
+        # a step towards the player: by the tiles around them when it's close enough, or else by
+        # a route across the level
+        monster = self.owner
+        (distance, (x1, y1)) = get_player_distance()
+        (x, y) = (monster.x - x1, monster.y - y1)
+        if 0 <= x < distance.shape[0] and 0 <= y < distance.shape[1] and distance[x, y] < UNREACHABLE:
+            monster.move_along(distance, (x1, y1))
+        else:
+            monster.travel_towards(player.x, player.y)
+
 
 class ConfusedMonster:
     # AI for a temporarily confused monster (reverts to previous AI after a while).
-    def __init__(self, old_ai, num_turns=CONFUSE_NUM_TURNS):
+    __slots__ = ('old_ai', 'num_turns', 'owner')
+
+    def __init__(self, old_ai, num_turns=None):
         self.old_ai = old_ai
-        self.num_turns = num_turns
+        # (CONFUSE_NUM_TURNS is read now rather than as the default, so changing it, like simulate.py does, counts)
+        self.num_turns = CONFUSE_NUM_TURNS if num_turns is None else num_turns
+
+    @property
+    def alerted(self):
+        return True  # stays active while stumbling around, until the old AI takes over again
+
+    def alert(self):
+        self.old_ai.alert()
 
     def take_turn(self):
         if self.num_turns > 0:  # still confused...
             # move in a random direction, and decrease the number of turns confused
-            self.owner.move(libtcod.random_get_int(0, -1, 1), libtcod.random_get_int(0, -1, 1))
+            self.owner.move(libtcod.random_get_int(rng, -1, 1), libtcod.random_get_int(rng, -1, 1))
             self.num_turns -= 1
 
         else:  # restore the previous AI (this one will be deleted because it's not referenced anymore)
@@ -258,6 +365,8 @@ class ConfusedMonster:
 
 class Item:
     # an item that can be picked up and used.
+    __slots__ = ('use_function', 'owner')
+
     def __init__(self, use_function=None):
         self.use_function = use_function
 
@@ -268,6 +377,7 @@ class Item:
         else:
             inventory.append(self.owner)
             objects.remove(self.owner)
+            object_index.remove(self.owner)
             message('You picked up a ' + self.owner.name + '!', libtcod.green)
 
             # special case: automatically equip, if the corresponding equipment slot is unused
@@ -285,6 +395,8 @@ class Item:
         inventory.remove(self.owner)
         self.owner.x = player.x
         self.owner.y = player.y
+        object_index.add(self.owner)
+        self.owner.changed()
         message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
 
     def use(self):
@@ -299,10 +411,13 @@ class Item:
         else:
             if self.use_function() != 'cancelled':
                 inventory.remove(self.owner)  # destroy after use, unless it was cancelled for some reason
+                item_uses[self.owner.name] += 1
 
 
 class Equipment:
     # an object that can be equipped, yielding bonuses. automatically adds the Item component.
+    __slots__ = ('power_bonus', 'defense_bonus', 'max_hp_bonus', 'slot', 'is_equipped', 'wearer', 'owner')
+
     def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0):
         self.power_bonus = power_bonus
         self.defense_bonus = defense_bonus
@@ -310,6 +425,7 @@ class Equipment:
 
         self.slot = slot
         self.is_equipped = False
+        self.wearer = None  # the object (player or monster) that has it equipped
 
     def toggle_equip(self):  # toggle equip/dequip status
         if self.is_equipped:
@@ -317,285 +433,402 @@ class Equipment:
         else:
             self.equip()
 
-    def equip(self):
+    def equip(self, wearer=None):
+        # equip on the player, unless another wearer is given (monsters can carry equipment too)
+        if wearer is None:
+            wearer = player
+
         # if the slot is already being used, dequip whatever is there first
-        old_equipment = get_equipped_in_slot(self.slot)
+        old_equipment = get_equipped_in_slot(self.slot, wearer)
         if old_equipment is not None:
             old_equipment.dequip()
 
-        # equip object and show a message about it
+        # equip object, and let the wearer know its bonuses changed
         self.is_equipped = True
-        message('Equipped ' + self.owner.name + ' on ' + self.slot + '.', libtcod.light_green)
+        self.wearer = wearer
+        wearer.fighter.equipment_slots[self.slot] = self
+        wearer.fighter.bonuses = None
+
+        if wearer == player:  # show a message about it
+            message('Equipped ' + self.owner.name + ' on ' + self.slot + '.', libtcod.light_green)
 
     def dequip(self):
         # dequip object and show a message about it
         if not self.is_equipped:
             return
+        wearer = self.wearer
         self.is_equipped = False
-        message('Dequipped ' + self.owner.name + ' from ' + self.slot + '.', libtcod.light_yellow)
+        self.wearer = None
+        if wearer.fighter:  # (dead monsters don't have a fighter component anymore)
+            del wearer.fighter.equipment_slots[self.slot]
+            wearer.fighter.bonuses = None
+
+        if wearer == player:
+            message('Dequipped ' + self.owner.name + ' from ' + self.slot + '.', libtcod.light_yellow)
 
 
-def get_equipped_in_slot(slot):  # returns the equipment in a slot, or None if it's empty
-    for obj in inventory:
-        if obj.equipment and obj.equipment.slot == slot and obj.equipment.is_equipped:
-            return obj.equipment
-    return None
+def get_equipped_in_slot(slot, wearer=None):  # returns the equipment in a slot (of the player by default), or None if it's empty
+    if wearer is None:
+        wearer = player
+    return wearer.fighter.equipment_slots.get(slot)
 
 
 def get_all_equipped(obj):  # returns a list of equipped items
-    if obj == player:
-        equipped_list = []
-        for item in inventory:
-            if item.equipment and item.equipment.is_equipped:
-                equipped_list.append(item.equipment)
-        return equipped_list
+    if obj.fighter:
+        return list(obj.fighter.equipment_slots.values())
     else:
-        return []  # other objects have no equipment
+        return []  # objects that can't fight have no equipment
 
 
 def is_blocked(x, y):
     # first test the map tile
-    if map[x][y].blocked:
+    if map.blocked[x, y]:
         return True
 
-    # now check for any blocking objects
-    for object in objects:
-        if object.blocks and object.x == x and object.y == y:
-            return True
+    # now check for any blocking objects on that tile
+    return object_index.is_blocked(x, y)
+
+
+def get_player_distance():
+    # the number of steps from every tile around the player (up to CHASE_RADIUS) to them, and where
+    # that part of the map starts. all monsters chasing the player share it, and it's only computed
+    # again after the player moved, so it costs one flood around the player per turn, however big the map
+    global player_distance, player_distance_key
+    key = (player.x, player.y, map.version)
+    if key != player_distance_key:
+        (x1, y1, x2, y2) = window_around(player.x, player.y, CHASE_RADIUS)
+        player_distance = (distance_map(~map.blocked[x1:x2, y1:y2], [(player.x - x1, player.y - y1)]), (x1, y1))
+        player_distance_key = key
+    return player_distance
 
-    return False
+
+def get_route_graph():
+    # the route graph of the level, made again when the map changed. it keeps what it learns
+    # about the level, so all routes share it
+    global route_graph, route_graph_key
+    if map.version != route_graph_key:
+        route_graph = RouteGraph(~map.blocked)
+        route_graph_key = map.version
+    return route_graph
+
+
+def window_around(x, y, radius):
+    # the corners (x1, y1) and (x2, y2), exclusive, of the tiles up to radius away from (x, y) that
+    # are on the map. the whole map with no radius
+    if radius <= 0:
+        return (0, 0, MAP_WIDTH, MAP_HEIGHT)
+    return (max(0, x - radius), max(0, y - radius), min(MAP_WIDTH, x + radius + 1), min(MAP_HEIGHT, y + radius + 1))
 
 
 def create_room(room):
     global map
-    # go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            map[x][y].blocked = False
-            map[x][y].block_sight = False
+    # make the tiles inside the rectangle passable (its border stays wall)
+    map.carve(room.x1 + 1, room.y1 + 1, room.x2, room.y2)
 
 
 def create_h_tunnel(x1, x2, y):
     global map
     # horizontal tunnel. min() and max() are used in case x1>x2
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
+    map.carve(min(x1, x2), y, max(x1, x2) + 1, y + 1)
 
 
 def create_v_tunnel(y1, y2, x):
     global map
     # vertical tunnel
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
+    map.carve(x, min(y1, y2), x + 1, max(y1, y2) + 1)
 
 
 def make_map():
-    global map, objects, stairs
+    global map, objects, object_index, scheduler, stairs, up_stairs
 
-    # the list of objects with just the player
-    objects = [player]
+    # the objects, with just the player
+    objects = EntityStore([player])
+    object_index = SpatialIndex()
+    object_index.add(player)
+    scheduler = TurnScheduler()
 
     # fill map with "blocked" tiles
-    map = [[Tile(True)
-            for y in range(MAP_HEIGHT)]
-           for x in range(MAP_WIDTH)]
-
-    rooms = []
-    num_rooms = 0
-
-    for r in range(MAX_ROOMS):
-        # random width and height
-        w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        # random position without going out of the boundaries of the map
-        x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-        y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
-
-        # "Rect" class makes rectangles easier to work with
-        new_room = Rect(x, y, w, h)
-
-        # run through the other rooms and see if they intersect with this one
-        failed = False
-        for other_room in rooms:
-            if new_room.intersect(other_room):
-                failed = True
-                break
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT)
+    compile_spawn_tables()
+
+    # (rooms, unless the dungeon level has caves and the draw says so)
+    chance = from_level(CAVE_CHANCE, dungeon_level)
+    if chance > 0 and libtcod.random_get_int(rng, 1, 100) <= chance:
+        (stairs_x, stairs_y) = make_caves()
+    else:
+        (stairs_x, stairs_y) = make_rooms()
 
-        if not failed:
-            # this means there are no intersections, so this room is valid
-
-            # "paint" it to the map's tiles
-            create_room(new_room)
-
-            # center coordinates of new room, will be useful later
-            (new_x, new_y) = new_room.center()
-
-            if num_rooms == 0:
-                # this is the first room, where the player starts at
-                player.x = new_x
-                player.y = new_y
-            else:
-                # all rooms after the first:
-                # connect it to the previous room with a tunnel
-
-                # center coordinates of previous room
-                (prev_x, prev_y) = rooms[num_rooms - 1].center()
-
-                # draw a coin (random number that is either 0 or 1)
-                if libtcod.random_get_int(0, 0, 1) == 1:
-                    # first move horizontally, then vertically
-                    create_h_tunnel(prev_x, new_x, prev_y)
-                    create_v_tunnel(prev_y, new_y, new_x)
-                else:
-                    # first move vertically, then horizontally
-                    create_v_tunnel(prev_y, new_y, prev_x)
-                    create_h_tunnel(prev_x, new_x, new_y)
-
-            # add some contents to this room, such as monsters
-            place_objects(new_room)
-
-            # finally, append the new room to the list
-            rooms.append(new_room)
-            num_rooms += 1
-
-    # create stairs at the center of the last room
-    stairs = Object(new_x, new_y, '<', 'stairs', libtcod.white, always_visible=True)
+    # create the stairs down
+    stairs = Object(stairs_x, stairs_y, '<', 'stairs', libtcod.white, always_visible=True, layer=LAYER_STAIRS)
     objects.append(stairs)
-    stairs.send_to_back()  # so it's drawn below the monsters
+    object_index.add(stairs)
+
+    # below the first level, stairs back up where the player arrives
+    up_stairs = None
+    if dungeon_level > 1:
+        up_stairs = Object(player.x, player.y, '>', 'stairs up', libtcod.white, always_visible=True, layer=LAYER_STAIRS)
+        objects.append(up_stairs)
+        object_index.add(up_stairs)
+
+
+def make_rooms():
+    # a level of rectangular rooms joined by tunnels. the player starts in the first room, and
+    # returns the center of the room the most tunnels away from it, for the stairs
+    # (MAX_ROOMS is the number of tries for an 80x43 map: bigger maps get as many per tile)
+    attempts = max(MAX_ROOMS, MAX_ROOMS * MAP_WIDTH * MAP_HEIGHT // (80 * 43))
+    (rooms, bins) = place_rooms(MAP_WIDTH, MAP_HEIGHT, attempts, ROOM_MIN_SIZE, ROOM_MAX_SIZE, rng)
+    for room in rooms:
+        # "paint" it to the map's tiles
+        create_room(room)
+
+    # tunnels between the rooms, so they can all be reached
+    links = connect_rooms(rooms, bins, rng)
+    for (i, j) in links:
+        ((prev_x, prev_y), (new_x, new_y)) = (rooms[i].center(), rooms[j].center())
+        # draw a coin (random number that is either 0 or 1)
+        if libtcod.random_get_int(rng, 0, 1) == 1:
+            # first move horizontally, then vertically
+            create_h_tunnel(prev_x, new_x, prev_y)
+            create_v_tunnel(prev_y, new_y, new_x)
+        else:
+            # first move vertically, then horizontally
+            create_v_tunnel(prev_y, new_y, prev_x)
+            create_h_tunnel(prev_x, new_x, new_y)
+
+    # the first room is where the player starts at
+    (x, y) = rooms[0].center()
+    object_index.move(player, x, y)
+
+    # add some contents to the rooms, such as monsters
+    for room in rooms:
+        place_objects(room)
+
+    # the room the most tunnels away from the first one (breadth first through the links)
+    neighbours = [[] for _ in rooms]
+    for (i, j) in links:
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+    hops = [None] * len(rooms)
+    hops[0] = 0
+    queue = [0]
+    for i in queue:
+        for j in neighbours[i]:
+            if hops[j] is None:
+                hops[j] = hops[i] + 1
+                queue.append(j)
+    return rooms[queue[-1]].center()
+
+
+def make_caves():
+    # a level of caves, grown by a cellular automaton over the whole map at once. only the biggest
+    # cave is kept, so every floor tile can be reached; the player starts in it, and returns the tile
+    # of the cave farthest from them (in steps), for the stairs
+    random = np.random.default_rng(libtcod.random_get_int(rng, 0, LEVEL_SEED_MAX))
+    while True:
+        walls = cave_walls(MAP_WIDTH, MAP_HEIGHT, random)
+        cave = main_cave(~walls, random)
+        if cave is not None:
+            break
+    ((start_x, start_y), distance) = cave
 
+    # fill in the other caves
+    map.blocked[:] = distance == UNREACHABLE
+    map.block_sight[:] = map.blocked
+    map.touch()
+    object_index.move(player, start_x, start_y)
 
-def random_choice_index(chances):  # choose one option from list of chances, returning its index
-    # the dice will land on some number between 1 and the sum of the chances
-    dice = libtcod.random_get_int(0, 1, sum(chances))
+    # monsters and items, square by square, like in rooms (they only go on the floor)
+    for x in range(0, MAP_WIDTH - 1, CAVE_AREA):
+        for y in range(0, MAP_HEIGHT - 1, CAVE_AREA):
+            area = Rect(x, y, min(CAVE_AREA, MAP_WIDTH - 1 - x), min(CAVE_AREA, MAP_HEIGHT - 1 - y))
+            if not map.blocked[area.x1 + 1:area.x2, area.y1 + 1:area.y2].all():
+                place_objects(area)
 
-    # go through all chances, keeping the sum so far
-    running_sum = 0
-    choice = 0
-    for w in chances:
-        running_sum += w
+    # the farthest tile of the cave
+    (x, y) = np.unravel_index(np.argmax(np.where(map.blocked, -1, distance)), distance.shape)
+    return (int(x), int(y))
 
-        # see if the dice landed in the part that corresponds to this choice
-        if dice <= running_sum:
-            return choice
-        choice += 1
 
+def create_orc(x, y):
+    fighter_component = Fighter(hp=20, defense=0, power=4, xp=35, death_function=monster_death)
+    ai_component = BasicMonster()
+    return Object(x, y, 'o', 'orc', libtcod.desaturated_green, blocks=True, fighter=fighter_component, ai=ai_component)
 
-def random_choice(chances_dict):
-    # choose one option from dictionary of chances, returning its key
-    chances = list(chances_dict.values())
-    strings = list(chances_dict.keys())
 
-    return strings[random_choice_index(chances)]
+def create_troll(x, y):
+    fighter_component = Fighter(hp=30, defense=2, power=8, xp=100, death_function=monster_death)
+    ai_component = BasicMonster()
+    return Object(x, y, 'T', 'troll', libtcod.darker_green, blocks=True, fighter=fighter_component, ai=ai_component)
 
 
-def from_dungeon_level(table):
-    # returns a value that depends on level. the table specifies what value occurs after each level, default is 0.
-    for (value, level) in reversed(table):
-        if dungeon_level >= level:
-            return value
-    return 0
+def create_healing_potion(x, y):
+    item_component = Item(use_function=cast_heal)
+    return Object(x, y, '!', 'healing potion', libtcod.violet, item=item_component)
 
 
-def place_objects(room):
-    # this is where we decide the chance of each monster or item appearing.
+def create_lightning_scroll(x, y):
+    item_component = Item(use_function=cast_lightning)
+    return Object(x, y, '#', 'scroll of lightning bolt', libtcod.light_yellow, item=item_component)
+
+
+def create_fireball_scroll(x, y):
+    item_component = Item(use_function=cast_fireball)
+    return Object(x, y, '#', 'scroll of fireball', libtcod.light_yellow, item=item_component)
+
+
+def create_confuse_scroll(x, y):
+    item_component = Item(use_function=cast_confuse)
+    return Object(x, y, '#', 'scroll of confusion', libtcod.light_yellow, item=item_component)
+
+
+def create_sword(x, y):
+    equipment_component = Equipment(slot='right hand', power_bonus=3)
+    return Object(x, y, '/', 'sword', libtcod.sky, equipment=equipment_component)
+
 
-    # maximum number of monsters per room
-    max_monsters = from_dungeon_level([[2, 1], [3, 4], [5, 6]])
+def create_shield(x, y):
+    equipment_component = Equipment(slot='left hand', defense_bonus=1)
+    return Object(x, y, '[', 'shield', libtcod.darker_orange, equipment=equipment_component)
 
-    # chance of each monster
-    monster_chances = {}
-    monster_chances['orc'] = 80  # orc always shows up, even if all other monsters have 0 chance
-    monster_chances['troll'] = from_dungeon_level([[15, 3], [30, 5], [60, 7]])
 
-    # maximum number of items per room
-    max_items = from_dungeon_level([[1, 1], [2, 4]])
+# what can appear in a room. the maximum number per room, and the chance of each thing, depend on the
+# dungeon level: each table lists [value, level] pairs, the value applying from that level on (0 before).
+# new kinds of monsters or items only need a line here
+MAX_MONSTERS = [[2, 1], [3, 4], [5, 6]]
+MONSTER_CHANCES = {
+    create_orc: [[80, 1]],  # orc always shows up, even if all other monsters have 0 chance
+    create_troll: [[15, 3], [30, 5], [60, 7]],
+}
+MAX_ITEMS = [[1, 1], [2, 4]]
+ITEM_CHANCES = {
+    create_healing_potion: [[35, 1]],  # healing potion always shows up, even if all other items have 0 chance
+    create_lightning_scroll: [[25, 4]],
+    create_fireball_scroll: [[25, 6]],
+    create_confuse_scroll: [[10, 2]],
+    create_sword: [[5, 4]],
+    create_shield: [[15, 8]],
+}
 
-    # chance of each item (by default they have a chance of 0 at level 1, which then goes up)
-    item_chances = {}
-    item_chances['heal'] = 35  # healing potion always shows up, even if all other items have 0 chance
-    item_chances['lightning'] = from_dungeon_level([[25, 4]])
-    item_chances['fireball'] = from_dungeon_level([[25, 6]])
-    item_chances['confuse'] = from_dungeon_level([[10, 2]])
-    item_chances['sword'] = from_dungeon_level([[5, 4]])
-    item_chances['shield'] = from_dungeon_level([[15, 8]])
 
+def compile_spawn_tables():
+    # the spawn tables of the current dungeon level, done once per level rather than for every room
+    global monster_spawns, item_spawns
+    monster_spawns = SpawnTable(MAX_MONSTERS, MONSTER_CHANCES, dungeon_level)
+    item_spawns = SpawnTable(MAX_ITEMS, ITEM_CHANCES, dungeon_level)
+
+
+def place_objects(room):
     # choose random number of monsters
-    num_monsters = libtcod.random_get_int(0, 0, max_monsters)
+    num_monsters = monster_spawns.count(rng)
 
     for i in range(num_monsters):
         # choose random spot for this monster
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        x = libtcod.random_get_int(rng, room.x1 + 1, room.x2 - 1)
+        y = libtcod.random_get_int(rng, room.y1 + 1, room.y2 - 1)
 
         # only place it if the tile is not blocked
         if not is_blocked(x, y):
-            choice = random_choice(monster_chances)
-            if choice == 'orc':
-                # create an orc
-                fighter_component = Fighter(hp=20, defense=0, power=4, xp=35, death_function=monster_death)
-                ai_component = BasicMonster()
-
-                monster = Object(x, y, 'o', 'orc', libtcod.desaturated_green,
-                                 blocks=True, fighter=fighter_component, ai=ai_component)
-
-            elif choice == 'troll':
-                # create a troll
-                fighter_component = Fighter(hp=30, defense=2, power=8, xp=100, death_function=monster_death)
-                ai_component = BasicMonster()
-
-                monster = Object(x, y, 'T', 'troll', libtcod.darker_green,
-                                 blocks=True, fighter=fighter_component, ai=ai_component)
-
+            monster = monster_spawns.choose(rng)(x, y)
             objects.append(monster)
+            object_index.add(monster)
 
     # choose random number of items
-    num_items = libtcod.random_get_int(0, 0, max_items)
+    num_items = item_spawns.count(rng)
 
     for i in range(num_items):
         # choose random spot for this item
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        x = libtcod.random_get_int(rng, room.x1 + 1, room.x2 - 1)
+        y = libtcod.random_get_int(rng, room.y1 + 1, room.y2 - 1)
 
         # only place it if the tile is not blocked
         if not is_blocked(x, y):
-            choice = random_choice(item_chances)
-            if choice == 'heal':
-                # create a healing potion
-                item_component = Item(use_function=cast_heal)
-                item = Object(x, y, '!', 'healing potion', libtcod.violet, item=item_component)
-
-            elif choice == 'lightning':
-                # create a lightning bolt scroll
-                item_component = Item(use_function=cast_lightning)
-                item = Object(x, y, '#', 'scroll of lightning bolt', libtcod.light_yellow, item=item_component)
-
-            elif choice == 'fireball':
-                # create a fireball scroll
-                item_component = Item(use_function=cast_fireball)
-                item = Object(x, y, '#', 'scroll of fireball', libtcod.light_yellow, item=item_component)
-
-            elif choice == 'confuse':
-                # create a confuse scroll
-                item_component = Item(use_function=cast_confuse)
-                item = Object(x, y, '#', 'scroll of confusion', libtcod.light_yellow, item=item_component)
-
-            elif choice == 'sword':
-                # create a sword
-                equipment_component = Equipment(slot='right hand', power_bonus=3)
-                item = Object(x, y, '/', 'sword', libtcod.sky, equipment=equipment_component)
-
-            elif choice == 'shield':
-                # create a shield
-                equipment_component = Equipment(slot='left hand', defense_bonus=1)
-                item = Object(x, y, '[', 'shield', libtcod.darker_orange, equipment=equipment_component)
-
+            item = item_spawns.choose(rng)(x, y)
             objects.append(item)
-            item.send_to_back()  # items appear below other objects
+            object_index.add(item)  # (on the item layer, below the monsters)
             item.always_visible = True  # items are visible even out-of-FOV, if in an explored area
 
 
+def generate_level(seed, level, width, height):
+    # build a level from its seed alone, and return it as plain values: the tiles, the records of the
+    # objects (like in a save) and where the player starts. the level generator runs this in its worker
+    # process. run here, it puts back the player, the random numbers... so a level is the same wherever
+    # it was generated (the map and objects it leaves are replaced by install_level anyway)
+    global player, rng, dungeon_level, object_ids, MAP_WIDTH, MAP_HEIGHT
+    saved = (player, rng, dungeon_level, object_ids, MAP_WIDTH, MAP_HEIGHT)
+    try:
+        seed_game(seed)
+        dungeon_level = level
+        (MAP_WIDTH, MAP_HEIGHT) = (width, height)
+        object_ids = itertools.count(1)
+        player = Object(0, 0, '@', 'player', libtcod.white, blocks=True)  # a stand-in, moved to the start
+        make_map()
+        level = level_snapshot()
+        level['meta'].update(start_x=player.x, start_y=player.y)
+        return level
+    finally:
+        (player, rng, dungeon_level, object_ids, MAP_WIDTH, MAP_HEIGHT) = saved
+
+
+def level_snapshot():
+    # the current level (without the player) as plain values, like a save's snapshot: what
+    # generate_level returns, and what the level store keeps of the levels the player left
+    others = [obj for obj in objects if obj is not player]
+    (records, index) = entity_records(others, [0] * len(others))
+    return {
+        'meta': {'stairs': index[stairs], 'up_stairs': index[up_stairs] if up_stairs else -1},
+        'tiles': {'blocked': map.blocked.copy(), 'block_sight': map.block_sight.copy(),
+                  'explored': map.explored.copy()},
+        'entities': records,
+        'messages': [],
+    }
+
+
+def install_level(level, x, y):
+    # make a level from level_snapshot the current one, with the player at (x, y)
+    global map, objects, object_index, scheduler, stairs, up_stairs
+
+    tiles = level['tiles']
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT)
+    map.blocked[:] = tiles['blocked']
+    map.block_sight[:] = tiles['block_sight']
+    map.explored[:] = tiles['explored']
+
+    # (the objects get their uids here, so they never clash with the ones of this process)
+    records = level['entities']
+    entities = entities_from_records(records)
+    objects = EntityStore([player] + [obj for (record, obj) in zip(records, entities) if not record.flags & CARRIED])
+    object_index = SpatialIndex()
+    for obj in objects:
+        object_index.add(obj)
+    object_index.move(player, x, y)
+    scheduler = TurnScheduler()
+
+    meta = level['meta']
+    stairs = entities[meta['stairs']]
+    up_stairs = entities[meta['up_stairs']] if meta['up_stairs'] >= 0 else None
+
+
+def enter_level():
+    # make the level for dungeon_level from its seed: the one the level generator made in the
+    # background if it's ready, else generate it now. then start on the level after it
+    global next_level_seed
+    level = None
+    if level_generator is not None:
+        level = level_generator.take(next_level_seed, dungeon_level, MAP_WIDTH, MAP_HEIGHT)
+    if level is None:
+        level = generate_level(next_level_seed, dungeon_level, MAP_WIDTH, MAP_HEIGHT)
+    install_level(level, level['meta']['start_x'], level['meta']['start_y'])
+    initialize_fov()
+
+    next_level_seed = libtcod.random_get_int(rng, 0, LEVEL_SEED_MAX)
+    prefetch_level()
+
+
+def prefetch_level():
+    if level_generator is not None:
+        level_generator.prefetch(next_level_seed, dungeon_level + 1, MAP_WIDTH, MAP_HEIGHT)
+
+
 def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
     # render a bar (HP, experience, etc). first calculate the width of the bar
     bar_width = int(float(value) // maximum * total_width)
@@ -619,67 +852,182 @@ def get_names_under_mouse():
     global mouse
     # return a string with the names of all objects under the mouse
 
-    (x, y) = (mouse.cx, mouse.cy)
+    (x, y) = mouse_tile()
 
     # create a list with the names of all objects at the mouse's coordinates and in FOV
-    names = [obj.name for obj in objects
-             if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = [obj.name for obj in object_index.at(x, y)
+             if is_in_fov(obj.x, obj.y)]
 
     names = ', '.join(names)  # join the names, separated by commas
     return names.capitalize()
 
 
+def mouse_tile():
+    # the tile of the map under the mouse (the view shows the map from the camera on)
+    return (mouse.cx + camera_x, mouse.cy + camera_y)
+
+
+def is_in_fov(x, y):
+    # true if the tile is in the player's field of view (tiles outside the map never are)
+    x -= fov_x
+    y -= fov_y
+    (width, height) = fov_visible.shape
+    return 0 <= x < width and 0 <= y < height and bool(fov_visible[x, y])
+
+
+def recompute_fov():
+    # compute the player's field of view. only the tiles within TORCH_RADIUS of the player can be
+    # seen, so it's a boolean array indexed [x, y] of just those, with the map coordinates of its
+    # corner in fov_x, fov_y. the result is reused if the player stood on this tile before, and no
+    # tile started or stopped blocking sight (nor the FOV settings changed) since
+    global fov_visible, fov_x, fov_y
+    (fov_x, fov_y) = window_around(player.x, player.y, TORCH_RADIUS)[:2]
+    fov_visible = fov_cache.get((player.x, player.y, TORCH_RADIUS, FOV_ALGO, FOV_LIGHT_WALLS, map.version),
+                                compute_visible_tiles)
+    return fov_visible
+
+
+def compute_visible_tiles():
+    # the tiles visible from the player's position, with whichever algorithm FOV_ALGO selects. the
+    # algorithms only get the part of the map in reach, so the cost doesn't grow with the map
+    (x1, y1, x2, y2) = window_around(player.x, player.y, TORCH_RADIUS)
+    transparent = ~map.block_sight[x1:x2, y1:y2]
+    if FOV_ALGO == FOV_SHADOWCAST:
+        return shadowcast(transparent, player.x - x1, player.y - y1, TORCH_RADIUS, FOV_LIGHT_WALLS)
+
+    # libtcod's algorithms work on a FOV map, whose arrays are indexed [y, x]
+    fov_map = libtcod.map_new(x2 - x1, y2 - y1)
+    fov_map.transparent[:] = transparent.T
+    libtcod.map_compute_fov(fov_map, player.x - x1, player.y - y1, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+    return fov_map.fov.T.copy()
+
+
+def update_fov():
+    # recompute FOV if needed (the player moved or something), and explore what's visible.
+    # returns the visible tiles (see recompute_fov), or None if nothing changed
+    global fov_recompute
+    if not fov_recompute:
+        return None
+    fov_recompute = False
+    visible = recompute_fov()
+
+    # since it's visible, explore it
+    (width, height) = visible.shape
+    map.explored[fov_x:fov_x + width, fov_y:fov_y + height] |= visible
+    return visible
+
+
+def move_camera():
+    # keep the player in the middle of the view, unless that would show past the edges of the map.
+    # returns whether the camera moved
+    global camera_x, camera_y
+    x = min(max(0, player.x - VIEW_WIDTH // 2), max(0, MAP_WIDTH - VIEW_WIDTH))
+    y = min(max(0, player.y - VIEW_HEIGHT // 2), max(0, MAP_HEIGHT - VIEW_HEIGHT))
+    if (x, y) == (camera_x, camera_y):
+        return False
+    (camera_x, camera_y) = (x, y)
+    return True
+
+
+def view_tiles():
+    # the visible and explored tiles of the part of the map in view, as arrays indexed [x, y] from the
+    # camera (smaller than the view if the map is)
+    (width, height) = (min(VIEW_WIDTH, MAP_WIDTH), min(VIEW_HEIGHT, MAP_HEIGHT))
+    explored = map.explored[camera_x:camera_x + width, camera_y:camera_y + height]
+
+    # copy the part of the FOV that's in view
+    visible = np.zeros((width, height), dtype=bool)
+    (fov_width, fov_height) = fov_visible.shape
+    (x1, y1) = (max(fov_x, camera_x), max(fov_y, camera_y))
+    (x2, y2) = (min(fov_x + fov_width, camera_x + width), min(fov_y + fov_height, camera_y + height))
+    if x1 < x2 and y1 < y2:
+        visible[x1 - camera_x:x2 - camera_x, y1 - camera_y:y2 - camera_y] = \
+            fov_visible[x1 - fov_x:x2 - fov_x, y1 - fov_y:y2 - fov_y]
+    return (visible, explored)
+
+
+def paint_tiles(visible, dirty):
+    # set the background color of the dirty tiles the player can see, or has explored, all at once:
+    # each tile picks its color from a palette, and the colors are written straight into the
+    # console's background array. the arrays are the ones of view_tiles. returns the number of tiles painted
+    palette = np.array([[color.r, color.g, color.b] for color in
+                        (color_dark_ground, color_dark_wall, color_light_ground, color_light_wall)], dtype=np.uint8)
+    (width, height) = visible.shape
+    explored = map.explored[camera_x:camera_x + width, camera_y:camera_y + height]
+    block_sight = map.block_sight[camera_x:camera_x + width, camera_y:camera_y + height]
+    shown = dirty & (visible | explored)  # (unexplored tiles stay black)
+    colors = palette[visible[shown] * 2 + block_sight[shown]]
+
+    # the console's arrays are indexed [y, x]
+    con.bg.transpose(1, 0, 2)[:width, :height][shown] = colors
+    return len(colors)
+
+
+def objects_to_draw(layer):
+    # the objects of a layer that may be visible. corpses and monsters only show in the FOV, so only
+    # the ones around the player are looked at, however many the level has. items and stairs also
+    # show on explored tiles, anywhere in view: there are usually few enough to look at them all, but
+    # if there are more than tiles in view, only the ones in view are
+    if layer in (LAYER_CORPSE, LAYER_ACTOR) and TORCH_RADIUS > 0:
+        return [obj for obj in object_index.in_radius(player.x, player.y, TORCH_RADIUS + 1) if obj.layer == layer]
+    if len(objects.layer(layer)) > VIEW_WIDTH * VIEW_HEIGHT:
+        return [obj for obj in object_index.in_rect(camera_x, camera_y, camera_x + VIEW_WIDTH, camera_y + VIEW_HEIGHT)
+                if obj.layer == layer]
+    return objects.layer(layer)
+
+
 def render_all():
-    global fov_map, color_dark_wall, color_light_wall
+    global color_dark_wall, color_light_wall
     global color_dark_ground, color_light_ground
-    global fov_recompute
+    global drawn_visible, drawn_explored, tiles_repainted, drawn_objects
+
+    tiles_repainted = 0
+    changed = update_fov() is not None
+    profiler.lap('fov')
+    scrolled = move_camera()
+    if scrolled:
+        # the whole view moved: start again from a black console
+        libtcod.console_clear(con)
+    if changed or scrolled:
+        # only the tiles in view are looked at. of those, only the ones that entered or left the FOV,
+        # or were just explored, look different from what the console already shows (all of them if it scrolled)
+        (visible, explored) = view_tiles()
+        if scrolled:
+            dirty = np.ones(visible.shape, dtype=bool)
+        else:
+            dirty = (visible != drawn_visible) | (explored != drawn_explored)
+        tiles_repainted = paint_tiles(visible, dirty)
+
+        # remember what the console shows now
+        drawn_visible = visible
+        drawn_explored = explored.copy()
 
-    if fov_recompute:
-        # recompute FOV if needed (the player moved or something)
-        fov_recompute = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
-
-        # go through all tiles, and set their background color according to the FOV
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-                wall = map[x][y].block_sight
-                if not visible:
-                    # if it's not visible right now, the player can only see it if it's explored
-                    if map[x][y].explored:
-                        if wall:
-                            libtcod.console_set_char_background(con, x, y, color_dark_wall, libtcod.BKGND_SET)
-                        else:
-                            libtcod.console_set_char_background(con, x, y, color_dark_ground, libtcod.BKGND_SET)
-                else:
-                    # it's visible
-                    if wall:
-                        libtcod.console_set_char_background(con, x, y, color_light_wall, libtcod.BKGND_SET)
-                    else:
-                        libtcod.console_set_char_background(con, x, y, color_light_ground, libtcod.BKGND_SET)
-                        # since it's visible, explore it
-                    map[x][y].explored = True
-
-    # draw all objects in the list, except the player. we want it to
+    # draw all objects, layer by layer, except the player. we want it to
     # always appear over all other objects! so it's drawn later.
-    for object in objects:
-        if object != player:
-            object.draw()
+    drawn_objects = []
+    for layer in range(LAYERS):
+        for object in objects_to_draw(layer):
+            if object != player and object.draw():
+                drawn_objects.append(object)
     player.draw()
+    drawn_objects.append(player)
 
     # blit the contents of "con" to the root console
-    libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
+    libtcod.console_blit(con, 0, 0, VIEW_WIDTH, VIEW_HEIGHT, 0, 0, 0)
 
     # prepare to render the GUI panel
     libtcod.console_set_default_background(panel, libtcod.black)
     libtcod.console_clear(panel)
 
-    # print the game messages, one line at a time
-    y = 1
-    for (line, color) in game_msgs:
-        libtcod.console_set_default_foreground(panel, color)
-        libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
-        y += 1
+    if profiler.overlay:
+        render_profile()
+    else:
+        # print the game messages, one line at a time
+        y = 1
+        for (line, color) in game_msgs:
+            libtcod.console_set_default_foreground(panel, color)
+            libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+            y += 1
 
     # show the player's stats
     render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
@@ -694,17 +1042,59 @@ def render_all():
     libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
 
 
-def message(new_msg, color=libtcod.white):
-    # split the message if necessary, among multiple lines
-    new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
+def render_profile():
+    # the timing overlay, where the messages usually are: the rolling percentiles of each phase of
+    # the frame, in milliseconds, in two columns
+    column_width = MSG_WIDTH // 2
+    header = '%-9s' % 'ms' + ''.join('%6s' % ('p' + str(q)) for q in PERCENTILES)
+    libtcod.console_set_default_foreground(panel, libtcod.light_gray)
+    for column in range(2):
+        libtcod.console_print_ex(panel, MSG_X + column * column_width, 1, libtcod.BKGND_NONE, libtcod.LEFT, header)
+
+    libtcod.console_set_default_foreground(panel, libtcod.white)
+    rows = MSG_HEIGHT - 1
+    for (i, phase) in enumerate(list(profiler.samples)[:2 * rows]):
+        (column, row) = divmod(i, rows)
+        text = '%-9.9s' % phase + ''.join('%6.2f' % (seconds * 1000) for seconds in profiler.rolling(phase))
+        libtcod.console_print_ex(panel, MSG_X + column * column_width, 2 + row, libtcod.BKGND_NONE, libtcod.LEFT, text)
 
-    for line in new_msg_lines:
-        # if the buffer is full, remove the first line to make room for the new one
-        if len(game_msgs) == MSG_HEIGHT:
-            del game_msgs[0]
 
-        # add the new line as a tuple, with the text and the color
-        game_msgs.append((line, color))
+def message(new_msg, color=libtcod.white):
+    # the message log wraps it, and keeps the last lines for the panel
+    game_msgs.add(new_msg, color)
+
+
+def message_history():
+    # show every message of the game, a screenful at a time, starting from the last ones. up and
+    # down scroll by a line, page up and page down by a screen, any other key closes it.
+    # only the lines on screen are read from the history
+    if controller is not None:
+        return
+    width = MSG_WIDTH + 2
+    height = SCREEN_HEIGHT - 4
+    window = libtcod.console_new(width, height)
+    scroll = {libtcod.KEY_UP: -1, libtcod.KEY_DOWN: 1, libtcod.KEY_PAGEUP: -(height - 1),
+              libtcod.KEY_PAGEDOWN: height - 1}
+
+    last = max(0, game_msgs.history_lines - (height - 1))
+    first = last
+    while True:
+        libtcod.console_clear(window)
+        libtcod.console_set_default_foreground(window, libtcod.white)
+        libtcod.console_print_ex(window, 0, 0, libtcod.BKGND_NONE, libtcod.LEFT,
+                                 'Message history (' + str(first + 1) + '/' + str(last + 1) + ')')
+        y = 1
+        for (line, color) in game_msgs.history_page(first, height - 1):
+            libtcod.console_set_default_foreground(window, color)
+            libtcod.console_print_ex(window, 1, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+            y += 1
+
+        libtcod.console_blit(window, 0, 0, width, height, 0, SCREEN_WIDTH // 2 - width // 2, 2, 1.0, 0.9)
+        libtcod.console_flush()
+        key = libtcod.console_wait_for_keypress(True)
+        if key.vk not in scroll:
+            break
+        first = min(max(first + scroll[key.vk], 0), last)
 
 
 def player_move_or_attack(dx, dy):
@@ -716,8 +1106,8 @@ def player_move_or_attack(dx, dy):
 
     # try to find an attackable object there
     target = None
-    for object in objects:
-        if object.fighter and object.x == x and object.y == y:
+    for object in object_index.at(x, y):
+        if object.fighter:
             target = object
             break
 
@@ -729,10 +1119,113 @@ def player_move_or_attack(dx, dy):
         fov_recompute = True
 
 
+def objects_in_sight():
+    # the monsters and items the player can see
+    return [obj for obj in object_index.in_radius(player.x, player.y, TORCH_RADIUS + 1)
+            if obj != player and (obj.ai or obj.item) and is_in_fov(obj.x, obj.y)]
+
+
+def path_to_unexplored():
+    # the tiles on the way from the player to the closest unexplored tile they can walk to (the last
+    # one), or None if there are none. the flood starts around the player, where the closest one
+    # usually is, and only covers more of the map when there are none there
+    radius = 2 * TORCH_RADIUS
+    while True:
+        (x1, y1, x2, y2) = window_around(player.x, player.y, radius)
+        distance = distance_map(~map.blocked[x1:x2, y1:y2], [(player.x - x1, player.y - y1)])
+        unexplored = (distance > 0) & (distance < UNREACHABLE) & ~map.explored[x1:x2, y1:y2]
+        if unexplored.any():
+            break
+        if (x1, y1, x2, y2) == (0, 0, MAP_WIDTH, MAP_HEIGHT):
+            return None
+        radius *= 2
+
+    # walk back from that tile to the player, down the distance map
+    (x, y) = np.unravel_index(np.where(unexplored, distance, UNREACHABLE).argmin(), distance.shape)
+    (x, y) = (int(x), int(y))
+    path = []
+    while distance[x, y] > 0:
+        path.append((x + x1, y + y1))
+        (dx, dy) = step_downhill(distance, x, y, lambda tx, ty: True)
+        (x, y) = (x + dx, y + dy)
+    path.reverse()
+    return path
+
+
+def explore_steps():
+    # the steps of auto-explore: towards the closest unexplored tile, until it's explored (seeing it
+    # is enough, so that's often before getting there), then towards the next closest one
+    while True:
+        path = path_to_unexplored()
+        if path is None:
+            message('There is nothing left to explore here.', libtcod.light_gray)
+            return
+        (target_x, target_y) = path[-1]
+        for (x, y) in path:
+            if map.explored[target_x, target_y]:
+                break
+            yield (x - player.x, y - player.y)
+
+
+def stairs_steps():
+    # the steps of travelling to the stairs down, over explored tiles
+    if not map.explored[stairs.x, stairs.y]:
+        message("You haven't found the stairs down yet.", libtcod.light_gray)
+        return
+    distance = distance_map(~map.blocked & map.explored, [(stairs.x, stairs.y)])
+    if distance[player.x, player.y] == UNREACHABLE:
+        message("You don't know the way to the stairs down.", libtcod.light_gray)
+        return
+    while (player.x, player.y) != (stairs.x, stairs.y):
+        step = step_downhill(distance, player.x, player.y, lambda x, y: not is_blocked(x, y))
+        if step is None:
+            return
+        yield step
+
+
+def run(steps):
+    # take the steps one turn after the other, without drawing anything in between, until there are
+    # no more, the player is hurt or can't take the next step, or something comes into view: a monster,
+    # or an item that wasn't in view already. the screen is only drawn again once it stops. it also
+    # stops at turn_limit, for headless games. returns the number of turns taken
+    global fov_recompute
+    seen = objects_in_sight()
+    if any(obj.ai for obj in seen):
+        message('Not with monsters in view!', libtcod.light_gray)
+        return 0
+    seen = set(seen)
+    hp = player.fighter.hp
+    turns = 0
+    for (dx, dy) in steps:
+        if turn >= turn_limit:
+            break
+        (x, y) = (player.x, player.y)
+        player.move(dx, dy)
+        if (player.x, player.y) == (x, y):
+            break
+        fov_recompute = True
+        end_turn('run')
+        turns += 1
+        if turn % AUTOSAVE_INTERVAL == 0:
+            autosave()
+        update_fov()
+        if game_state != 'playing' or player.fighter.hp < hp:
+            break
+        if any(obj.ai or obj not in seen for obj in objects_in_sight()):
+            break
+
+    # render_all repaints the tiles that changed since it last drew the screen, once it knows the FOV changed
+    fov_recompute = True
+    return turns
+
+
 def menu(header, options, width):
     if len(options) > 26:
         raise ValueError('Cannot have a menu with more than 26 options.')
 
+    if controller is not None:  # playing headless: the controller picks an option instead
+        return controller.choose(header, options)
+
     # calculate total height for the header (after auto-wrap) and one line per option
     header_height = libtcod.console_get_height_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
     if header == '':
@@ -769,9 +1262,11 @@ def menu(header, options, width):
 
     # convert the ASCII code to an index; if it corresponds to an option, return it
     index = key.c - ord('a')
-    if index >= 0 and index < len(options):
-        return index
-    return None
+    if not (index >= 0 and index < len(options)):
+        index = None
+    if recorder is not None:
+        recorder.choice(index)
+    return index
 
 
 def inventory_menu(header):
@@ -809,6 +1304,11 @@ def handle_keys():
     elif key.vk == libtcod.KEY_ESCAPE:
         return 'exit'  # exit game
 
+    elif key.vk == libtcod.KEY_F3:
+        # F3: show or hide the frame timings
+        profiler.overlay = not profiler.overlay
+        return 'didnt-take-turn'
+
     if game_state == 'playing':
         # movement keys
         if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
@@ -835,8 +1335,8 @@ def handle_keys():
 
             if key_char == 'g':
                 # pick up an item
-                for object in objects:  # look for an item in the player's tile
-                    if object.x == player.x and object.y == player.y and object.item:
+                for object in object_index.at(player.x, player.y):  # look for an item in the player's tile
+                    if object.item:
                         object.item.pick_up()
                         break
 
@@ -852,6 +1352,10 @@ def handle_keys():
                 if chosen_item is not None:
                     chosen_item.drop()
 
+            if key_char == 'm':
+                # scroll back through the messages
+                message_history()
+
             if key_char == 'c':
                 # show character information
                 level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
@@ -864,6 +1368,19 @@ def handle_keys():
                 if stairs.x == player.x and stairs.y == player.y:
                     next_level()
 
+            if key_char == '>':
+                # go back up stairs, if the player is on them
+                if up_stairs and up_stairs.x == player.x and up_stairs.y == player.y:
+                    previous_level()
+
+            if key_char == 'x':
+                # explore the level until something comes into view (the turns are taken right here)
+                run(explore_steps())
+
+            if key_char == 's':
+                # travel to the stairs down, the same way
+                run(stairs_steps())
+
             return 'didnt-take-turn'
 
 
@@ -892,6 +1409,32 @@ def check_level_up():
             player.fighter.base_defense += 1
 
 
+def wake_monster(monster):
+    # event hook: something happened to a monster (it got hurt, confused...) that should make it
+    # act, even if it's dormant far away from the player
+    monster.ai.alert()
+    monster.changed()
+    scheduler.wake(monster)
+
+
+def take_monster_turn(monster):
+    # called by the scheduler when a monster has enough energy to act. returns whether it stays awake
+    if monster.ai is None:
+        return False  # it died since its turn was scheduled
+    monster.ai.take_turn()
+    monster.changed()  # (its AI counts its turns)
+    return monster.ai is not None and (monster.ai.alerted or monster.distance_to(player) <= ACTIVATION_RADIUS)
+
+
+def monsters_take_turns():
+    # wake up the monsters close to the player, then let every awake monster act as many times
+    # as its speed allows during the player's turn. far away monsters stay dormant and cost nothing
+    for obj in object_index.in_radius(player.x, player.y, ACTIVATION_RADIUS):
+        if obj.ai:
+            scheduler.wake(obj)
+    scheduler.advance(ACTION_COST // player.speed, take_monster_turn)
+
+
 def player_death(player):
     # the game ended!
     global game_state
@@ -907,33 +1450,63 @@ def monster_death(monster):
     # transform it into a nasty corpse! it doesn't block, can't be
     # attacked and doesn't move
     message('The ' + monster.name + ' is dead! You gain ' + str(monster.fighter.xp) + ' experience points.', libtcod.orange)
+
+    # whatever it was wearing falls to the ground
+    for equipment in get_all_equipped(monster):
+        equipment.dequip()
+        item = equipment.owner
+        item.x = monster.x
+        item.y = monster.y
+        objects.append(item)
+        object_index.add(item)
+        item.always_visible = True
+        item.changed()
+
     monster.char = '%'
     monster.color = libtcod.dark_red
     monster.blocks = False
     monster.fighter = None
     monster.ai = None
     monster.name = 'remains of ' + monster.name
-    monster.send_to_back()
+    monster.set_layer(LAYER_CORPSE)  # below the items
 
 
 def target_tile(max_range=None):
     global key, mouse
     # return the position of a tile left-clicked in player's FOV (optionally in a range), or (None,None) if right-clicked.
-    while True:
-        # render the screen. this erases the inventory and shows the names of objects under the mouse.
-        libtcod.console_flush()
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse)
-        render_all()
+    if controller is not None:
+        # playing headless: the controller picks the tile, and an invalid choice cancels
+        (x, y) = controller.choose_target(max_range)
+        if x is None or not is_in_fov(x, y) or (max_range is not None and player.distance(x, y) > max_range):
+            return (None, None)
+        return (x, y)
+
+    drawn_tile = None
+    target = (None, None)
+    while not libtcod.console_is_window_closed():
+        if (mouse.cx, mouse.cy) != drawn_tile:
+            # render the screen. this erases the inventory and shows the names of objects under the mouse.
+            # nothing else changes while targeting, so it's only drawn again when the mouse goes to another tile
+            render_all()
+            libtcod.console_flush()
+            drawn_tile = (mouse.cx, mouse.cy)
 
-        (x, y) = (mouse.cx, mouse.cy)
+        # sleep until the player does something
+        libtcod.sys_wait_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse, False)
+        (x, y) = mouse_tile()
 
         if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
-            return (None, None)  # cancel if the player right-clicked or pressed Escape
+            break  # cancel if the player right-clicked or pressed Escape
 
         # accept the target if the player clicked in FOV, and in case a range is specified, if it's in that range
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+        if (mouse.lbutton_pressed and is_in_fov(x, y) and
                 (max_range is None or player.distance(x, y) <= max_range)):
-            return (x, y)
+            target = (x, y)
+            break
+
+    if recorder is not None:
+        recorder.target(*target)
+    return target
 
 
 def target_monster(max_range=None):
@@ -944,24 +1517,17 @@ def target_monster(max_range=None):
             return None
 
         # return the first clicked monster, otherwise continue looping
-        for obj in objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in object_index.at(x, y):
+            if obj.fighter and obj != player:
                 return obj
 
 
 def closest_monster(max_range):
-    # find closest enemy, up to a maximum range, and in the player's FOV
-    closest_enemy = None
-    closest_dist = max_range + 1  # start with (slightly more than) maximum range
+    # find closest enemy, up to a maximum range (see SpatialIndex.nearest), and in the player's FOV
+    def is_enemy(object):
+        return object.fighter and not object == player and is_in_fov(object.x, object.y)
 
-    for object in objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
-            # calculate distance between this object and the player
-            dist = player.distance_to(object)
-            if dist < closest_dist:  # it's closer, so remember it
-                closest_enemy = object
-                closest_dist = dist
-    return closest_enemy
+    return object_index.nearest(player.x, player.y, max_range, is_enemy)
 
 
 def cast_heal():
@@ -984,7 +1550,7 @@ def cast_lightning():
     # zap it!
     message('A lighting bolt strikes the ' + monster.name + ' with a loud thunder! The damage is '
             + str(LIGHTNING_DAMAGE) + ' hit points.', libtcod.light_blue)
-    monster.fighter.take_damage(LIGHTNING_DAMAGE)
+    monster.fighter.take_damage(LIGHTNING_DAMAGE, 'lightning bolt')
 
 
 def cast_fireball():
@@ -995,10 +1561,10 @@ def cast_fireball():
         return 'cancelled'
     message('The fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
 
-    for obj in objects:  # damage every fighter in range, including the player
-        if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
+    for obj in object_index.in_radius(x, y, FIREBALL_RADIUS):  # damage every fighter in range, including the player
+        if obj.fighter:
             message('The ' + obj.name + ' gets burned for ' + str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
-            obj.fighter.take_damage(FIREBALL_DAMAGE)
+            obj.fighter.take_damage(FIREBALL_DAMAGE, 'fireball')
 
 
 def cast_confuse():
@@ -1012,43 +1578,254 @@ def cast_confuse():
     old_ai = monster.ai
     monster.ai = ConfusedMonster(old_ai)
     monster.ai.owner = monster  # tell the new component who owns it
+    wake_monster(monster)
     message('The eyes of the ' + monster.name + ' look vacant, as he starts to stumble around!', libtcod.light_green)
 
 
+# the functions and AI classes components can refer to, by the names saves know them by
+SAVED_FUNCTIONS = {function.__name__: function for function in
+                   (player_death, monster_death, cast_heal, cast_lightning, cast_fireball, cast_confuse)}
+SAVED_AI = {ai_class.__name__: ai_class for ai_class in (BasicMonster, ConfusedMonster)}
+
+
+def function_name(function):
+    return function.__name__ if function is not None else None
+
+
+def object_record(obj, flags=0, wearer=-1):
+    # describe an object and its components as a save record. flags tells where it is kept,
+    # and wearer is the index of the entity that has it equipped (-1 for none)
+    if obj.blocks:
+        flags |= BLOCKS
+    if obj.always_visible:
+        flags |= ALWAYS_VISIBLE
+
+    fighter = obj.fighter
+    if fighter:
+        flags |= HAS_FIGHTER
+        fighter_values = (fighter.hp, fighter.base_max_hp, fighter.base_defense, fighter.base_power, fighter.xp,
+                          function_name(fighter.death_function))
+    else:
+        fighter_values = (0, 0, 0, 0, 0, None)
+
+    # AIs only have a turn counter, plus the AI to go back to for confused monsters
+    ai = obj.ai
+    if isinstance(ai, ConfusedMonster):
+        ai_values = ('ConfusedMonster', ai.num_turns, type(ai.old_ai).__name__, ai.old_ai.alert_turns)
+    elif ai:
+        ai_values = (type(ai).__name__, ai.alert_turns, None, 0)
+    else:
+        ai_values = (None, 0, None, 0)
+
+    use_function = None
+    if obj.item:
+        flags |= HAS_ITEM
+        use_function = function_name(obj.item.use_function)
+
+    equipment = obj.equipment
+    if equipment:
+        flags |= HAS_EQUIPMENT
+        if equipment.is_equipped:
+            flags |= EQUIPPED
+        equipment_values = (equipment.slot, equipment.power_bonus, equipment.defense_bonus, equipment.max_hp_bonus)
+    else:
+        equipment_values = (None, 0, 0, 0)
+
+    return EntityRecord(obj.uid, obj.x, obj.y, obj.char, obj.name, obj.color.r, obj.color.g, obj.color.b, flags, obj.speed,
+                        *fighter_values, *ai_values, use_function, *equipment_values, wearer, obj.layer)
+
+
+def record_object(record):
+    # the opposite of object_record: build an object and its components from a save record
+    fighter = None
+    if record.flags & HAS_FIGHTER:
+        fighter = Fighter(hp=record.base_max_hp, defense=record.base_defense, power=record.base_power, xp=record.xp,
+                          death_function=SAVED_FUNCTIONS.get(record.death_function))
+        fighter.hp = record.hp
+
+    ai = None
+    if record.ai == 'ConfusedMonster':
+        old_ai = SAVED_AI[record.old_ai]()
+        old_ai.alert_turns = record.old_ai_turns
+        ai = ConfusedMonster(old_ai, record.ai_turns)
+    elif record.ai:
+        ai = SAVED_AI[record.ai]()
+        ai.alert_turns = record.ai_turns
+
+    item = None
+    equipment = None
+    if record.flags & HAS_EQUIPMENT:
+        equipment = Equipment(record.slot, record.power_bonus, record.defense_bonus, record.max_hp_bonus)
+    elif record.flags & HAS_ITEM:
+        item = Item(use_function=SAVED_FUNCTIONS.get(record.use_function))
+
+    obj = Object(record.x, record.y, record.char, record.name, libtcod.Color(record.r, record.g, record.b),
+                 blocks=bool(record.flags & BLOCKS), always_visible=bool(record.flags & ALWAYS_VISIBLE),
+                 fighter=fighter, ai=ai, item=item, equipment=equipment, speed=record.speed, layer=record.layer)
+    if isinstance(ai, ConfusedMonster):
+        ai.old_ai.owner = obj
+    return obj
+
+
+def entity_records(entities, flags):
+    # the records of some entities (flags tells where each one is kept), followed by the records of
+    # the equipment worn by the monsters among them. also returns the index of each entity's record
+    entities = list(entities)
+    flags = list(flags)
+    for obj in entities[:]:
+        if obj.fighter and obj != player:
+            for equipment in obj.fighter.equipment_slots.values():
+                entities.append(equipment.owner)
+                flags.append(CARRIED)
+
+    index = {obj: i for (i, obj) in enumerate(entities)}
+    records = []
+    for (obj, where) in zip(entities, flags):
+        wearer = -1
+        if obj.equipment and obj.equipment.is_equipped:
+            wearer = index[obj.equipment.wearer]
+        if where or wearer >= 0 or obj is player:
+            records.append(object_record(obj, where, wearer))
+        else:
+            # most of the objects on the map didn't change since the last save (a level can have
+            # thousands, far from the player), so their record is only made again once they did
+            if obj.record is None:
+                obj.record = object_record(obj)
+            records.append(obj.record)
+    return (records, index)
+
+
+def entities_from_records(records):
+    # the opposite of entity_records: build the entities, and put equipment back on whoever wore
+    # it (quietly, unlike Equipment.equip)
+    entities = [record_object(record) for record in records]
+    for (record, obj) in zip(records, entities):
+        if record.flags & EQUIPPED:
+            wearer = entities[record.wearer]
+            obj.equipment.is_equipped = True
+            obj.equipment.wearer = wearer
+            wearer.fighter.equipment_slots[obj.equipment.slot] = obj.equipment
+    return entities
+
+
+def snapshot_game():
+    # copy the whole game state into plain values (a snapshot), that can be saved without touching the game objects.
+    # the entities are the objects on the map, then the inventory, then the equipment worn by monsters
+    (records, index) = entity_records(list(objects) + inventory, [0] * len(objects) + [IN_INVENTORY] * len(inventory))
+
+    return {
+        'meta': {'dungeon_level': dungeon_level, 'game_state': game_state, 'player': index[player],
+                 'stairs': index[stairs], 'up_stairs': index[up_stairs] if up_stairs else -1,
+                 'player_level': player.level, 'turn': turn, 'next_level_seed': next_level_seed},
+        'tiles': {'blocked': map.blocked.copy(), 'block_sight': map.block_sight.copy(),
+                  'explored': map.explored.copy()},
+        'entities': records,
+        'messages': [(line, (color.r, color.g, color.b)) for (line, color) in game_msgs],
+    }
+
+
+def restore_game(snapshot):
+    # the opposite of snapshot_game: replace the game state with the one in a snapshot
+    global map, objects, object_index, scheduler, player, stairs, inventory, game_state, dungeon_level, turn
+    global next_level_seed, up_stairs, MAP_WIDTH, MAP_HEIGHT
+
+    tiles = snapshot['tiles']
+    (MAP_WIDTH, MAP_HEIGHT) = tiles['blocked'].shape  # (the saved game may have been on bigger maps)
+    map = TileMap(MAP_WIDTH, MAP_HEIGHT)
+    map.blocked[:] = tiles['blocked']
+    map.block_sight[:] = tiles['block_sight']
+    map.explored[:] = tiles['explored']
+
+    records = snapshot['entities']
+    entities = entities_from_records(records)
+    objects = EntityStore()
+    inventory = []
+    for (record, obj) in zip(records, entities):
+        if record.flags & IN_INVENTORY:
+            inventory.append(obj)
+        elif not record.flags & CARRIED:
+            objects.append(obj)
+
+    meta = snapshot['meta']
+    player = entities[meta['player']]
+    player.level = meta['player_level']
+    stairs = entities[meta['stairs']]
+    up_stairs = entities[meta['up_stairs']] if meta['up_stairs'] >= 0 else None
+    game_state = meta['game_state']
+    dungeon_level = meta['dungeon_level']
+    turn = meta['turn']
+    next_level_seed = meta['next_level_seed']
+    game_msgs.restore((line, libtcod.Color(*color)) for (line, color) in snapshot['messages'])
+
+    # the index isn't saved, rebuild it from the objects on the map
+    object_index = SpatialIndex()
+    for obj in objects:
+        object_index.add(obj)
+
+    # monsters start dormant, the ones near the player wake up on the first turn
+    scheduler = TurnScheduler()
+
+
+def autosave(full=False):
+    # take a snapshot of the game now, and let the autosaver write it in the background. unless full
+    # is set, only what changed since the last save gets written. (there's no autosaver when the
+    # module is imported, rather than run as the game, so headless runs never touch the save)
+    if autosaver is not None:
+        level_store.flush()  # (the levels left since the last save, which the save counts on)
+        game_msgs.save()
+        autosaver.save(saved_snapshot(), full)
+
+
+def saved_snapshot():
+    # the snapshot of the game that goes to the save file: with the directory of the levels it left
+    snapshot = snapshot_game()
+    snapshot['meta']['levels'] = level_store.name
+    return snapshot
+
+
 def save_game():
-    # open a new empty shelve (possibly overwriting an old one) to write the game data
-    file = shelve.open('savegame', 'n')
-    file['map'] = map
-    file['objects'] = objects
-    file['player_index'] = objects.index(player)  # index of player in objects list
-    file['stairs_index'] = objects.index(stairs)  # same for the stairs
-    file['inventory'] = inventory
-    file['game_msgs'] = game_msgs
-    file['game_state'] = game_state
-    file['dungeon_level'] = dungeon_level
-    file.close()
+    # write the whole game to the save file (replacing the old one only once it's fully written),
+    # after any autosave still in progress. the levels left go to their files too, and once the save
+    # is written the levels of the games saved before it can go
+    level_store.flush()
+    game_msgs.save()
+    autosaver.save(saved_snapshot(), full=True)
+    autosaver.wait()
+    level_store.remove_others()
 
 
 def load_game():
-    # open the previously saved shelve and load the game data
-    global map, objects, player, stairs, inventory, game_msgs, game_state, dungeon_level
-
-    file = shelve.open('savegame', 'r')
-    map = file['map']
-    objects = file['objects']
-    player = objects[file['player_index']]  # get index of player in objects list and access it
-    stairs = objects[file['stairs_index']]  # same for the stairs
-    inventory = file['inventory']
-    game_msgs = file['game_msgs']
-    game_state = file['game_state']
-    dungeon_level = file['dungeon_level']
-    file.close()
-
+    # read the save file in one go, and load the game data
+    global level_store
+    snapshot = read_save(SAVE_FILE)
+    restore_game(snapshot)
+    # the levels of this save are the ones in the files of its directory
+    level_store = LevelStore(level_store.root, snapshot['meta']['levels'])
+    game_msgs.reload()  # (a new game played since has its own history)
+    if autosaver is not None:
+        autosaver.reset()
     initialize_fov()
+    prefetch_level()
+
+
+def seed_game(seed):
+    # make the game's random numbers come from a generator with a fixed seed, so the same
+    # seed and the same inputs always play out the same way. None goes back to libtcod's default
+    global rng
+    if seed is None:
+        rng = 0
+    else:
+        rng = libtcod.random_new_from_seed(seed)
+
 
+def new_game(seed=None):
+    global player, inventory, game_state, dungeon_level, turn, object_ids, next_level_seed, killed_by, item_uses
 
-def new_game():
-    global player, inventory, game_msgs, game_state, dungeon_level
+    seed_game(seed)
+    object_ids = itertools.count(1)
+    level_store.clear()
+    killed_by = None
+    item_uses = Counter()
 
     # create object representing the player
     fighter_component = Fighter(hp=100, defense=1, power=2, xp=0, death_function=player_death)
@@ -1058,14 +1835,17 @@ def new_game():
 
     # generate map (at this point it's not drawn to the screen)
     dungeon_level = 1
-    make_map()
-    initialize_fov()
+    next_level_seed = libtcod.random_get_int(rng, 0, LEVEL_SEED_MAX)
+    enter_level()
 
     game_state = 'playing'
     inventory = []
+    turn = 0
+    if autosaver is not None:
+        autosaver.reset()  # the first autosave of a game writes it whole
 
-    # create the list of game messages and their colors, starts empty
-    game_msgs = []
+    # the game messages and their colors start empty
+    game_msgs.clear()
 
     # a warm welcoming message!
     message('Welcome stranger! Prepare to perish in the Tombs of the Ancient Kings.', libtcod.red)
@@ -1078,29 +1858,63 @@ def new_game():
     obj.always_visible = True
 
 
-def next_level():
-    # advance to the next level
+def leave_level(number):
+    # keep the current level in the level store, and go to another one. returns that level if the
+    # player was there before, None for a level that has to be made
     global dungeon_level
-    message('You take a moment to rest, and recover your strength.', libtcod.light_violet)
-    player.fighter.heal(player.fighter.max_hp // 2)  # heal the player by 50%
+    level_store.put(dungeon_level, level_snapshot())
+    dungeon_level = number
+    return level_store.take(number)
 
-    dungeon_level += 1
-    message('After a rare moment of peace, you descend deeper into the heart of the dungeon...', libtcod.red)
-    make_map()  # create a fresh new level!
+
+def return_to_level(level, stairs_name):
+    # make a level the player was on before the current one again, arriving on its stairs
+    arrival = level['entities'][level['meta'][stairs_name]]
+    install_level(level, arrival.x, arrival.y)
     initialize_fov()
 
 
+def next_level():
+    # advance to the next level
+    level = leave_level(dungeon_level + 1)
+    if level is not None:
+        return_to_level(level, 'up_stairs')
+        message('You descend back to level ' + str(dungeon_level) + '.', libtcod.red)
+    else:
+        message('You take a moment to rest, and recover your strength.', libtcod.light_violet)
+        player.fighter.heal(player.fighter.max_hp // 2)  # heal the player by 50%
+
+        message('After a rare moment of peace, you descend deeper into the heart of the dungeon...', libtcod.red)
+        enter_level()  # create a fresh new level! (or take the one made in the background)
+    autosave(full=True)  # on another level, so save it whole
+
+
+def previous_level():
+    # go back up to the level above, as the player left it
+    level = leave_level(dungeon_level - 1)
+    if level is not None:
+        return_to_level(level, 'stairs')
+    else:
+        enter_level()  # (only if its file was lost: the game crashed before saving it)
+    message('You climb back up to level ' + str(dungeon_level) + '.', libtcod.light_violet)
+    autosave(full=True)
+
+
 def initialize_fov():
-    global fov_recompute, fov_map
+    global fov_recompute, fov_cache, fov_visible, fov_x, fov_y, camera_x, camera_y
+    global player_distance_key, route_graph_key
     fov_recompute = True
 
-    # create the FOV map, according to the generated map
-    fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
+    # results cached for the previous level mean nothing here
+    fov_cache = FovCache()
+    player_distance_key = None
+    route_graph_key = None
+    fov_visible = np.zeros((0, 0), dtype=bool)
+    (fov_x, fov_y) = (0, 0)
 
-    libtcod.console_clear(con)  # unexplored areas start black (which is the default background color)
+    # the camera isn't anywhere on this level yet, so the next render places it, which clears the
+    # console (unexplored areas start black, the default background color) and paints every tile
+    (camera_x, camera_y) = (None, None)
 
 
 def play_game():
@@ -1110,32 +1924,161 @@ def play_game():
 
     mouse = libtcod.Mouse()
     key = libtcod.Key()
-    # main loop
+    redraw = True  # the screen is out of date
+    drawn_tile = None  # the tile under the mouse when the screen was drawn
+    # main loop. it sleeps until the player does something, and only draws the screen again after
+    # a key press (which can take a turn, or change what's shown) or when the mouse goes to another tile
     while not libtcod.console_is_window_closed():
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse)
-        # render the screen
-        render_all()
-
-        libtcod.console_flush()
+        # (the profiler times each phase of the frame, up to each lap)
+        profiler.start_frame()
+        if redraw:
+            # render the screen
+            render_all()
+            drawn_tile = (mouse.cx, mouse.cy)
+            redraw = False
+            profiler.lap('render')
+
+            libtcod.console_flush()
+            profiler.lap('flush')  # (including the wait that keeps to LIMIT_FPS)
+
+            # level up if needed (then show the new stats right away)
+            level = player.level
+            check_level_up()
+            profiler.lap('level up')
+            if player.level != level:
+                redraw = True
+                profiler.end_frame()
+                continue
 
-        # level up if needed
-        check_level_up()
+        event = libtcod.sys_wait_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, key, mouse, False)
+        profiler.lap('wait')
+        if not event & libtcod.EVENT_KEY_PRESS:
+            # the mouse moved (or clicked): the names under it only change with the tile
+            redraw = (mouse.cx, mouse.cy) != drawn_tile
+            profiler.end_frame()
+            continue
 
-        # erase all objects at their old locations, before they move
-        for object in objects:
+        # erase all objects at their old locations, before they move (only the ones drawn need it)
+        for object in drawn_objects:
             object.clear()
+        profiler.lap('clear')
 
         # handle keys and exit game if needed
+        if recorder is not None:
+            recorder.key(key)
         player_action = handle_keys()
+        redraw = True
+        profiler.lap('player')
         if player_action == 'exit':
+            profiler.end_frame()
             save_game()
             break
 
         # let monsters take their turn
-        if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.ai:
-                    object.ai.take_turn()
+        turn_taken = end_turn(player_action)
+        profiler.lap('monsters')
+        if turn_taken and turn % AUTOSAVE_INTERVAL == 0:
+            autosave()
+            profiler.lap('autosave')
+        profiler.end_frame()
+
+
+def end_turn(player_action):
+    # if the player's action took a turn, let monsters take theirs. returns whether a turn went by
+    global turn
+    if game_state == 'playing' and player_action != 'didnt-take-turn':
+        monsters_take_turns()
+        turn += 1
+        return True
+    return False
+
+
+def play_headless(new_controller, max_turns, until_exit=False):
+    # the main loop without a window: the controller presses the keys and answers the menus
+    # instead of the player. stops when the player dies, exits, or after max_turns turns. with
+    # until_exit, a dead player goes on like in play_game (a level up earned by the killing blow
+    # still asks for its stat, keys still go to handle_keys) until the controller exits
+    global controller, key, turn_limit
+    controller = new_controller
+    turn_limit = max_turns  # (for the commands that take many turns at once)
+    try:
+        while (game_state == 'playing' or until_exit) and turn < max_turns:
+            profiler.start_frame()
+            update_fov()
+            profiler.lap('fov')
+
+            # level up if needed (as many times as the experience allows, like play_game)
+            level = None
+            while player.level != level:
+                level = player.level
+                check_level_up()
+            profiler.lap('level up')
+
+            key = controller.next_key()
+            profiler.lap('controller')
+            player_action = handle_keys()
+            profiler.lap('player')
+            if player_action == 'exit':
+                profiler.end_frame()
+                break
+            end_turn(player_action)
+            profiler.lap('monsters')
+            profiler.end_frame()
+    finally:
+        controller = None
+        turn_limit = math.inf
+        profiler.end_frame()
+
+
+def state_hash():
+    # a fingerprint of the whole game state: two games that end with the same hash ended the same
+    return hashlib.sha1(encode(snapshot_game())).hexdigest()
+
+
+def play_new_game():
+    # start a game from a new seed, and play it while recording it in the replays directory. a game
+    # that crashed is recorded too, up to the input that crashed it
+    global recorder
+    seed = libtcod.random_get_int(0, 0, LEVEL_SEED_MAX)
+    new_game(seed)
+    recorder = Recorder(seed, MAP_WIDTH, MAP_HEIGHT)
+    path = os.path.join(REPLAYS_DIRECTORY, time.strftime('%Y%m%d-%H%M%S') + '-' + str(seed) + '.json')
+    try:
+        play_game()
+    finally:
+        recorder.write(path, turn, state_hash())
+        recorder = None
+
+
+def replay_game(replay):
+    # play a recorded game again, headless and as fast as it goes. returns the hash of the state it
+    # ends in, which is the recorded one if it went the same way. raises ReplayError if it went so
+    # differently that the recorded inputs don't fit anymore
+    global MAP_WIDTH, MAP_HEIGHT
+    (MAP_WIDTH, MAP_HEIGHT) = (replay['width'], replay['height'])
+    new_game(replay['seed'])
+    play_headless(ReplayController(replay['events']), math.inf, until_exit=True)  # (the recording went on after death too)
+    return state_hash()
+
+
+def check_replays(paths):
+    # play recorded games again, and tell whether each one ended like it did when recorded, and how
+    # fast it went. returns whether they all did
+    all_passed = True
+    for path in paths:
+        try:
+            replay = read_replay(path)
+            start = time.perf_counter()
+            passed = replay_game(replay) == replay['hash']
+            elapsed = time.perf_counter() - start
+        except ReplayError as error:
+            print('%s: FAILED, %s' % (path, error))
+            all_passed = False
+            continue
+        print('%s: %d turns in %.2f s (%.0f turns/s), %s' % (path, turn, elapsed, turn / max(elapsed, 1e-9),
+                                                            'ok' if passed else 'DIFFERENT END'))
+        all_passed = all_passed and passed
+    return all_passed
 
 
 def main_menu():
@@ -1153,8 +2096,7 @@ def main_menu():
         choice = menu('', ['Play a new game', 'Continue last game', 'Quit'], 24)
 
         if choice == 0:  # new game
-            new_game()
-            play_game()
+            play_new_game()
         if choice == 1:  # load last game
             try:
                 load_game()
@@ -1166,9 +2108,56 @@ def main_menu():
             break
 
 
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'cool game', False)
-libtcod.sys_set_fps(LIMIT_FPS)
-con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
+def map_size(text):
+    # a map size on the command line, like 1000x1000
+    try:
+        (width, height) = (int(n) for n in text.split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a size like 1000x1000, not %r' % text)
+    if width < ROOM_MAX_SIZE + 2 or height < ROOM_MAX_SIZE + 2:
+        raise argparse.ArgumentTypeError('the map must have room for a room')
+    return (width, height)
+
+
+player = None  # (until a game is started or loaded, e.g. in the level generator's worker)
+dungeon_level = 1
+rng = 0  # libtcod's default random number generator, until seed_game is called
+controller = None  # plays instead of the keyboard and mouse when running headless
+turn_limit = math.inf  # the turn a headless game stops at
+autosaver = None
+profiler = FrameProfiler()
+level_generator = None  # makes the next level in the background, when running as the game
+recorder = None  # writes down the inputs of the game being played, to replay it
+killed_by = None  # the name of what killed the player, once they're dead
+item_uses = Counter()  # how many items of each name were used up, since the game started
+level_store = LevelStore()  # (in a temporary directory, unless running as the game)
+game_msgs = MessageLog(MSG_WIDTH, MSG_HEIGHT)  # (its history in a temporary file, unless running as the game)
+con = libtcod.console_new(VIEW_WIDTH, VIEW_HEIGHT)  # (the part of the map in view)
 panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
 
-main_menu()
\ No newline at end of file
+if __name__ == '__main__':  # (the headless tools import this module without opening a window)
+    parser = argparse.ArgumentParser(description='Tombs of the Ancient Kings.')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='when quitting, write the frame timings to FILE (every frame in a .csv, or a JSON summary)')
+    parser.add_argument('--map-size', metavar='WxH', type=map_size, default=(MAP_WIDTH, MAP_HEIGHT),
+                        help='size of the levels, like 1000x1000 (the screen scrolls over bigger maps than itself)')
+    parser.add_argument('--replay', metavar='FILE', nargs='+',
+                        help='play recorded games again without a window, and check that they end the same')
+    args = parser.parse_args()
+    (MAP_WIDTH, MAP_HEIGHT) = args.map_size
+    if args.replay:
+        passed = check_replays(args.replay)
+        if args.profile:
+            profiler.write(args.profile)
+        sys.exit(0 if passed else 1)
+
+    autosaver = Autosaver(SAVE_FILE)
+    level_generator = LevelGenerator(generate_level)
+    level_store = LevelStore(LEVELS_DIRECTORY)
+    game_msgs = MessageLog(MSG_WIDTH, MSG_HEIGHT, HISTORY_FILE)
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'cool game', False)
+    libtcod.sys_set_fps(LIMIT_FPS)
+    main_menu()
+    level_generator.shutdown()
+    if args.profile:
+        profiler.write(args.profile)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class LevelGenerator:
+    # generates the next level in a worker process while the current one is played, so taking
+    # the stairs doesn't wait for it. generate(seed, *args) must build the level from its
+    # arguments alone, and return plain values that can be sent back from the worker.
+    def __init__(self, generate):
+        self.generate = generate
+        # a fresh interpreter rather than a fork, which would copy the window and the libtcod state
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        self.pending = None  # the arguments of the level being generated, and its future
+
+    def prefetch(self, *args):
+        # start generating the level for these arguments, dropping the one that was being generated
+        self.cancel()
+        try:
+            self.pending = (args, self.executor.submit(self.generate, *args))
+        except RuntimeError:  # the worker died earlier: every level is generated synchronously from now on
+            pass
+
+    def take(self, *args):
+        # the level generated for these arguments, if it's ready. otherwise None (and the caller
+        # generates it itself): waiting for a worker that may have only just started would be no quicker
+        if self.pending is None:
+            return None
+        (pending_args, future) = self.pending
+        self.pending = None
+        if pending_args != args or not future.done():
+            future.cancel()
+            return None
+        try:
+            return future.result()
+        except Exception:  # the worker failed (or died), the level is generated here instead
+            return None
+
+    def cancel(self):
+        if self.pending is not None:
+            self.pending[1].cancel()
+            self.pending = None
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,111 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from savefile import decode, encode
+
+LEVEL_SUFFIX = '.lvl'
+GAME_PREFIX = 'game-'  # each game keeps its levels in a directory of its own, named like this
+LEVEL_MEMORY = 16 * 2 ** 20  # bytes of levels kept in memory, about
+
+
+def level_size(level):
+    # about how many bytes a level takes in memory: its tile arrays, and its entity records
+    return (sum(layer.nbytes for layer in level['tiles'].values()) +
+            sum(sys.getsizeof(record) for record in level['entities']))
+
+
+def game_name():
+    # the name of the directory of a new game's levels
+    return GAME_PREFIX + '%x' % time.time_ns()
+
+
+class LevelStore:
+    # the levels the player has left, so they can be gone back to as they were. the last levels
+    # left stay in memory, as long as they fit in the memory budget; older ones are written to a
+    # file each, in the save file's format, and only read back when the player returns. a level is
+    # a dict of plain values, like a save's snapshot (which is how it's written).
+    # the files go to a directory of the game's own (name) in the root directory, so a new game
+    # doesn't touch the levels of the game saved before it. with no root directory, they go to a
+    # temporary one, removed along with the store.
+    def __init__(self, root=None, name=None, budget=LEVEL_MEMORY):
+        self.root = root
+        self.name = name or game_name()  # (a saved game's, or a new one)
+        self.temp_directory = None
+        self.budget = budget
+        self.levels = OrderedDict()  # dungeon level -> level, least recently left first
+        self.sizes = {}  # dungeon level -> level_size of the ones in memory
+        self.unsaved = set()  # the levels in memory that aren't in their file yet
+
+    @property
+    def directory(self):
+        if self.root is None:
+            self.temp_directory = tempfile.TemporaryDirectory(prefix='levels')
+            self.root = self.temp_directory.name
+        return os.path.join(self.root, self.name)
+
+    def path(self, number):
+        return os.path.join(self.directory, 'level%d%s' % (number, LEVEL_SUFFIX))
+
+    def put(self, number, level):
+        # keep a level the player is leaving. the ones left longest ago go to disk while there are
+        # more than the budget allows (the level itself, if it's bigger than that)
+        self.levels[number] = level
+        self.levels.move_to_end(number)
+        self.sizes[number] = level_size(level)
+        self.unsaved.add(number)
+        while self.levels and sum(self.sizes.values()) > self.budget:
+            (number, level) = self.levels.popitem(last=False)
+            del self.sizes[number]
+            if number in self.unsaved:
+                self.unsaved.remove(number)
+                self.spill(number, level)
+
+    def take(self, number):
+        # the level the player is going back to (it's theirs now, the store forgets it), or None if it was never left
+        level = self.levels.pop(number, None)
+        if level is not None:
+            del self.sizes[number]
+            self.unsaved.discard(number)
+            return level
+        if self.root is None:
+            return None
+        try:
+            with open(self.path(number), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        return decode(data)
+
+    def spill(self, number, level):
+        path = self.path(number)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(encode(level))
+        os.replace(path + '.tmp', path)
+
+    def flush(self):
+        # write the levels kept in memory that aren't in their file yet (keeping them), so the files
+        # have every level left
+        for number in sorted(self.unsaved):
+            self.spill(number, self.levels[number])
+        self.unsaved.clear()
+
+    def clear(self):
+        # forget every level, for a new game. its levels go to a new directory: the files of the
+        # game saved before stay where they are, since the save needs them until the new game is saved
+        self.levels.clear()
+        self.sizes.clear()
+        self.unsaved.clear()
+        self.name = game_name()
+
+    def remove_others(self):
+        # delete the levels of every other game, once this one is saved (and the save names its directory)
+        if self.root is None or not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name.startswith(GAME_PREFIX) and name != self.name:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
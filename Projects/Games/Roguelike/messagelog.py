@@ -0,0 +1,137 @@
+import functools
+import os
+import shutil
+import tempfile
+import textwrap
+
+import libtcodpy as libtcod
+
+HISTORY_PAGE_LINES = 64  # the history file is read from the start of a page of this many lines
+WRAP_CACHE_SIZE = 512
+
+
+class MessageLog:
+    # the game's messages. the last lines, the ones the panel shows, are kept in a ring buffer of
+    # fixed size, so a new line just overwrites the oldest one. every line also goes to the history
+    # file, where the whole game's messages are read back a page at a time, and never kept in memory.
+    # with no history path, the history goes to a temporary file. a new game's history also starts in
+    # one, and only replaces the history file when the game is saved (that one belongs to the game
+    # saved before, until then).
+    def __init__(self, width, height, history_path=None):
+        self.width = width
+        self.lines = [None] * height
+        self.start = 0  # where the oldest line is
+        self.count = 0
+
+        # the same messages come up over and over (attacks, deaths...), so their wrapping is cached
+        self.wrap_cached = functools.lru_cache(maxsize=WRAP_CACHE_SIZE)(self.wrap)
+
+        self.history_path = history_path
+        self.history = None
+        self.history_file = None  # the path of the file the history is written to, None for a temporary file
+        self.open_history(history_path)
+
+    def open_history(self, path):
+        # write the history to a file from now on (a temporary one with no path), reading what it
+        # already holds
+        if self.history is not None:
+            self.history.close()
+        self.history_file = path
+        if path is None:
+            self.history = tempfile.TemporaryFile()
+        else:
+            self.history = open(path, 'a+b')
+        # where each page starts in the file: one number per page, rather than per line
+        self.page_offsets = []
+        self.history_lines = 0
+        self.history_size = 0
+        self.history.seek(0)
+        for line in self.history:  # (an existing history, from the game that was saved)
+            self.count_history_line(len(line))
+
+    def wrap(self, text):
+        if text and len(text) <= self.width and text == text.strip() and text.isprintable():
+            return [text]  # fits on a line as it is
+        return textwrap.wrap(text, self.width)
+
+    def add(self, text, color=libtcod.white):
+        # split the message if necessary, among multiple lines
+        for line in self.wrap_cached(text):
+            self.add_line(line, color)
+
+    def add_line(self, line, color):
+        # a line for the panel, and the history
+        self.show_line(line, color)
+        data = b'%02x%02x%02x %s\n' % (color.r, color.g, color.b, line.encode('utf-8'))
+        self.history.write(data)
+        self.count_history_line(len(data))
+
+    def show_line(self, line, color):
+        # if the buffer is full, the new line takes the place of the oldest one
+        end = (self.start + self.count) % len(self.lines)
+        self.lines[end] = (line, color)
+        if self.count == len(self.lines):
+            self.start = (self.start + 1) % len(self.lines)
+        else:
+            self.count += 1
+
+    def count_history_line(self, size):
+        if self.history_lines % HISTORY_PAGE_LINES == 0:
+            self.page_offsets.append(self.history_size)
+        self.history_lines += 1
+        self.history_size += size
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # the lines in the panel, oldest first, straight from the ring
+        for i in range(self.count):
+            yield self.lines[(self.start + i) % len(self.lines)]
+
+    def history_page(self, first, count):
+        # up to count lines of the whole history, from line number first
+        if first >= self.history_lines or count <= 0:
+            return []
+        self.history.flush()
+        (page, skip) = divmod(first, HISTORY_PAGE_LINES)
+        self.history.seek(self.page_offsets[page])
+        lines = []
+        for data in self.history:
+            if skip:
+                skip -= 1
+                continue
+            color = libtcod.Color(int(data[0:2], 16), int(data[2:4], 16), int(data[4:6], 16))
+            lines.append((data[7:-1].decode('utf-8'), color))
+            if len(lines) == count:
+                break
+        self.history.seek(0, os.SEEK_END)  # (where the next lines are written)
+        return lines
+
+    def restore(self, lines):
+        # put back the lines of the panel (of a loaded game), without adding them to the history again
+        self.start = 0
+        self.count = 0
+        for (line, color) in lines:
+            self.show_line(line, color)
+
+    def clear(self):
+        # forget every message, for a new game. its history starts in a temporary file, until it's saved
+        self.start = 0
+        self.count = 0
+        self.open_history(None)
+
+    def save(self):
+        # the game is being saved: if it's a new game, its history replaces the one of the game saved before
+        if self.history_file == self.history_path:
+            return
+        self.history.flush()
+        self.history.seek(0)
+        with open(self.history_path + '.tmp', 'wb') as file:
+            shutil.copyfileobj(self.history, file)
+        os.replace(self.history_path + '.tmp', self.history_path)
+        self.open_history(self.history_path)
+
+    def reload(self):
+        # go back to the history of the saved game, which is being loaded
+        self.open_history(self.history_path)
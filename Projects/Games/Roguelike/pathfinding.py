@@ -0,0 +1,66 @@
+import numpy as np
+
+# distance of the tiles that can't be reached from any goal
+UNREACHABLE = 2 ** 30
+
+# the 8 directions a step can go in. straight steps come first, so they win ties
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+def distance_map(walkable, goals):
+    # flood outwards from the goal tiles over walkable tiles (a boolean array indexed [x, y]),
+    # every step costing 1, diagonals included. returns an int array, same shape, with the number
+    # of steps from each tile to the nearest goal. it's a Dijkstra map with unit costs, so a plain
+    # breadth-first search builds it in one pass over the map.
+    (width, height) = walkable.shape
+
+    # work on a flat list with a border of unwalkable tiles, so neighbours never fall off the map
+    stride = height + 2
+    padded = np.zeros((width + 2, height + 2), dtype=bool)
+    padded[1:-1, 1:-1] = walkable
+    passable = padded.ravel().tolist()
+    offsets = [dx * stride + dy for (dx, dy) in DIRECTIONS]
+
+    distance = [UNREACHABLE] * len(passable)
+    frontier = []
+    for (x, y) in goals:
+        i = (x + 1) * stride + y + 1
+        if distance[i] != 0:
+            distance[i] = 0
+            frontier.append(i)
+
+    steps = 0
+    while frontier:
+        steps += 1
+        next_frontier = []
+        for i in frontier:
+            for offset in offsets:
+                j = i + offset
+                if passable[j] and distance[j] == UNREACHABLE:
+                    distance[j] = steps
+                    next_frontier.append(j)
+        frontier = next_frontier
+
+    return np.array(distance, dtype=np.int32).reshape(width + 2, height + 2)[1:-1, 1:-1]
+
+
+def step_downhill(distance, x, y, is_free, origin=(0, 0)):
+    # the step (dx, dy) to the neighbour of (x, y) that is closest to a goal of the distance map,
+    # among the ones for which is_free(x, y) is true. None if no free neighbour gets any closer.
+    # the distance map may only cover the part of the map from origin on: (x, y) and the tiles
+    # given to is_free are still map coordinates, and there's no step from outside that part
+    (ox, oy) = origin
+    x -= ox
+    y -= oy
+    (width, height) = distance.shape
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+    best = distance[x, y]
+    step = None
+    for (dx, dy) in DIRECTIONS:
+        nx = x + dx
+        ny = y + dy
+        if 0 <= nx < width and 0 <= ny < height and distance[nx, ny] < best and is_free(nx + ox, ny + oy):
+            best = distance[nx, ny]
+            step = (dx, dy)
+    return step
@@ -0,0 +1,85 @@
+import csv
+import json
+import time
+from array import array
+
+PROFILE_WINDOW = 200  # frames the rolling percentiles are taken over
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, q):
+    # the nearest-rank percentile q (0-100) of some values, 0 if there are none
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, -(-q * len(ordered) // 100) - 1))]
+
+
+class FrameProfiler:
+    # times the phases of every frame. a frame is split in phases by laps: lap(name) gives the
+    # time since the previous lap (or the start of the frame) to the phase with that name.
+    # every frame's times are kept, compactly, to be written to a file at the end; the last
+    # PROFILE_WINDOW frames give the rolling percentiles shown in the overlay. a profiler that isn't
+    # enabled doesn't time anything (for long batch runs, which would pile up the times of every frame)
+    def __init__(self, window=PROFILE_WINDOW, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.samples = {}  # phase -> array of its time (seconds) in each frame, 0 where it didn't run
+        self.frames = 0
+        self.frame = None  # the times of the frame in progress
+        self.last = None
+        self.overlay = False  # show the percentiles in the panel
+
+    def start_frame(self):
+        if not self.enabled:
+            return
+        self.frame = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        if self.frame is None:
+            return  # (outside of a frame, like in the main menu)
+        now = time.perf_counter()
+        self.frame[phase] = self.frame.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if self.frame is None:
+            return
+        for phase in self.frame:
+            if phase not in self.samples:  # a phase seen for the first time didn't run in the frames before
+                self.samples[phase] = array('d', bytes(8 * self.frames))
+        for (phase, samples) in self.samples.items():
+            samples.append(self.frame.get(phase, 0.0))
+        self.frames += 1
+        self.frame = None
+
+    def rolling(self, phase):
+        # the percentiles of a phase's time over the last frames, in seconds
+        recent = self.samples[phase][-self.window:]
+        return [percentile(recent, q) for q in PERCENTILES]
+
+    def summary(self):
+        # for each phase, over every frame: mean, percentiles and maximum, in milliseconds
+        result = {}
+        for (phase, samples) in self.samples.items():
+            stats = {'mean': sum(samples) / len(samples) * 1000}
+            for q in PERCENTILES:
+                stats['p%d' % q] = percentile(samples, q) * 1000
+            stats['max'] = max(samples) * 1000
+            result[phase] = stats
+        return result
+
+    def write(self, path):
+        # a .csv file gets the time of every phase in every frame (in milliseconds), anything else
+        # the summary as JSON
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                phases = list(self.samples)
+                writer.writerow(['frame'] + phases)
+                for frame in range(self.frames):
+                    writer.writerow([frame] + ['%.4f' % (self.samples[phase][frame] * 1000) for phase in phases])
+        else:
+            with open(path, 'w') as file:
+                json.dump({'frames': self.frames, 'phases': self.summary()}, file, indent=2)
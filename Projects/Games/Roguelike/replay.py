@@ -0,0 +1,90 @@
+import json
+import os
+
+import libtcodpy as libtcod
+
+# a replay is a JSON file: the game's seed and map size, then every input of the game, in order.
+# an input is a list starting with its kind:
+#   ['key', vk, c]     a key press that went to handle_keys
+#   ['choice', index]  the option chosen in a menu (None if it was closed)
+#   ['target', x, y]   the tile picked when targeting (None, None if cancelled)
+# it ends with the number of turns played and the hash of the game state at the end
+REPLAY_VERSION = 1
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Recorder:
+    # writes down the inputs of a game as it's played. with the seed, that's all it takes to play
+    # the same game again, since everything else comes from the game's random numbers
+    def __init__(self, seed, width, height):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.events = []
+
+    def key(self, key):
+        self.events.append(['key', key.vk, key.c])
+
+    def choice(self, index):
+        self.events.append(['choice', index])
+
+    def target(self, x, y):
+        self.events.append(['target', x, y])
+
+    def write(self, path, turns, state_hash):
+        data = {'version': REPLAY_VERSION, 'seed': self.seed, 'width': self.width, 'height': self.height,
+                'events': self.events, 'turns': turns, 'hash': state_hash}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+
+def read_replay(path):
+    with open(path) as file:
+        try:
+            replay = json.load(file)
+        except ValueError:
+            raise ReplayError('not a replay')
+    if not isinstance(replay, dict) or replay.get('version') != REPLAY_VERSION:
+        raise ReplayError('not a replay, or an unsupported version')
+    return replay
+
+
+class ReplayController:
+    # plays back the inputs of a recorded game, as the controller of game.play_headless. if the game
+    # asks for another kind of input than the next one recorded, or for more than were recorded, it
+    # didn't go like the recorded game. after the last key, it quits
+    def __init__(self, events):
+        self.events = events
+        self.position = 0
+
+    def next_event(self, kind):
+        if self.position == len(self.events):
+            if kind == 'key':
+                return None
+            raise ReplayError('the game asked for a %s after the last input' % kind)
+        event = self.events[self.position]
+        if event[0] != kind:
+            raise ReplayError('input %d: the game asked for a %s, the replay has a %s' % (self.position, kind, event[0]))
+        self.position += 1
+        return event[1:]
+
+    def next_key(self):
+        key = libtcod.Key()
+        event = self.next_event('key')
+        if event is None:
+            key.vk = libtcod.KEY_ESCAPE
+        else:
+            (key.vk, key.c) = event
+        return key
+
+    def choose(self, header, options):
+        return self.next_event('choice')[0]
+
+    def choose_target(self, max_range):
+        (x, y) = self.next_event('target')
+        return (x, y)
@@ -0,0 +1,155 @@
+import libtcodpy as libtcod
+
+ROOM_BIN_SIZE = 16  # rooms are binned in squares of this many tiles, to find the ones near a spot
+ROOM_NEIGHBOURS = 4  # the closest rooms each room may be connected to
+ROOM_SEARCH_RINGS = 4  # how many rings of bins around a room are searched for its closest rooms, at most
+ROOM_LOOP_CHANCE = 20  # chance (%) that a connection to a close room, not needed to reach it, is made anyway
+
+
+class Rect:
+    # a rectangle on the map. used to characterize a room.
+    def __init__(self, x, y, w, h):
+        self.x1 = x
+        self.y1 = y
+        self.x2 = x + w
+        self.y2 = y + h
+
+    def center(self):
+        center_x = (self.x1 + self.x2) // 2
+        center_y = (self.y1 + self.y2) // 2
+        return (center_x, center_y)
+
+    def intersect(self, other):
+        # returns true if this rectangle intersects with another one
+        return (self.x1 <= other.x2 and self.x2 >= other.x1 and
+                self.y1 <= other.y2 and self.y2 >= other.y1)
+
+
+class RoomBins:
+    # the rooms placed so far, each kept in the bins (squares of the map) it covers. a new room can
+    # only intersect the rooms of the bins it covers itself, so checking it doesn't mean going
+    # through every room of the level
+    def __init__(self, size=ROOM_BIN_SIZE):
+        self.size = size
+        self.bins = {}
+
+    def covered(self, x1, y1, x2, y2):
+        # the bins with some of the tiles from (x1, y1) to (x2, y2), included
+        for bx in range(x1 // self.size, x2 // self.size + 1):
+            for by in range(y1 // self.size, y2 // self.size + 1):
+                yield (bx, by)
+
+    def add(self, index, room):
+        for key in self.covered(room.x1, room.y1, room.x2, room.y2):
+            self.bins.setdefault(key, []).append((index, room))
+
+    def intersects(self, room):
+        for key in self.covered(room.x1, room.y1, room.x2, room.y2):
+            for (_, other) in self.bins.get(key, ()):
+                if room.intersect(other):
+                    return True
+        return False
+
+    def near(self, x, y, rings):
+        # the indices of the rooms in the bins up to a number of rings of bins around the tile (x, y)
+        (bx, by) = (x // self.size, y // self.size)
+        found = set()
+        for nx in range(bx - rings, bx + rings + 1):
+            for ny in range(by - rings, by + rings + 1):
+                for (index, _) in self.bins.get((nx, ny), ()):
+                    found.add(index)
+        return found
+
+
+class UnionFind:
+    # which of n things are connected, as links between them are added one by one
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.components = n
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]  # (halve the path on the way)
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        # connect i and j. returns false if they already were
+        (i, j) = (self.find(i), self.find(j))
+        if i == j:
+            return False
+        if self.size[i] < self.size[j]:
+            (i, j) = (j, i)
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        self.components -= 1
+        return True
+
+
+def place_rooms(width, height, attempts, min_size, max_size, rng=0):
+    # rectangles of random sizes at random spots of a map, any that would intersect one placed
+    # before being dropped. returns them in the order they were placed
+    rooms = []
+    bins = RoomBins()
+    for _ in range(attempts):
+        # random width and height
+        w = libtcod.random_get_int(rng, min_size, max_size)
+        h = libtcod.random_get_int(rng, min_size, max_size)
+        # random position without going out of the boundaries of the map
+        x = libtcod.random_get_int(rng, 0, width - w - 1)
+        y = libtcod.random_get_int(rng, 0, height - h - 1)
+
+        room = Rect(x, y, w, h)
+        if not bins.intersects(room):
+            bins.add(len(rooms), room)
+            rooms.append(room)
+    return (rooms, bins)
+
+
+def distance_sq(room, other):
+    ((x1, y1), (x2, y2)) = (room.center(), other.center())
+    return (x1 - x2) ** 2 + (y1 - y2) ** 2
+
+
+def connect_rooms(rooms, bins, rng=0):
+    # the pairs of rooms (indices) to join with tunnels, so that every room can be reached: a minimum
+    # spanning tree over each room's closest neighbours, plus some of the other neighbour links, for
+    # loops. the neighbours are found in the bins around each room, so this stays close to linear in
+    # the number of rooms
+    candidates = set()
+    for (i, room) in enumerate(rooms):
+        (x, y) = room.center()
+        # look further out where the rooms are sparse
+        rings = 1
+        found = bins.near(x, y, rings)
+        while len(found) <= ROOM_NEIGHBOURS and rings < ROOM_SEARCH_RINGS:
+            rings += 1
+            found = bins.near(x, y, rings)
+        near = sorted((distance_sq(room, rooms[j]), j) for j in found if j != i)
+        for (_, j) in near[:ROOM_NEIGHBOURS]:
+            candidates.add((min(i, j), max(i, j)))
+    candidates = sorted(candidates, key=lambda link: (distance_sq(rooms[link[0]], rooms[link[1]]), link))
+
+    # Kruskal: the shortest links first, skipping those between rooms already connected
+    connected = UnionFind(len(rooms))
+    links = []
+    for (i, j) in candidates:
+        if connected.union(i, j):
+            links.append((i, j))
+        elif libtcod.random_get_int(rng, 1, 100) <= ROOM_LOOP_CHANCE:
+            links.append((i, j))
+
+    # rooms far from the others can be left in groups that aren't connected: join the smallest group
+    # to the closest room outside of it until there's only one
+    while connected.components > 1:
+        groups = {}
+        for i in range(len(rooms)):
+            groups.setdefault(connected.find(i), []).append(i)
+        group = min(groups.values(), key=len)
+        root = connected.find(group[0])
+        (_, i, j) = min((distance_sq(rooms[i], rooms[j]), i, j) for i in group
+                        for j in range(len(rooms)) if connected.find(j) != root)
+        connected.union(i, j)
+        links.append((min(i, j), max(i, j)))
+    return links
@@ -0,0 +1,192 @@
+import heapq
+
+from pathfinding import UNREACHABLE, distance_map, step_downhill
+from rooms import UnionFind
+
+CLUSTER_SIZE = 16  # the map is cut into squares of this many tiles, the rooms of the route graph
+
+
+class RouteGraph:
+    # finds the way between tiles far apart without searching all the tiles in between: the map
+    # is cut into clusters, and the tiles where a step goes from one cluster to the next are
+    # portals. a route is found by an A* search over the portals, and then followed tile by tile
+    # inside one cluster at a time. the distances between the portals of a cluster are only
+    # measured the first time a route goes through it, and kept for the next routes
+    def __init__(self, walkable, size=CLUSTER_SIZE):
+        self.walkable = walkable  # boolean array indexed [x, y]
+        self.size = size
+        (self.width, self.height) = walkable.shape
+        self.nodes = []  # the tile of each portal
+        self.node_at = {}  # and the other way around
+        self.crossings = []  # for each portal, the portals of other clusters a step away
+        self.cluster_nodes = {}  # the portals in each cluster
+        self.cluster_maps = {}  # the distance maps from each portal over its cluster, once measured
+        self.links = {}  # and from them, for each portal, the others of its cluster it reaches, and how far
+        self.find_portals()
+
+    def cluster(self, x, y):
+        return (x // self.size, y // self.size)
+
+    def bounds(self, cluster):
+        # the corners (x1, y1) and (x2, y2), exclusive, of a cluster's tiles
+        (cx, cy) = cluster
+        return (cx * self.size, cy * self.size,
+                min(self.width, (cx + 1) * self.size), min(self.height, (cy + 1) * self.size))
+
+    def add_node(self, x, y):
+        node = self.node_at.get((x, y))
+        if node is None:
+            node = len(self.nodes)
+            self.nodes.append((x, y))
+            self.node_at[(x, y)] = node
+            self.crossings.append([])
+            self.cluster_nodes.setdefault(self.cluster(x, y), []).append(node)
+        return node
+
+    def add_crossing(self, a, b):
+        # portals on both sides of a step from one cluster to another
+        (a, b) = (self.add_node(*a), self.add_node(*b))
+        self.crossings[a].append(b)
+        self.crossings[b].append(a)
+
+    def find_portals(self):
+        walkable = self.walkable
+        size = self.size
+        # along the borders between clusters side by side, then one above the other (the same,
+        # with x and y swapped). the steps across a border are grouped when the tiles they go from
+        # are next to each other and so are the tiles they go to, so every step of a group joins
+        # the same parts of the two clusters: each group gets one crossing, in its middle,
+        # straight across if it can be
+        for (lines, tile) in ((walkable, lambda a, b: (a, b)), (walkable.T, lambda a, b: (b, a))):
+            (across, length) = lines.shape
+            for near in range(size - 1, across - 1, size):
+                far = near + 1
+                (near_line, far_line) = (lines[near].tolist(), lines[far].tolist())
+                for start in range(0, length, size):
+                    end = min(length, start + size)
+                    steps = [(i, j) for i in range(start, end) if near_line[i]
+                             for j in (i, i - 1, i + 1) if start <= j < end and far_line[j]]
+                    groups = UnionFind(len(steps))
+                    for (a, (i, j)) in enumerate(steps):
+                        for b in range(a - 1, -1, -1):
+                            if i - steps[b][0] > 1:
+                                break
+                            if abs(j - steps[b][1]) <= 1:
+                                groups.union(a, b)
+                    members = {}
+                    for a in range(len(steps)):
+                        members.setdefault(groups.find(a), []).append(steps[a])
+                    for group in members.values():
+                        straight = [(i, j) for (i, j) in group if i == j] or group
+                        (i, j) = straight[len(straight) // 2]
+                        self.add_crossing(tile(near, i), tile(far, j))
+        # the diagonal steps across the corner where four clusters meet
+        for x in range(size, self.width, size):
+            for y in range(size, self.height, size):
+                for (a, b) in (((x - 1, y - 1), (x, y)), ((x, y - 1), (x - 1, y))):
+                    if walkable[a] and walkable[b]:
+                        self.add_crossing(a, b)
+
+    def local_distance(self, cluster, x, y):
+        # the number of steps from a tile to every tile of its cluster, without leaving it
+        (x1, y1, x2, y2) = self.bounds(cluster)
+        return distance_map(self.walkable[x1:x2, y1:y2], [(x - x1, y - y1)])
+
+    def portal_maps(self, cluster):
+        maps = self.cluster_maps.get(cluster)
+        if maps is None:
+            (x1, y1, _, _) = self.bounds(cluster)
+            nodes = self.cluster_nodes.get(cluster, ())
+            maps = {}
+            for node in nodes:
+                distance = self.local_distance(cluster, *self.nodes[node])
+                maps[node] = distance
+                self.links[node] = []
+                for other in nodes:
+                    (x, y) = self.nodes[other]
+                    if other != node and distance[x - x1, y - y1] < UNREACHABLE:
+                        self.links[node].append((other, int(distance[x - x1, y - y1])))
+            self.cluster_maps[cluster] = maps
+        return maps
+
+    def inside(self, node, cluster):
+        # the other portals of a portal's cluster it can reach without leaving it, and how far
+        if node not in self.links:
+            self.portal_maps(cluster)
+        return self.links[node]
+
+    def route(self, x, y, goal_x, goal_y):
+        # the tiles a route from (x, y) to (goal_x, goal_y) goes through: the portals, then the goal.
+        # the steps between two of them are all in one cluster. None if there's no way there
+        start_cluster = self.cluster(x, y)
+        goal_cluster = self.cluster(goal_x, goal_y)
+        (gx1, gy1, _, _) = self.bounds(goal_cluster)
+        to_goal = self.local_distance(goal_cluster, goal_x, goal_y)
+        start = len(self.nodes)
+        goal = start + 1
+
+        def neighbours(node):
+            if node == start:
+                (x1, y1, _, _) = self.bounds(start_cluster)
+                for (other, distance) in self.portal_maps(start_cluster).items():
+                    if distance[x - x1, y - y1] < UNREACHABLE:
+                        yield (other, int(distance[x - x1, y - y1]))
+                (tx, ty) = (x, y)
+            else:
+                cluster = self.cluster(*self.nodes[node])
+                for other in self.crossings[node]:
+                    yield (other, 1)
+                yield from self.inside(node, cluster)
+                (tx, ty) = self.nodes[node]
+            if self.cluster(tx, ty) == goal_cluster and to_goal[tx - gx1, ty - gy1] < UNREACHABLE:
+                yield (goal, int(to_goal[tx - gx1, ty - gy1]))
+
+        def estimate(node):
+            # no route is shorter than the straight line, diagonals included
+            (tx, ty) = self.nodes[node] if node < start else (x, y)
+            return max(abs(tx - goal_x), abs(ty - goal_y))
+
+        steps = {start: 0}
+        came_from = {}
+        done = set()
+        queue = [(estimate(start), start)]
+        while queue:
+            (_, node) = heapq.heappop(queue)
+            if node in done:
+                continue  # (it was queued again, closer)
+            done.add(node)
+            if node == goal:
+                path = [(goal_x, goal_y)]
+                node = came_from[goal]
+                while node != start:
+                    path.append(self.nodes[node])
+                    node = came_from[node]
+                path.reverse()
+                return path
+            for (other, cost) in neighbours(node):
+                total = steps[node] + cost
+                if total < steps.get(other, UNREACHABLE):
+                    steps[other] = total
+                    came_from[other] = node
+                    heapq.heappush(queue, (total + (estimate(other) if other != goal else 0), other))
+        return None
+
+    def step(self, x, y, goal_x, goal_y, is_free):
+        # the step (dx, dy) from (x, y) on the way to (goal_x, goal_y), among the ones for which
+        # is_free(x, y) is true, like step_downhill. None if there's no way there or it's taken
+        path = self.route(x, y, goal_x, goal_y)
+        if path is None or path[-1] == (x, y):
+            return None
+        (nx, ny) = [tile for tile in path if tile != (x, y)][0]
+        cluster = self.cluster(x, y)
+        if self.cluster(nx, ny) != cluster:
+            # the other side of a crossing, a step away
+            return (nx - x, ny - y) if is_free(nx, ny) else None
+        # towards the next tile of the route, through the cluster
+        node = self.node_at.get((nx, ny))
+        if node is not None:
+            distance = self.portal_maps(cluster)[node]
+        else:
+            distance = self.local_distance(cluster, nx, ny)
+        (x1, y1, _, _) = self.bounds(cluster)
+        return step_downhill(distance, x, y, is_free, (x1, y1))
@@ -0,0 +1,340 @@
+import os
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# a save file is a header followed by tagged sections:
+#   STRS  the string table, every string in the save is stored once, and referred to by index
+#   META  named game-wide values (dungeon level, game state...), each an int or a string
+#   TILE  the map's boolean layers, 8 tiles to a byte
+#   ENTS  one fixed-size record per entity
+#   MSGS  the message log, text and color
+# a save can be followed by a journal: a file of changes made since, appended one after the other.
+# each change uses the same format, with two more sections instead of TILE:
+#   ORDR  the uids of all the entities, in order (ENTS only has the records that changed)
+#   TCHG  for each tile layer, the (flat) indices of the tiles that flipped
+SAVE_MAGIC = b'RGSV'
+SAVE_VERSION = 3  # 2: entity uids, journals. 3: render layers
+JOURNAL_SUFFIX = '.journal'
+
+HEADER = struct.Struct('<4sHH')  # magic, version, number of sections
+SECTION = struct.Struct('<4sI')  # tag, length of what follows
+COUNT = struct.Struct('<I')
+STRING_LENGTH = struct.Struct('<H')
+META_VALUE = struct.Struct('<iBq')  # name, type (0: int, 1: string), value (or string index)
+TILE_LAYERS = struct.Struct('<IIB')  # width, height, number of layers
+TILE_CHANGES = struct.Struct('<iI')  # layer name, number of tiles that flipped
+MESSAGE = struct.Struct('<iBBB')  # text, color
+
+# the fields of an entity record, in file order, with their struct codes. string fields
+# are stored as an index in the string table, -1 standing for None
+ENTITY_FIELDS = [
+    ('uid', 'I'), ('x', 'i'), ('y', 'i'), ('char', 'i'), ('name', 'i'), ('r', 'B'), ('g', 'B'), ('b', 'B'),
+    ('flags', 'H'), ('speed', 'h'),
+    ('hp', 'i'), ('base_max_hp', 'i'), ('base_defense', 'i'), ('base_power', 'i'), ('xp', 'i'),
+    ('death_function', 'i'),
+    ('ai', 'i'), ('ai_turns', 'h'), ('old_ai', 'i'), ('old_ai_turns', 'h'),
+    ('use_function', 'i'),
+    ('slot', 'i'), ('power_bonus', 'h'), ('defense_bonus', 'h'), ('max_hp_bonus', 'h'), ('wearer', 'i'),
+    ('layer', 'B'),
+]
+ENTITY = struct.Struct('<' + ''.join(code for (name, code) in ENTITY_FIELDS))
+EntityRecord = namedtuple('EntityRecord', [name for (name, code) in ENTITY_FIELDS])
+STRING_FIELDS = ('char', 'name', 'death_function', 'ai', 'old_ai', 'use_function', 'slot')
+STRING_INDICES = [EntityRecord._fields.index(name) for name in STRING_FIELDS]
+
+# bits of EntityRecord.flags
+BLOCKS = 1
+ALWAYS_VISIBLE = 2
+HAS_FIGHTER = 4
+HAS_ITEM = 8
+HAS_EQUIPMENT = 16
+EQUIPPED = 32
+IN_INVENTORY = 64
+CARRIED = 128  # worn by a monster: neither on the map nor in the inventory
+
+
+class SaveFormatError(Exception):
+    # the file isn't a save, or was written by an incompatible version
+    pass
+
+
+class StringTable:
+    # collects the strings of a save while it's being encoded, giving each one an index
+    def __init__(self):
+        self.strings = []
+        self.indices = {}
+
+    def index(self, string):
+        if string is None:
+            return -1
+        i = self.indices.get(string)
+        if i is None:
+            i = len(self.strings)
+            self.strings.append(string)
+            self.indices[string] = i
+        return i
+
+    def encode(self):
+        parts = [COUNT.pack(len(self.strings))]
+        for string in self.strings:
+            data = string.encode('utf-8')
+            parts.append(STRING_LENGTH.pack(len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+
+def encode(snapshot):
+    # turn a snapshot into the bytes of a save file. a snapshot is a dict with:
+    #   'meta': dict of name -> int or str
+    #   'tiles': dict of name -> boolean array, all the same shape (optional)
+    #   'entities': list of EntityRecord, with strings (or None) in the string fields
+    #   'messages': list of (text, (r, g, b))
+    # plus, for the changes written to a journal, 'order' (list of uids) and 'tile_changes'
+    # (dict of name -> array of flat indices)
+    strings = StringTable()
+    sections = []
+
+    meta = snapshot.get('meta', {})
+    parts = [COUNT.pack(len(meta))]
+    for (name, value) in meta.items():
+        if isinstance(value, str):
+            parts.append(META_VALUE.pack(strings.index(name), 1, strings.index(value)))
+        else:
+            parts.append(META_VALUE.pack(strings.index(name), 0, value))
+    sections.append((b'META', b''.join(parts)))
+
+    tiles = snapshot.get('tiles')
+    if tiles:
+        (width, height) = next(iter(tiles.values())).shape
+        parts = [TILE_LAYERS.pack(width, height, len(tiles))]
+        for (name, layer) in tiles.items():
+            parts.append(COUNT.pack(strings.index(name)))
+            parts.append(np.packbits(layer, axis=None).tobytes())
+        sections.append((b'TILE', b''.join(parts)))
+
+    tile_changes = snapshot.get('tile_changes')
+    if tile_changes is not None:
+        parts = [COUNT.pack(len(tile_changes))]
+        for (name, flipped) in tile_changes.items():
+            parts.append(TILE_CHANGES.pack(strings.index(name), len(flipped)))
+            parts.append(np.asarray(flipped, dtype='<u4').tobytes())
+        sections.append((b'TCHG', b''.join(parts)))
+
+    order = snapshot.get('order')
+    if order is not None:
+        sections.append((b'ORDR', COUNT.pack(len(order)) + np.asarray(order, dtype='<u4').tobytes()))
+
+    entities = snapshot.get('entities', [])
+    parts = [COUNT.pack(len(entities))]
+    for record in entities:
+        values = list(record)
+        for i in STRING_INDICES:
+            values[i] = strings.index(values[i])
+        parts.append(ENTITY.pack(*values))
+    sections.append((b'ENTS', b''.join(parts)))
+
+    messages = snapshot.get('messages', [])
+    parts = [COUNT.pack(len(messages))]
+    for (text, (r, g, b)) in messages:
+        parts.append(MESSAGE.pack(strings.index(text), r, g, b))
+    sections.append((b'MSGS', b''.join(parts)))
+
+    # the string table goes first, so everything after it can be decoded in one pass
+    sections.insert(0, (b'STRS', strings.encode()))
+
+    parts = [HEADER.pack(SAVE_MAGIC, SAVE_VERSION, len(sections))]
+    for (tag, payload) in sections:
+        parts.append(SECTION.pack(tag, len(payload)))
+        parts.append(payload)
+    return b''.join(parts)
+
+
+def decode(data):
+    # the opposite of encode: rebuild a snapshot from the bytes of a save file
+    data = memoryview(data)
+    if len(data) < HEADER.size:
+        raise SaveFormatError('file too short to be a save')
+    (magic, version, num_sections) = HEADER.unpack_from(data, 0)
+    if magic != SAVE_MAGIC:
+        raise SaveFormatError('not a save file')
+    if version != SAVE_VERSION:
+        raise SaveFormatError('unsupported save version ' + str(version))
+
+    snapshot = {'meta': {}, 'entities': [], 'messages': []}
+    strings = []
+    offset = HEADER.size
+    for _ in range(num_sections):
+        (tag, length) = SECTION.unpack_from(data, offset)
+        offset += SECTION.size
+        payload = data[offset:offset + length]
+        offset += length
+
+        if tag == b'STRS':
+            strings = decode_strings(payload)
+        elif tag == b'META':
+            snapshot['meta'] = decode_meta(payload, strings)
+        elif tag == b'TILE':
+            snapshot['tiles'] = decode_tiles(payload, strings)
+        elif tag == b'TCHG':
+            snapshot['tile_changes'] = decode_tile_changes(payload, strings)
+        elif tag == b'ORDR':
+            snapshot['order'] = np.frombuffer(payload, dtype='<u4', offset=COUNT.size).tolist()
+        elif tag == b'ENTS':
+            snapshot['entities'] = decode_entities(payload, strings)
+        elif tag == b'MSGS':
+            snapshot['messages'] = [(strings[text], (r, g, b))
+                                    for (text, r, g, b) in MESSAGE.iter_unpack(payload[COUNT.size:])]
+        # sections with unknown tags are skipped, so newer saves can add some
+    return snapshot
+
+
+def decode_strings(payload):
+    (count,) = COUNT.unpack_from(payload, 0)
+    offset = COUNT.size
+    strings = []
+    for _ in range(count):
+        (length,) = STRING_LENGTH.unpack_from(payload, offset)
+        offset += STRING_LENGTH.size
+        strings.append(str(payload[offset:offset + length], 'utf-8'))
+        offset += length
+    return strings
+
+
+def decode_meta(payload, strings):
+    meta = {}
+    for (name, kind, value) in META_VALUE.iter_unpack(payload[COUNT.size:]):
+        meta[strings[name]] = strings[value] if kind == 1 else value
+    return meta
+
+
+def decode_tiles(payload, strings):
+    (width, height, num_layers) = TILE_LAYERS.unpack_from(payload, 0)
+    offset = TILE_LAYERS.size
+    layer_size = (width * height + 7) // 8
+    tiles = {}
+    for _ in range(num_layers):
+        (name,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        bits = np.frombuffer(payload, dtype=np.uint8, count=layer_size, offset=offset)
+        offset += layer_size
+        tiles[strings[name]] = np.unpackbits(bits, count=width * height).astype(bool).reshape(width, height)
+    return tiles
+
+
+def decode_tile_changes(payload, strings):
+    (num_layers,) = COUNT.unpack_from(payload, 0)
+    offset = COUNT.size
+    tile_changes = {}
+    for _ in range(num_layers):
+        (name, count) = TILE_CHANGES.unpack_from(payload, offset)
+        offset += TILE_CHANGES.size
+        tile_changes[strings[name]] = np.frombuffer(payload, dtype='<u4', count=count, offset=offset).copy()
+        offset += 4 * count
+    return tile_changes
+
+
+def decode_entities(payload, strings):
+    entities = []
+    for values in ENTITY.iter_unpack(payload[COUNT.size:]):
+        values = list(values)
+        for i in STRING_INDICES:
+            values[i] = strings[values[i]] if values[i] >= 0 else None
+        entities.append(EntityRecord(*values))
+    return entities
+
+
+def changes_between(old, new):
+    # the changes that turn the snapshot "old" into "new", to be written to a journal.
+    # None if they don't share the same map, then the whole snapshot has to be saved
+    if old['tiles'].keys() != new['tiles'].keys():
+        return None
+    tile_changes = {}
+    for (name, layer) in new['tiles'].items():
+        if layer.shape != old['tiles'][name].shape:
+            return None
+        flipped = np.flatnonzero(layer != old['tiles'][name])
+        if len(flipped):
+            tile_changes[name] = flipped
+
+    old_records = {record.uid: record for record in old['entities']}
+    return {
+        'meta': new['meta'],
+        'tile_changes': tile_changes,
+        'order': [record.uid for record in new['entities']],
+        'entities': [record for record in new['entities'] if old_records.get(record.uid) != record],
+        'messages': new['messages'],
+    }
+
+
+def apply_changes(snapshot, changes):
+    # the opposite of changes_between: update a snapshot with changes read from a journal
+    for (name, flipped) in changes['tile_changes'].items():
+        snapshot['tiles'][name].flat[flipped] ^= True
+
+    records = {record.uid: record for record in snapshot['entities']}
+    for record in changes['entities']:
+        records[record.uid] = record
+    snapshot['entities'] = [records[uid] for uid in changes['order']]
+    snapshot['meta'] = changes['meta']
+    snapshot['messages'] = changes['messages']
+
+
+def write_save(path, snapshot):
+    # write a snapshot to a file. it's written to a temporary file first, then renamed over the
+    # old save, so a crash half-way leaves the previous save untouched. the save gets a new id,
+    # which is returned: journal entries name the save they apply to, so the ones left over
+    # from an older save are ignored
+    save_id = time.time_ns() & 0x7fffffffffffffff
+    data = encode(dict(snapshot, meta=dict(snapshot['meta'], save_id=save_id)))
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+    # the old journal can go now (if it can't, its entries don't match the new save id anyway)
+    try:
+        os.remove(path + JOURNAL_SUFFIX)
+    except FileNotFoundError:
+        pass
+    return save_id
+
+
+def append_changes(path, save_id, changes):
+    # add changes, made since the save with this id was written, at the end of its journal.
+    # each entry is preceded by its length, so one cut short by a crash is recognized and skipped
+    data = encode(dict(changes, meta=dict(changes['meta'], save_id=save_id)))
+    with open(path + JOURNAL_SUFFIX, 'ab') as file:
+        file.write(COUNT.pack(len(data)) + data)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_save(path):
+    # read a whole save file at once, decode it, then apply whatever its journal holds
+    with open(path, 'rb') as file:
+        data = file.read()
+    snapshot = decode(data)
+
+    try:
+        with open(path + JOURNAL_SUFFIX, 'rb') as file:
+            journal = memoryview(file.read())
+    except FileNotFoundError:
+        return snapshot
+
+    save_id = snapshot['meta'].get('save_id')
+    offset = 0
+    while offset + COUNT.size <= len(journal):
+        (length,) = COUNT.unpack_from(journal, offset)
+        offset += COUNT.size
+        if offset + length > len(journal):
+            break  # the last entry was cut short
+        changes = decode(journal[offset:offset + length])
+        offset += length
+        if changes['meta'].get('save_id') == save_id:
+            apply_changes(snapshot, changes)
+    return snapshot
@@ -0,0 +1,57 @@
+import heapq
+import itertools
+
+# energy spent by one action, and the speed of a normal actor. every tick an actor gains its
+# speed in energy, so at normal speed it can act once every ACTION_COST // NORMAL_SPEED ticks
+ACTION_COST = 100
+NORMAL_SPEED = 10
+
+
+class TurnScheduler:
+    # a priority queue of the actors that are awake, ordered by the tick at which they'll have
+    # gathered enough energy to act. dormant actors aren't in the queue at all, so they cost
+    # nothing until something wakes them up.
+    def __init__(self):
+        self.time = 0
+        self.queue = []  # (tick of the next action, wake-up number, actor)
+        self.awake = {}  # actor -> its wake-up number; queue entries with another number are stale
+        self.wake_ups = itertools.count()
+
+    def is_awake(self, actor):
+        return actor in self.awake
+
+    def wake(self, actor):
+        # start scheduling a dormant actor. it begins with no energy, so its first action
+        # comes after one full wait at its speed
+        if actor in self.awake:
+            return
+        actor.energy = 0
+        self.awake[actor] = next(self.wake_ups)
+        self.schedule(actor)
+
+    def sleep(self, actor):
+        # stop scheduling an actor. its entry stays in the queue, and is skipped when it comes up
+        self.awake.pop(actor, None)
+
+    def schedule(self, actor):
+        # queue the actor's next action, at the first tick where its energy reaches ACTION_COST
+        ticks = max(0, -(-(ACTION_COST - actor.energy) // actor.speed))
+        actor.energy += ticks * actor.speed
+        heapq.heappush(self.queue, (self.time + ticks, self.awake[actor], actor))
+
+    def advance(self, ticks, act):
+        # let time pass, running every action that comes due, in order. act(actor) performs
+        # the action and returns False if the actor should go dormant afterwards
+        end = self.time + ticks
+        while self.queue and self.queue[0][0] <= end:
+            (time, wake_up, actor) = heapq.heappop(self.queue)
+            if self.awake.get(actor) != wake_up:
+                continue  # it fell asleep (and maybe woke up again) since this was queued
+
+            self.time = time
+            actor.energy -= ACTION_COST
+            if act(actor):
+                self.schedule(actor)
+            else:
+                self.sleep(actor)
+        self.time = end
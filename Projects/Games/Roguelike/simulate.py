@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import game
+from bots import Delver, Explorer, RandomWalker
+from levelstore import LevelStore
+from messagelog import MessageLog
+from profiler import PERCENTILES, FrameProfiler, percentile
+
+BOTS = {'delver': Delver, 'explorer': Explorer, 'random': RandomWalker}
+GAMES_PER_TASK = 25  # games a worker plays before sending back their results
+
+
+def setting(text):
+    # a game constant to change for the games, like HEAL_AMOUNT=30 or MAX_MONSTERS=[[2,1],[4,3]]. a spawn
+    # chance table is set for one of its choices, like MONSTER_CHANCES.create_troll=[[30,2]]
+    (name, equals, value) = text.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected NAME=VALUE with a JSON value, not %r' % text)
+    (name, _, choice) = name.partition('.')
+    table = getattr(game, name, None)
+    if not equals or not name.isupper() or table is None:
+        raise argparse.ArgumentTypeError('no game constant called %r' % name)
+    if choice and not (isinstance(table, dict) and choice in [function.__name__ for function in table]):
+        raise argparse.ArgumentTypeError('%s has no choice called %r' % (name, choice))
+    return (name, choice, value)
+
+
+def apply_settings(settings):
+    for (name, choice, value) in settings:
+        if choice:
+            table = getattr(game, name)
+            (function,) = [function for function in table if function.__name__ == choice]
+            table[function] = value
+        else:
+            setattr(game, name, value)
+
+
+def ignore_warnings():
+    # libtcodpy warns about itself and its color constants, which would drown the report
+    warnings.simplefilter('ignore', DeprecationWarning)
+    warnings.simplefilter('ignore', FutureWarning)
+
+
+def setup_worker(settings):
+    ignore_warnings()
+    game.profiler = FrameProfiler(enabled=False)
+    # a forked worker would share the files of the parent's level store and message history with
+    # the other workers, so it gets its own
+    game.level_store = LevelStore()
+    game.game_msgs = MessageLog(game.MSG_WIDTH, game.MSG_HEIGHT)
+    apply_settings(settings)
+
+
+def play_games(seeds, max_turns, bot):
+    # play a headless game per seed, and describe how each one went in plain values
+    results = []
+    for seed in seeds:
+        game.new_game(seed)
+        game.play_headless(BOTS[bot](seed), max_turns)
+        if game.game_state == 'dead':
+            outcome = game.killed_by or 'unknown'
+        else:
+            outcome = 'survived'
+        results.append({'seed': seed, 'depth': game.dungeon_level, 'turns': game.turn, 'level': game.player.level,
+                        'outcome': outcome, 'items': dict(game.item_uses)})
+    return results
+
+
+def simulate(seeds, max_turns, bot, settings, workers):
+    # play the games on a pool of worker processes, a few games per task so they don't wait on each
+    # other. returns the results of every game, in the order of the seeds
+    tasks = [seeds[i:i + GAMES_PER_TASK] for i in range(0, len(seeds), GAMES_PER_TASK)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker, initargs=(settings,)) as executor:
+        for task_results in executor.map(play_games, tasks, repeat(max_turns), repeat(bot)):
+            results.extend(task_results)
+            print('\r%d/%d games' % (len(results), len(seeds)), end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return results
+
+
+def distribution(values):
+    # mean, percentiles and maximum of some numbers
+    stats = {'mean': sum(values) / len(values)}
+    for q in PERCENTILES:
+        stats['p%d' % q] = percentile(values, q)
+    stats['max'] = max(values)
+    return stats
+
+
+def make_report(results):
+    # what the games add up to, as plain values (written as is with --json)
+    games = len(results)
+    items = Counter()
+    games_using = Counter()
+    for result in results:
+        items.update(result['items'])
+        games_using.update(result['items'].keys())
+    return {
+        'games': games,
+        'depth': distribution([result['depth'] for result in results]),
+        'depth_reached': {depth: count for (depth, count) in
+                          sorted(Counter(result['depth'] for result in results).items())},
+        'turns': distribution([result['turns'] for result in results]),
+        'player_level': distribution([result['level'] for result in results]),
+        'outcomes': dict(Counter(result['outcome'] for result in results).most_common()),
+        'items': {name: {'used': count, 'per_game': count / games, 'games': games_using[name]}
+                  for (name, count) in items.most_common()},
+    }
+
+
+def print_report(report):
+    print('%d games' % report['games'])
+    print()
+    print('%-16s %10s' % ('', 'mean') + ''.join('%10s' % ('p%d' % q) for q in PERCENTILES) + '%10s' % 'max')
+    for (label, key) in (('dungeon level', 'depth'), ('turns', 'turns'), ('player level', 'player_level')):
+        stats = report[key]
+        print('%-16s %10.1f' % (label, stats['mean']) + ''.join('%10d' % stats['p%d' % q] for q in PERCENTILES) +
+              '%10d' % stats['max'])
+
+    print()
+    print('deepest level     games')
+    for (depth, count) in report['depth_reached'].items():
+        print('%13d %9d  %5.1f%%' % (depth, count, count * 100 / report['games']))
+
+    print()
+    print('outcome                  games')
+    for (outcome, count) in report['outcomes'].items():
+        print('%-20s %9d  %5.1f%%' % (outcome, count, count * 100 / report['games']))
+
+    print()
+    print('item                          used  per game  games using it')
+    for (name, stats) in report['items'].items():
+        print('%-24s %9d %9.2f %9d' % (name, stats['used'], stats['per_game'], stats['games']))
+
+
+def main():
+    ignore_warnings()
+    parser = argparse.ArgumentParser(description='Balance simulator: plays lots of headless games with a bot, '
+                                                 'on every core, and reports how they went.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--first-seed', type=int, default=0, help='the games use the seeds from this one on')
+    parser.add_argument('--turns', type=int, default=5000, help='maximum turns per game')
+    parser.add_argument('--bot', choices=sorted(BOTS), default='delver')
+    parser.add_argument('--set', metavar='NAME=VALUE', type=setting, action='append', default=[], dest='settings',
+                        help='change a game constant, like HEAL_AMOUNT=30, MAX_MONSTERS=[[2,1],[4,3]] or '
+                             'MONSTER_CHANCES.create_troll=[[30,2]] (can be repeated)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: one per core)')
+    parser.add_argument('--json', metavar='FILE', help='also write the report to FILE')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = simulate(list(range(args.first_seed, args.first_seed + args.games)), args.turns, args.bot,
+                       args.settings, args.workers)
+    elapsed = time.perf_counter() - start
+
+    report = make_report(results)
+    print_report(report)
+    print()
+    print('%d games in %.1f s (%.1f games/s, %d workers)' % (args.games, elapsed, args.games / elapsed, args.workers))
+    if args.json:
+        report['settings'] = {(name + '.' + choice if choice else name): value
+                              for (name, choice, value) in args.settings}
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
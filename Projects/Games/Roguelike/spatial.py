@@ -0,0 +1,112 @@
+import math
+
+
+class SpatialIndex:
+    # maps each tile to the objects standing on it, so finding what is on a tile
+    # doesn't mean walking the whole objects list. the order of objects inside a
+    # tile follows the drawing order (by render layer, the bottom one first).
+    def __init__(self):
+        self.tiles = {}
+
+    def add(self, obj):
+        # start tracking an object at its current coordinates, on top of the others of its layer
+        bucket = self.tiles.setdefault((obj.x, obj.y), [])
+        i = len(bucket)
+        while i > 0 and bucket[i - 1].layer > obj.layer:
+            i -= 1
+        bucket.insert(i, obj)
+
+    def remove(self, obj):
+        # stop tracking an object (it was picked up, destroyed...)
+        key = (obj.x, obj.y)
+        bucket = self.tiles[key]
+        bucket.remove(obj)
+        if not bucket:
+            del self.tiles[key]
+
+    def move(self, obj, x, y):
+        # change an object's coordinates, keeping the index in sync
+        self.remove(obj)
+        obj.x = x
+        obj.y = y
+        self.add(obj)
+
+    def at(self, x, y):
+        # all objects on a tile (empty if there are none)
+        return self.tiles.get((x, y), ())
+
+    def is_blocked(self, x, y):
+        # true if any blocking object stands on the tile
+        for obj in self.tiles.get((x, y), ()):
+            if obj.blocks:
+                return True
+        return False
+
+    def in_radius(self, x, y, radius):
+        # return a list of the objects within a (euclidean) radius of a tile. walks
+        # whichever is smaller: the tiles of the bounding box or the occupied tiles.
+        r = int(radius)
+        radius_sq = radius ** 2
+        found = []
+        if (2 * r + 1) ** 2 <= len(self.tiles):
+            for tx in range(x - r, x + r + 1):
+                for ty in range(y - r, y + r + 1):
+                    bucket = self.tiles.get((tx, ty))
+                    if bucket and (tx - x) ** 2 + (ty - y) ** 2 <= radius_sq:
+                        found.extend(bucket)
+        else:
+            for (tx, ty), bucket in self.tiles.items():
+                if (tx - x) ** 2 + (ty - y) ** 2 <= radius_sq:
+                    found.extend(bucket)
+        return found
+
+    def in_rect(self, x1, y1, x2, y2):
+        # return a list of the objects on the tiles with x1 <= x < x2 and y1 <= y < y2, walking
+        # whichever is smaller, like in_radius
+        found = []
+        if (x2 - x1) * (y2 - y1) <= len(self.tiles):
+            for tx in range(x1, x2):
+                for ty in range(y1, y2):
+                    bucket = self.tiles.get((tx, ty))
+                    if bucket:
+                        found.extend(bucket)
+        else:
+            for (tx, ty), bucket in self.tiles.items():
+                if x1 <= tx < x2 and y1 <= ty < y2:
+                    found.extend(bucket)
+        return found
+
+    def nearest(self, x, y, max_range, predicate=None):
+        # find the object closest to a tile, up to a maximum range, for which the predicate
+        # (if given) is true. like the game always did, anything closer than max_range + 1
+        # counts as in range (so a range of 5 reaches a monster 5.4 tiles away). searches ring
+        # by ring outwards, and stops as soon as no ring further out can hold anything closer
+        # than the best match so far (every object closer than max_range + 1 is on a ring up
+        # to max_range).
+        best = None
+        best_dist = max_range + 1  # start with (slightly more than) maximum range
+        for ring in range(int(math.ceil(max_range)) + 1):
+            if ring >= best_dist:
+                break  # every tile on this ring is at least this far away
+            for (tx, ty) in ring_tiles(x, y, ring):
+                for obj in self.tiles.get((tx, ty), ()):
+                    if predicate is not None and not predicate(obj):
+                        continue
+                    dist = math.sqrt((tx - x) ** 2 + (ty - y) ** 2)
+                    if dist < best_dist:  # it's closer, so remember it
+                        best = obj
+                        best_dist = dist
+        return best
+
+
+def ring_tiles(x, y, ring):
+    # the tiles at exactly "ring" steps (chebyshev distance) from (x, y)
+    if ring == 0:
+        yield (x, y)
+        return
+    for dx in range(-ring, ring + 1):
+        yield (x + dx, y - ring)
+        yield (x + dx, y + ring)
+    for dy in range(-ring + 1, ring):
+        yield (x - ring, y + dy)
+        yield (x + ring, y + dy)
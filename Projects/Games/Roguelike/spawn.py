@@ -0,0 +1,60 @@
+import libtcodpy as libtcod
+
+
+def from_level(table, level):
+    # the value a table gives at a dungeon level. the table lists [value, level] pairs: each value
+    # applies from its level on (until the next one), and before the first it's 0
+    for (value, from_level) in reversed(table):
+        if level >= from_level:
+            return value
+    return 0
+
+
+class AliasTable:
+    # picks one of several choices, each as likely as its (integer) weight, in constant time
+    # however many choices there are (Walker's alias method). every column of the table holds
+    # "total" units, split between one choice and its alias; a pick is a column and a point in it.
+    # choices with no weight are left out, and with none left, sample() returns None
+    def __init__(self, weights):
+        choices = [(choice, weight) for (choice, weight) in weights.items() if weight > 0]
+        self.choices = [choice for (choice, weight) in choices]
+        self.total = sum(weight for (choice, weight) in choices)
+        n = len(choices)
+
+        # scale the weights so that they add up to n columns of "total" units
+        scaled = [weight * n for (choice, weight) in choices]
+        self.threshold = [self.total] * n  # points below this in a column pick its own choice
+        self.alias = list(range(n))  # the choice for the rest of the column
+        small = [i for i in range(n) if scaled[i] < self.total]
+        large = [i for i in range(n) if scaled[i] >= self.total]
+        while small and large:
+            (s, l) = (small.pop(), large[-1])
+            self.threshold[s] = scaled[s]
+            self.alias[s] = l
+            # the large choice fills the rest of the small one's column
+            scaled[l] -= self.total - scaled[s]
+            if scaled[l] < self.total:
+                small.append(large.pop())
+
+    def sample(self, rng=0):
+        if len(self.choices) <= 1:
+            return self.choices[0] if self.choices else None
+        column = libtcod.random_get_int(rng, 0, len(self.choices) - 1)
+        if libtcod.random_get_int(rng, 0, self.total - 1) < self.threshold[column]:
+            return self.choices[column]
+        return self.choices[self.alias[column]]
+
+
+class SpawnTable:
+    # what appears in a room at one dungeon level: up to a maximum number of things, each chosen
+    # by its chance. built from the level-dependent tables once per level, so placing things is
+    # just a few draws. chances is a dict of choice -> table of [chance, level], like from_level's
+    def __init__(self, maximum, chances, level):
+        self.maximum = from_level(maximum, level)
+        self.sampler = AliasTable({choice: from_level(table, level) for (choice, table) in chances.items()})
+
+    def count(self, rng=0):
+        return libtcod.random_get_int(rng, 0, self.maximum)
+
+    def choose(self, rng=0):
+        return self.sampler.sample(rng)
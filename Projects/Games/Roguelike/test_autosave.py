@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from autosave import MAX_JOURNAL_ENTRIES, Autosaver
+from savefile import JOURNAL_SUFFIX, read_save
+
+
+def make_snapshot(turn):
+    explored = np.zeros((8, 5), dtype=bool)
+    explored[:turn % 8] = True
+    return {'meta': {'turn': turn}, 'tiles': {'explored': explored}, 'entities': [], 'messages': []}
+
+
+def test_saves_after_the_first_go_to_the_journal(tmp_path):
+    path = str(tmp_path / 'savegame.sav')
+    autosaver = Autosaver(path)
+    for turn in range(1, 4):
+        autosaver.save(make_snapshot(turn))
+    autosaver.wait()
+    assert (tmp_path / ('savegame.sav' + JOURNAL_SUFFIX)).exists()
+    assert autosaver.journal_entries == 2
+    snapshot = read_save(path)
+    assert snapshot['meta']['turn'] == 3
+    assert np.array_equal(snapshot['tiles']['explored'], make_snapshot(3)['tiles']['explored'])
+
+
+def test_a_full_save_after_too_many_journal_entries(tmp_path):
+    path = str(tmp_path / 'savegame.sav')
+    autosaver = Autosaver(path)
+    for turn in range(MAX_JOURNAL_ENTRIES + 2):
+        autosaver.save(make_snapshot(turn))
+    autosaver.wait()
+    assert autosaver.journal_entries == 0
+    assert read_save(path)['meta']['turn'] == MAX_JOURNAL_ENTRIES + 1
+
+
+def test_wait_raises_the_first_failure(tmp_path):
+    directory = tmp_path / 'saves'
+    autosaver = Autosaver(str(directory / 'savegame.sav'))
+    autosaver.save(make_snapshot(1))  # (the directory isn't there yet)
+    autosaver.executor.submit(directory.mkdir).result()  # (after the first save, before the second)
+    autosaver.save(make_snapshot(2))
+    with pytest.raises(FileNotFoundError):
+        autosaver.wait()
+
+    # the save after the failure was a full one, and the error was only raised once
+    assert read_save(str(directory / 'savegame.sav'))['meta']['turn'] == 2
+    autosaver.wait()
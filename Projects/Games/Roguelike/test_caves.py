@@ -0,0 +1,46 @@
+import numpy as np
+
+from caves import cave_walls, main_cave, neighbour_walls
+from pathfinding import UNREACHABLE, distance_map
+
+
+def test_neighbour_walls_count_outside_the_map_as_wall():
+    walls = np.zeros((3, 3), dtype=bool)
+    walls[1, 1] = True
+    count = neighbour_walls(walls)
+    assert count[1, 1] == 0
+    assert count[0, 0] == 5 + 1  # (5 outside, and the middle)
+    assert count[1, 0] == 3 + 1
+
+
+def test_the_same_seed_grows_the_same_caves():
+    first = cave_walls(60, 40, np.random.default_rng(7))
+    assert np.array_equal(first, cave_walls(60, 40, np.random.default_rng(7)))
+    assert not np.array_equal(first, cave_walls(60, 40, np.random.default_rng(8)))
+    assert first[0, :].all() and first[-1, :].all() and first[:, 0].all() and first[:, -1].all()
+
+
+def test_main_cave_is_the_biggest_one():
+    floor = np.zeros((20, 10), dtype=bool)
+    floor[1:4, 1:4] = True  # a small cave
+    floor[8:19, 2:9] = True  # and a big one
+    for seed in range(5):
+        ((x, y), distance) = main_cave(floor, np.random.default_rng(seed))
+        assert floor[x, y] and 8 <= x
+        reached = distance < UNREACHABLE
+        assert np.array_equal(reached, floor & (np.arange(20) >= 8)[:, None])
+
+
+def test_main_cave_is_connected():
+    for seed in range(5):
+        random = np.random.default_rng(seed)
+        floor = ~cave_walls(80, 50, random)
+        ((x, y), distance) = main_cave(floor, random)
+        reached = distance < UNREACHABLE
+        # every tile of the cave, and only those, can be reached from any of its tiles
+        (other_x, other_y) = np.argwhere(reached)[-1]
+        assert np.array_equal(distance_map(floor, [(int(other_x), int(other_y))]) < UNREACHABLE, reached)
+
+
+def test_no_floor_no_cave():
+    assert main_cave(np.zeros((5, 5), dtype=bool), np.random.default_rng(0)) is None
@@ -0,0 +1,52 @@
+import numpy as np
+
+from fov import FovCache, shadowcast
+
+
+def open_room(width, height):
+    transparent = np.zeros((width, height), dtype=bool)
+    transparent[1:-1, 1:-1] = True
+    return transparent
+
+
+def test_an_open_room_is_all_visible():
+    transparent = open_room(9, 7)
+    assert shadowcast(transparent, 4, 3, 0).all()  # (the walls around it too)
+
+
+def test_the_radius_limits_the_view():
+    visible = shadowcast(np.ones((21, 21), dtype=bool), 10, 10, 3)
+    (xs, ys) = np.nonzero(visible)
+    assert ((xs - 10) ** 2 + (ys - 10) ** 2 <= 9).all()
+    assert visible[13, 10] and visible[10, 7] and not visible[13, 13]
+
+
+def test_walls_cast_shadows():
+    transparent = open_room(11, 7)
+    transparent[5, 1:6] = False  # a wall across the room
+    visible = shadowcast(transparent, 2, 3, 0)
+    assert visible[5, 3]  # (the wall itself is lit)
+    assert not visible[6:10, 1:6].any()
+
+
+def test_walls_are_not_lit_without_light_walls():
+    transparent = open_room(9, 7)
+    visible = shadowcast(transparent, 4, 3, 0, light_walls=False)
+    assert np.array_equal(visible, transparent)
+
+
+def test_cache_reuses_results_and_makes_them_read_only():
+    cache = FovCache(size=2)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.zeros((3, 3), dtype=bool)
+
+    first = cache.get((1, 1, 5, 0), compute)
+    assert cache.get((1, 1, 5, 0), compute) is first
+    assert not first.flags.writeable
+    cache.get((2, 1, 5, 0), compute)
+    cache.get((3, 1, 5, 0), compute)  # (the first result is the least recently used, it goes)
+    cache.get((1, 1, 5, 0), compute)
+    assert (cache.hits, cache.misses, len(calls)) == (1, 4, 4)
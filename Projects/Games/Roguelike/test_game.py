@@ -0,0 +1,213 @@
+import numpy as np
+import pytest
+
+import game
+from autosave import Autosaver
+from bots import Delver, Explorer, RandomWalker
+from levelstore import LevelStore
+from messagelog import MessageLog
+from pathfinding import UNREACHABLE, distance_map
+from savefile import encode
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_snapshots_keep_up_with_the_objects_that_changed(seed):
+    # saves made along the way keep the records of objects that didn't change: in the end, they
+    # must be the same as records all made again
+    game.new_game(seed)
+    bot = Delver(seed)
+    for turns in range(50, 1000, 50):
+        game.play_headless(bot, turns)
+        game.snapshot_game()
+    records = game.snapshot_game()['entities']
+    for obj in game.objects:
+        obj.changed()
+    assert game.snapshot_game()['entities'] == records
+
+
+def play(seed, turns):
+    game.new_game(seed)
+    game.play_headless(RandomWalker(seed), turns)
+    return game.state_hash()
+
+
+def test_the_same_seed_and_bot_play_the_same_game():
+    assert play(4, 500) == play(4, 500)
+    assert play(5, 500) != play(4, 500)
+
+
+@pytest.fixture
+def save_files(tmp_path, monkeypatch):
+    # the save, the levels and the message history in a directory of the test's own, like the game has them
+    monkeypatch.setattr(game, 'SAVE_FILE', str(tmp_path / 'savegame.sav'))
+    monkeypatch.setattr(game, 'autosaver', Autosaver(game.SAVE_FILE))
+    monkeypatch.setattr(game, 'level_store', LevelStore(str(tmp_path / 'levels')))
+    monkeypatch.setattr(game, 'game_msgs', MessageLog(game.MSG_WIDTH, game.MSG_HEIGHT, str(tmp_path / 'messages.log')))
+    yield tmp_path
+    game.autosaver.executor.shutdown()
+
+
+def saved_state():
+    # the game state, but for the uids (the objects made again by loading get new ones)
+    snapshot = game.snapshot_game()
+    snapshot['entities'] = [record._replace(uid=0) for record in snapshot['entities']]
+    return encode(snapshot)
+
+
+def test_a_saved_game_loads_as_it_was(save_files):
+    game.new_game(2)
+    for _ in range(3):
+        game.next_level()  # (so there are levels left behind, in their files)
+    game.save_game()
+    saved = saved_state()
+    levels = {number: game.level_store.take(number) for number in range(1, game.dungeon_level)}
+
+    game.new_game(3)  # (which must not touch the saved game's levels, until it's saved itself)
+    game.load_game()
+    assert saved_state() == saved
+    for (number, level) in levels.items():
+        assert game.level_store.take(number)['entities'] == level['entities']
+
+
+@pytest.fixture
+def no_monsters():
+    max_monsters = game.MAX_MONSTERS
+    game.MAX_MONSTERS = [[0, 1]]
+    yield
+    game.MAX_MONSTERS = max_monsters
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_auto_explore_and_travel_to_the_stairs(no_monsters, seed):
+    game.new_game(seed)
+    game.update_fov()
+    while game.run(game.explore_steps()):  # (until there's nothing left, it only stops for items)
+        pass
+    reachable = distance_map(~game.map.blocked, [(game.player.x, game.player.y)]) < UNREACHABLE
+    assert game.map.explored[reachable].all()
+
+    while game.run(game.stairs_steps()):
+        pass
+    assert (game.player.x, game.player.y) == (game.stairs.x, game.stairs.y)
+
+
+def test_runs_stop_at_the_turn_limit_of_headless_games(no_monsters):
+    game.new_game(0)
+    game.play_headless(Explorer(0), 37)
+    assert game.turn == 37
+
+
+def carry(obj):
+    # give the player an item, like picking it up (without the messages)
+    game.inventory.append(obj)
+    return obj
+
+
+def amulet(x, y):
+    return game.Object(x, y, '"', 'amulet', game.libtcod.gold, equipment=game.Equipment('neck', max_hp_bonus=10))
+
+
+def spawn(obj):
+    game.objects.append(obj)
+    game.object_index.add(obj)
+    return obj
+
+
+def test_equipment_bonuses_follow_what_the_player_wears():
+    game.new_game(0)
+    fighter = game.player.fighter
+    dagger = game.get_equipped_in_slot('right hand')
+    assert (fighter.power, fighter.defense, fighter.max_hp) == (fighter.base_power + 2, fighter.base_defense,
+                                                                fighter.base_max_hp)
+    (sword, shield, neck) = (carry(game.create_sword(0, 0)), carry(game.create_shield(0, 0)), carry(amulet(0, 0)))
+    sword.equipment.equip()
+    assert fighter.power == fighter.base_power + 3
+    shield.equipment.equip()
+    assert fighter.defense == fighter.base_defense + 1
+    neck.equipment.equip()
+    assert not dagger.is_equipped  # (the sword took its slot)
+    assert game.get_equipped_in_slot('right hand') is sword.equipment
+    assert (fighter.power, fighter.defense, fighter.max_hp) == (fighter.base_power + 3, fighter.base_defense + 1,
+                                                                fighter.base_max_hp + 10)
+
+    shield.equipment.dequip()
+    assert game.get_equipped_in_slot('left hand') is None
+    assert fighter.defense == fighter.base_defense
+    neck.item.drop()
+    assert not neck.equipment.is_equipped and neck in game.objects
+    assert fighter.max_hp == fighter.base_max_hp
+    assert set(fighter.equipment_slots) == {'right hand'}
+
+
+def test_equipment_bonuses_of_monsters_and_what_they_drop():
+    game.new_game(0)
+    player_stats = (game.player.fighter.power, game.player.fighter.defense)
+    orc = spawn(game.create_orc(game.player.x, game.player.y))
+    (sword, shield) = (game.create_sword(0, 0), game.create_shield(0, 0))
+    assert orc.fighter.power == 4
+    sword.equipment.equip(orc)
+    shield.equipment.equip(orc)
+    assert sword.equipment.wearer is orc and game.get_equipped_in_slot('right hand', orc) is sword.equipment
+    assert (orc.fighter.power, orc.fighter.defense) == (4 + 3, 0 + 1)
+    assert (game.player.fighter.power, game.player.fighter.defense) == player_stats
+
+    orc.fighter.take_damage(100)
+    assert orc.fighter is None
+    for item in (sword, shield):
+        assert not item.equipment.is_equipped and item.equipment.wearer is None
+        assert item in game.objects and (item.x, item.y) == (orc.x, orc.y)
+    # whoever picks them up gets the bonuses
+    carry(sword).equipment.equip()
+    assert game.player.fighter.power == game.player.fighter.base_power + 3
+
+
+def test_the_slots_and_bonuses_come_back_with_a_saved_game():
+    game.new_game(0)
+    carry(game.create_shield(0, 0)).equipment.equip()
+    orc = spawn(game.create_orc(game.player.x, game.player.y))
+    game.create_sword(0, 0).equipment.equip(orc)
+    stats = [(obj.fighter.power, obj.fighter.defense, obj.fighter.max_hp) for obj in (game.player, orc)]
+
+    game.restore_game(game.snapshot_game())
+    orc = next(obj for obj in game.objects if obj.name == 'orc' and (obj.x, obj.y) == (game.player.x, game.player.y))
+    assert [(obj.fighter.power, obj.fighter.defense, obj.fighter.max_hp) for obj in (game.player, orc)] == stats
+    for obj in (game.player, orc):
+        for (slot, equipment) in obj.fighter.equipment_slots.items():
+            assert equipment.slot == slot and equipment.is_equipped and equipment.wearer is obj
+    assert {slot: equipment.owner.name for (slot, equipment) in orc.fighter.equipment_slots.items()} == {'right hand': 'sword'}
+    assert game.get_equipped_in_slot('left hand').owner.name == 'shield'
+    assert sorted(obj.name for obj in game.inventory if obj.equipment and obj.equipment.is_equipped) == ['dagger', 'shield']
+
+
+@pytest.fixture
+def caves(monkeypatch):
+    monkeypatch.setattr(game, 'CAVE_CHANCE', [[100, 1]])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_cave_levels(caves, seed):
+    game.new_game(seed)
+    floor = ~game.map.blocked
+    distance = distance_map(floor, [(game.player.x, game.player.y)])
+    # one cave: the floor the player can't reach was filled in
+    assert (distance[floor] < UNREACHABLE).all()
+    # the stairs down are on the tile of the cave farthest from the player, in steps
+    assert distance[game.stairs.x, game.stairs.y] == distance[floor].max()
+
+
+def test_the_same_seed_makes_the_same_caves(caves):
+    game.new_game(4)
+    (blocked, stairs) = (game.map.blocked.copy(), (game.stairs.x, game.stairs.y))
+    game.new_game(4)
+    assert np.array_equal(game.map.blocked, blocked) and (game.stairs.x, game.stairs.y) == stairs
+
+
+def test_changing_the_fov_settings_recomputes_the_fov(monkeypatch):
+    game.new_game(0)
+    lit = game.recompute_fov().copy()
+    monkeypatch.setattr(game, 'FOV_LIGHT_WALLS', False)
+    assert not np.array_equal(game.recompute_fov(), lit)  # (not the result with the walls lit)
+    assert np.array_equal(game.recompute_fov(), game.compute_visible_tiles())
+    monkeypatch.setattr(game, 'FOV_ALGO', game.FOV_SHADOWCAST)
+    assert np.array_equal(game.recompute_fov(), game.compute_visible_tiles())
+    assert game.fov_cache.misses == 3
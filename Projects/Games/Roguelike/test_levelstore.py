@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+from levelstore import LevelStore, level_size
+
+
+def make_level(number, size=10):
+    return {'meta': {'number': number}, 'tiles': {'explored': np.zeros((size, size), dtype=bool)},
+            'entities': [], 'messages': []}
+
+
+def level_files(store):
+    return sorted(os.listdir(store.directory)) if os.path.isdir(store.directory) else []
+
+
+def test_levels_past_the_budget_go_to_files(tmp_path):
+    store = LevelStore(str(tmp_path), budget=3 * level_size(make_level(0)))
+    store.clear()
+    for number in range(1, 6):
+        store.put(number, make_level(number))
+    assert list(store.levels) == [3, 4, 5]
+    assert level_files(store) == ['level1.lvl', 'level2.lvl']
+
+    assert store.take(1)['meta'] == {'number': 1}  # (from its file)
+    assert store.take(4)['meta'] == {'number': 4}  # (from memory)
+    assert store.take(4) is None
+    assert store.take(9) is None
+
+
+def test_a_level_bigger_than_the_budget(tmp_path):
+    store = LevelStore(str(tmp_path), budget=level_size(make_level(0)))
+    store.clear()
+    store.put(1, make_level(1, size=100))
+    assert not store.levels
+    assert store.take(1)['meta'] == {'number': 1}
+
+
+def test_flush_writes_the_levels_in_memory_once(tmp_path):
+    store = LevelStore(str(tmp_path))
+    store.clear()
+    store.put(1, make_level(1))
+    store.put(2, make_level(2))
+    store.flush()
+    assert level_files(store) == ['level1.lvl', 'level2.lvl']
+    os.remove(store.path(1))
+    store.flush()  # (nothing new to write)
+    assert level_files(store) == ['level2.lvl']
+
+
+def test_a_new_game_keeps_the_saved_levels_until_it_is_saved(tmp_path):
+    saved = LevelStore(str(tmp_path))
+    saved.clear()
+    saved.put(1, make_level(1))
+    saved.flush()
+
+    store = LevelStore(str(tmp_path), saved.name)  # (loaded from the save)
+    store.clear()  # a new game
+    store.put(1, make_level(1))
+    store.flush()
+    assert level_files(saved) == ['level1.lvl']
+
+    store.remove_others()  # (the new game was saved)
+    assert not os.path.exists(saved.directory)
+    assert level_files(store) == ['level1.lvl']
+
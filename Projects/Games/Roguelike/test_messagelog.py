@@ -0,0 +1,60 @@
+import libtcodpy as libtcod
+
+from messagelog import HISTORY_PAGE_LINES, MessageLog
+
+
+def texts(lines):
+    return [line for (line, color) in lines]
+
+
+def test_the_panel_keeps_the_last_lines():
+    log = MessageLog(20, 3)
+    for i in range(5):
+        log.add('message %d' % i)
+    assert texts(log) == ['message 2', 'message 3', 'message 4']
+    assert len(log) == 3
+
+
+def test_long_messages_are_wrapped():
+    log = MessageLog(10, 5)
+    log.add('the orc attacks you', libtcod.red)
+    assert texts(log) == ['the orc', 'attacks', 'you']
+    assert all(color == libtcod.red for (line, color) in log)
+
+
+def test_history_pages():
+    log = MessageLog(20, 3)
+    count = HISTORY_PAGE_LINES * 2 + 5
+    for i in range(count):
+        log.add('message %d' % i, libtcod.Color(i % 256, 1, 2))
+    assert log.history_lines == count
+    page = log.history_page(HISTORY_PAGE_LINES - 2, 4)
+    assert texts(page) == ['message %d' % i for i in range(HISTORY_PAGE_LINES - 2, HISTORY_PAGE_LINES + 2)]
+    assert page[0][1] == libtcod.Color((HISTORY_PAGE_LINES - 2) % 256, 1, 2)
+    assert texts(log.history_page(count - 1, 10)) == ['message %d' % (count - 1)]
+    assert log.history_page(count, 10) == []
+
+    # lines added after reading go at the end
+    log.add('last')
+    assert texts(log.history_page(count, 10)) == ['last']
+
+
+def test_a_new_game_replaces_the_saved_history_once_saved(tmp_path):
+    path = str(tmp_path / 'messages.log')
+    log = MessageLog(20, 3, path)
+    log.add('saved game')
+
+    log.clear()  # a new game
+    log.add('new game')
+    assert texts(log.history_page(0, 10)) == ['new game']
+    assert texts(MessageLog(20, 3, path).history_page(0, 10)) == ['saved game']
+
+    log.reload()  # the saved game is loaded after all
+    assert texts(log.history_page(0, 10)) == ['saved game']
+
+    log.clear()
+    log.add('new game')
+    log.save()
+    assert texts(MessageLog(20, 3, path).history_page(0, 10)) == ['new game']
+    log.add('after the save')
+    assert texts(log.history_page(0, 10)) == ['new game', 'after the save']
@@ -0,0 +1,60 @@
+import numpy as np
+
+from pathfinding import UNREACHABLE, distance_map, step_downhill
+
+
+def parse(rows):
+    # a map drawn as rows of '#' (walls) and '.' (floor), as a walkable array indexed [x, y]
+    return np.array([[c != '#' for c in row] for row in rows]).T
+
+
+def test_distances_count_diagonal_steps_as_one():
+    distance = distance_map(np.ones((5, 4), dtype=bool), [(0, 0)])
+    assert distance[0, 0] == 0
+    assert distance[3, 3] == 3
+    assert distance[4, 1] == 4
+
+
+def test_distances_go_around_walls():
+    walkable = parse(['.#...',
+                      '.#.#.',
+                      '...#.'])
+    distance = distance_map(walkable, [(0, 0)])
+    assert distance[2, 0] == 4
+    assert distance[4, 0] == 5
+    assert distance[4, 2] == 6
+    assert distance[1, 0] == UNREACHABLE  # (walls aren't reached)
+
+
+def test_unreachable_tiles_and_several_goals():
+    walkable = parse(['..#..',
+                      '..#..'])
+    distance = distance_map(walkable, [(0, 0)])
+    assert (distance[3:, :] == UNREACHABLE).all()
+    distance = distance_map(walkable, [(0, 0), (4, 1)])
+    assert distance[3, 0] == 1 and distance[1, 1] == 1
+
+
+def test_step_downhill_follows_the_distance_map():
+    walkable = parse(['.....',
+                      '.###.',
+                      '.....'])
+    distance = distance_map(walkable, [(4, 2)])
+    (x, y) = (0, 0)
+    path = []
+    while (x, y) != (4, 2):
+        (dx, dy) = step_downhill(distance, x, y, lambda tx, ty: True)
+        (x, y) = (x + dx, y + dy)
+        path.append((x, y))
+    assert len(path) == distance[0, 0] == 5
+
+
+def test_step_downhill_skips_taken_tiles_and_uses_the_origin():
+    distance = distance_map(np.ones((3, 3), dtype=bool), [(2, 1)])
+    assert step_downhill(distance, 0, 0, lambda x, y: True) == (1, 0)  # (straight steps win ties)
+    assert step_downhill(distance, 0, 0, lambda x, y: (x, y) != (1, 0)) == (1, 1)
+    assert step_downhill(distance, 0, 0, lambda x, y: False) is None
+
+    # the same map covering the tiles from (10, 20) on
+    assert step_downhill(distance, 10, 20, lambda x, y: (x, y) == (11, 21), (10, 20)) == (1, 1)
+    assert step_downhill(distance, 0, 0, lambda x, y: True, (10, 20)) is None  # (outside of it)
@@ -0,0 +1,95 @@
+import pytest
+
+import game
+from bots import RandomWalker
+from replay import ReplayController, ReplayError, Recorder, read_replay
+
+
+class RecordingController:
+    # passes a bot's inputs on to the game, and writes them down like a player's
+    def __init__(self, bot, recorder):
+        self.bot = bot
+        self.recorder = recorder
+
+    def next_key(self):
+        key = self.bot.next_key()
+        self.recorder.key(key)
+        return key
+
+    def choose(self, header, options):
+        index = self.bot.choose(header, options)
+        self.recorder.choice(index)
+        return index
+
+    def choose_target(self, max_range):
+        target = self.bot.choose_target(max_range)
+        self.recorder.target(*target)
+        return target
+
+
+def record_game(path, seed, turns):
+    game.new_game(seed)
+    recorder = Recorder(seed, game.MAP_WIDTH, game.MAP_HEIGHT)
+    game.play_headless(RecordingController(RandomWalker(seed), recorder), turns)
+    recorder.write(path, game.turn, game.state_hash())
+    return read_replay(path)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_replays_end_like_the_recorded_game(tmp_path, seed):
+    path = str(tmp_path / 'game.json')
+    replay = record_game(path, seed, 400)
+    assert game.replay_game(replay) == replay['hash']
+    assert game.turn == replay['turns']
+    assert game.check_replays([path])
+
+
+def test_replays_that_go_differently_are_caught(tmp_path):
+    replay = record_game(str(tmp_path / 'game.json'), 0, 200)
+    replay['seed'] += 1  # (another dungeon, where the same keys do other things)
+    try:
+        assert game.replay_game(replay) != replay['hash']
+    except ReplayError:
+        pass
+
+
+def test_replay_controller_plays_back_the_inputs_in_order():
+    controller = ReplayController([['key', 65, 103], ['choice', 2], ['target', 4, 5]])
+    key = controller.next_key()
+    assert (key.vk, key.c) == (65, 103)
+    with pytest.raises(ReplayError):
+        controller.choose_target(None)  # (the next input is a menu choice)
+    assert controller.choose('', ['a', 'b', 'c']) == 2
+    assert controller.choose_target(None) == (4, 5)
+    assert controller.next_key().vk == game.libtcod.KEY_ESCAPE  # (out of keys: quit)
+    with pytest.raises(ReplayError):
+        controller.choose('', ['a'])
+
+
+def test_not_a_replay(tmp_path):
+    path = tmp_path / 'game.json'
+    path.write_text('{"version": 0}')
+    with pytest.raises(ReplayError):
+        read_replay(str(path))
+
+
+def test_replays_go_on_after_death():
+    # the blow that kills the player can also level them up: play_game still asks for the stat
+    # and records the choice, so a replay has to keep reading the inputs after death
+    game.new_game(0)
+    game.player.fighter.xp = game.LEVEL_UP_BASE + game.LEVEL_UP_FACTOR
+    game.player_death(game.player)
+    power = game.player.fighter.power
+    controller = ReplayController([['choice', 1], ['key', 0, ord('g')]])
+    game.play_headless(controller, 100, until_exit=True)
+    assert controller.position == 2  # (the keys after death are used up too, then ESC quits)
+    assert game.player.level == 2 and game.player.fighter.power == power + 1
+    assert game.game_state == 'dead'
+
+
+def test_bots_stop_at_death():
+    game.new_game(0)
+    game.player_death(game.player)
+    controller = ReplayController([['key', 0, ord('g')]])
+    game.play_headless(controller, 100)
+    assert controller.position == 0
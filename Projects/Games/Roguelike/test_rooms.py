@@ -0,0 +1,35 @@
+import libtcodpy as libtcod
+
+from rooms import UnionFind, connect_rooms, place_rooms
+
+
+def test_union_find():
+    groups = UnionFind(5)
+    assert groups.union(0, 1)
+    assert groups.union(3, 4)
+    assert not groups.union(1, 0)
+    assert groups.components == 3
+    assert groups.find(0) == groups.find(1) != groups.find(3)
+    assert groups.union(1, 4)
+    assert groups.find(0) == groups.find(3)
+    assert groups.components == 2
+
+
+def test_placed_rooms_do_not_intersect():
+    rng = libtcod.random_new_from_seed(3)
+    (rooms, bins) = place_rooms(200, 150, 300, 6, 10, rng)
+    assert len(rooms) > 50
+    for (i, room) in enumerate(rooms):
+        assert 0 <= room.x1 and room.x2 < 200 and 0 <= room.y1 and room.y2 < 150
+        assert not any(room.intersect(other) for other in rooms[:i])
+
+
+def test_connected_rooms_can_all_be_reached():
+    for seed in range(5):
+        rng = libtcod.random_new_from_seed(seed)
+        (rooms, bins) = place_rooms(300, 100, 200, 6, 10, rng)
+        links = connect_rooms(rooms, bins, rng)
+        groups = UnionFind(len(rooms))
+        for (i, j) in links:
+            groups.union(i, j)
+        assert groups.components == 1
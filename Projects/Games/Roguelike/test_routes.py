@@ -0,0 +1,52 @@
+import numpy as np
+
+from pathfinding import UNREACHABLE, distance_map
+from routes import RouteGraph
+
+
+def random_map(seed, width=50, height=40, walls=0.3):
+    return np.random.default_rng(seed).random((width, height)) > walls
+
+
+def test_a_route_exists_exactly_when_the_goal_can_be_reached():
+    for seed in range(5):
+        walkable = random_map(seed)
+        graph = RouteGraph(walkable, size=8)
+        rng = np.random.default_rng(seed + 100)
+        open_tiles = np.argwhere(walkable)
+        for _ in range(20):
+            ((x, y), (goal_x, goal_y)) = open_tiles[rng.choice(len(open_tiles), 2, replace=False)].tolist()
+            reachable = distance_map(walkable, [(goal_x, goal_y)])[x, y] < UNREACHABLE
+            path = graph.route(x, y, goal_x, goal_y)
+            assert (path is not None) == reachable
+            if path is not None:
+                assert path[-1] == (goal_x, goal_y)
+                assert all(walkable[tile] for tile in path)
+
+
+def test_stepping_along_a_route_reaches_the_goal_through_open_tiles():
+    # walls across the map, each with a gap at alternate ends
+    walkable = np.ones((50, 40), dtype=bool)
+    for x in range(6, 50, 6):
+        walkable[x, :] = False
+        walkable[x, 1 if x % 12 else 38] = True
+    graph = RouteGraph(walkable, size=8)
+    ((x, y), (goal_x, goal_y)) = ((1, 20), (49, 20))
+    shortest = int(distance_map(walkable, [(goal_x, goal_y)])[x, y])
+    steps = 0
+    while (x, y) != (goal_x, goal_y):
+        (dx, dy) = graph.step(x, y, goal_x, goal_y, lambda x, y: walkable[x, y])
+        (x, y) = (x + dx, y + dy)
+        assert walkable[x, y]
+        steps += 1
+        assert steps <= 2 * shortest
+    assert graph.step(x, y, goal_x, goal_y, lambda x, y: True) is None
+
+
+def test_walls_between_clusters_leave_no_route():
+    walkable = np.ones((32, 16), dtype=bool)
+    walkable[16, :] = False
+    graph = RouteGraph(walkable, size=8)
+    assert graph.route(2, 2, 30, 10) is None
+    walkable[16, 5] = True
+    assert RouteGraph(walkable, size=8).route(2, 2, 30, 10)[-1] == (30, 10)
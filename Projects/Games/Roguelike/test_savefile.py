@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from savefile import (JOURNAL_SUFFIX, EntityRecord, SaveFormatError, append_changes, apply_changes, changes_between,
+                      decode, encode, read_save, write_save)
+
+
+def make_record(uid, x, y, name='orc', **fields):
+    values = dict.fromkeys(EntityRecord._fields, 0)
+    values.update(char='o', name=name, death_function=None, ai=None, old_ai=None, use_function=None, slot=None)
+    values.update(uid=uid, x=x, y=y, **fields)
+    return EntityRecord(**values)
+
+
+def make_snapshot(width=13, height=7):
+    blocked = np.zeros((width, height), dtype=bool)
+    blocked[0, :] = blocked[:, 0] = True
+    explored = np.zeros((width, height), dtype=bool)
+    explored[1:4, 1:3] = True
+    return {
+        'meta': {'dungeon_level': 3, 'game_state': 'playing', 'turn': 120},
+        'tiles': {'blocked': blocked, 'explored': explored},
+        'entities': [make_record(1, 2, 3, 'player', hp=30, ai=None), make_record(2, 5, 4, ai='BasicMonster'),
+                     make_record(3, 6, 1, 'dagger', slot='right hand')],
+        'messages': [('Welcome!', (255, 0, 0)), ('The orc hits you.', (255, 255, 255))],
+    }
+
+
+def assert_same(snapshot, expected):
+    assert snapshot['meta'] == expected['meta']
+    assert snapshot['tiles'].keys() == expected['tiles'].keys()
+    for (name, layer) in expected['tiles'].items():
+        assert np.array_equal(snapshot['tiles'][name], layer)
+    assert snapshot['entities'] == expected['entities']
+    assert snapshot['messages'] == expected['messages']
+
+
+def test_encode_decode_round_trip():
+    snapshot = make_snapshot()
+    assert_same(decode(encode(snapshot)), snapshot)
+
+
+def test_maps_and_coordinates_past_16_bits():
+    snapshot = make_snapshot(width=40000, height=2)
+    snapshot['entities'].append(make_record(4, 39999, 1))
+    decoded = decode(encode(snapshot))
+    assert decoded['tiles']['blocked'].shape == (40000, 2)
+    assert decoded['entities'][-1].x == 39999
+
+
+def test_not_a_save():
+    with pytest.raises(SaveFormatError):
+        decode(b'this is not a save file')
+    with pytest.raises(SaveFormatError):
+        decode(b'')
+
+
+def test_changes_between_and_apply_changes():
+    old = make_snapshot()
+    new = make_snapshot()
+    new['meta']['turn'] = 121
+    new['tiles']['explored'][5:8, 2] = True
+    new['entities'][1] = new['entities'][1]._replace(x=6)
+    del new['entities'][2]
+    new['entities'].append(make_record(9, 1, 1, 'sword'))
+
+    changes = changes_between(old, new)
+    assert [record.uid for record in changes['entities']] == [2, 9]  # (only the ones that changed)
+    assert list(changes['tile_changes']) == ['explored']
+
+    # like a journal entry: written, read back, applied to the old snapshot
+    apply_changes(old, decode(encode(changes)))
+    assert_same(old, new)
+
+
+def test_no_changes_between_different_maps():
+    assert changes_between(make_snapshot(), make_snapshot(width=20)) is None
+
+
+def test_write_and_read_a_save(tmp_path):
+    path = str(tmp_path / 'savegame.sav')
+    snapshot = make_snapshot()
+    write_save(path, snapshot)
+    loaded = read_save(path)
+    del loaded['meta']['save_id']
+    assert_same(loaded, snapshot)
+    assert not (tmp_path / 'savegame.sav.tmp').exists()
+
+
+def test_save_and_journal(tmp_path):
+    path = str(tmp_path / 'savegame.sav')
+    snapshot = make_snapshot()
+    save_id = write_save(path, snapshot)
+
+    later = make_snapshot()
+    later['meta']['turn'] = 170
+    later['entities'][0] = later['entities'][0]._replace(hp=12)
+    append_changes(path, save_id, changes_between(snapshot, later))
+
+    loaded = read_save(path)
+    del loaded['meta']['save_id']
+    assert_same(loaded, later)
+
+
+def test_journal_cut_short_and_stale_entries_are_skipped(tmp_path):
+    path = str(tmp_path / 'savegame.sav')
+    snapshot = make_snapshot()
+    save_id = write_save(path, snapshot)
+
+    later = make_snapshot()
+    later['meta']['turn'] = 170
+    append_changes(path, save_id + 1, changes_between(snapshot, later))  # (of another save)
+    append_changes(path, save_id, changes_between(snapshot, later))
+    with open(path + JOURNAL_SUFFIX, 'r+b') as file:  # the last entry was being written during a crash
+        file.truncate(file.seek(0, 2) - 10)
+
+    loaded = read_save(path)
+    assert loaded['meta']['turn'] == 120
+
+
+def test_a_new_save_drops_the_journal(tmp_path):
+    path = str(tmp_path / 'savegame.sav')
+    snapshot = make_snapshot()
+    save_id = write_save(path, snapshot)
+    append_changes(path, save_id, changes_between(snapshot, snapshot))
+    write_save(path, snapshot)
+    assert not (tmp_path / ('savegame.sav' + JOURNAL_SUFFIX)).exists()
@@ -0,0 +1,58 @@
+from scheduler import ACTION_COST, NORMAL_SPEED, TurnScheduler
+
+
+class Actor:
+    def __init__(self, name, speed=NORMAL_SPEED):
+        self.name = name
+        self.speed = speed
+        self.energy = 0
+
+
+def run(scheduler, ticks, stays_awake=lambda actor: True):
+    acted = []
+
+    def act(actor):
+        acted.append(actor.name)
+        return stays_awake(actor)
+
+    scheduler.advance(ticks, act)
+    return acted
+
+
+def test_actors_act_as_often_as_their_speed_allows():
+    scheduler = TurnScheduler()
+    (slow, fast) = (Actor('slow'), Actor('fast', speed=2 * NORMAL_SPEED))
+    scheduler.wake(slow)
+    scheduler.wake(fast)
+    acted = run(scheduler, 4 * ACTION_COST // NORMAL_SPEED)
+    assert acted.count('slow') == 4
+    assert acted.count('fast') == 8
+
+
+def test_dormant_actors_do_not_act():
+    scheduler = TurnScheduler()
+    actor = Actor('orc')
+    assert run(scheduler, 100) == []
+    scheduler.wake(actor)
+    assert scheduler.is_awake(actor)
+    scheduler.sleep(actor)
+    assert run(scheduler, 100) == []
+
+
+def test_actors_that_say_so_go_dormant():
+    scheduler = TurnScheduler()
+    actor = Actor('orc')
+    scheduler.wake(actor)
+    assert run(scheduler, 100, lambda actor: False) == ['orc']
+    assert not scheduler.is_awake(actor)
+
+
+def test_waking_up_again_starts_with_no_energy():
+    scheduler = TurnScheduler()
+    actor = Actor('orc')
+    scheduler.wake(actor)
+    run(scheduler, ACTION_COST // NORMAL_SPEED - 1)
+    scheduler.sleep(actor)
+    scheduler.wake(actor)  # (its old entry in the queue is skipped)
+    assert run(scheduler, ACTION_COST // NORMAL_SPEED - 1) == []
+    assert run(scheduler, 1) == ['orc']
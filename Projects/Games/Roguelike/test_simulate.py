@@ -0,0 +1,32 @@
+import argparse
+
+import pytest
+
+import game
+from simulate import apply_settings, setting
+
+
+@pytest.fixture
+def restore_constants():
+    saved = (game.CONFUSE_NUM_TURNS, game.HEAL_AMOUNT, dict(game.MONSTER_CHANCES))
+    yield
+    (game.CONFUSE_NUM_TURNS, game.HEAL_AMOUNT) = saved[:2]
+    game.MONSTER_CHANCES.update(saved[2])
+
+
+def test_settings_change_the_game_constants(restore_constants):
+    apply_settings([setting('HEAL_AMOUNT=30'), setting('MONSTER_CHANCES.create_troll=[[30,2]]')])
+    assert game.HEAL_AMOUNT == 30
+    assert game.MONSTER_CHANCES[game.create_troll] == [[30, 2]]
+
+
+def test_confusion_turns_can_be_set(restore_constants):
+    apply_settings([setting('CONFUSE_NUM_TURNS=3')])
+    assert game.ConfusedMonster(game.BasicMonster()).num_turns == 3
+
+
+@pytest.mark.parametrize('text', ['HEAL_AMOUNT', 'NO_SUCH_CONSTANT=1', 'HEAL_AMOUNT=not json',
+                                  'MONSTER_CHANCES.create_dragon=[[1,1]]'])
+def test_bad_settings(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        setting(text)
@@ -0,0 +1,74 @@
+import math
+import random
+
+from spatial import SpatialIndex
+
+
+class Thing:
+    def __init__(self, x, y, layer=0, blocks=False):
+        self.x = x
+        self.y = y
+        self.layer = layer
+        self.blocks = blocks
+
+
+def scattered(count, seed=0, size=30):
+    rng = random.Random(seed)
+    things = [Thing(rng.randrange(size), rng.randrange(size), rng.randrange(4), rng.random() < 0.25)
+              for _ in range(count)]
+    index = SpatialIndex()
+    for thing in things:
+        index.add(thing)
+    return (things, index)
+
+
+def test_tiles_keep_their_objects_in_drawing_order():
+    index = SpatialIndex()
+    (actor, item, stairs) = (Thing(1, 1, 3, blocks=True), Thing(1, 1, 2), Thing(1, 1, 0))
+    for thing in (actor, item, stairs):
+        index.add(thing)
+    assert list(index.at(1, 1)) == [stairs, item, actor]
+    assert index.is_blocked(1, 1) and not index.is_blocked(2, 1)
+
+    index.move(actor, 2, 1)
+    assert (actor.x, actor.y) == (2, 1)
+    assert list(index.at(1, 1)) == [stairs, item] and list(index.at(2, 1)) == [actor]
+    index.remove(item)
+    index.remove(stairs)
+    assert index.at(1, 1) == () and (1, 1) not in index.tiles
+
+
+# few objects (the occupied tiles are walked) and many (the tiles around are)
+def test_queries_find_what_a_scan_of_every_object_finds():
+    for count in (5, 600):
+        (things, index) = scattered(count)
+        for (x, y, radius) in ((10, 10, 3), (0, 29, 5.5), (15, 15, 0)):
+            expected = {id(t) for t in things if (t.x - x) ** 2 + (t.y - y) ** 2 <= radius ** 2}
+            assert {id(t) for t in index.in_radius(x, y, radius)} == expected
+        for (x1, y1, x2, y2) in ((3, 4, 9, 20), (0, 0, 30, 30), (5, 5, 5, 9)):
+            expected = {id(t) for t in things if x1 <= t.x < x2 and y1 <= t.y < y2}
+            assert {id(t) for t in index.in_rect(x1, y1, x2, y2)} == expected
+
+
+def test_nearest():
+    for count in (5, 600):
+        (things, index) = scattered(count, seed=count)
+        for (x, y) in ((10, 10), (0, 0), (29, 3)):
+            distance = min((math.hypot(t.x - x, t.y - y) for t in things if t.blocks), default=math.inf)
+            found = index.nearest(x, y, 8, lambda t: t.blocks)
+            if distance >= 8 + 1:
+                assert found is None
+            else:
+                assert found.blocks and math.hypot(found.x - x, found.y - y) == distance
+
+
+def test_nearest_reaches_a_tile_past_the_range():
+    # (max_range + 1 is out of range, anything closer is in)
+    index = SpatialIndex()
+    far = Thing(19, 13)  # 9 tiles away
+    index.add(far)
+    assert index.nearest(10, 13, 8) is None
+    near = Thing(18, 16)  # 8.54 tiles away
+    index.add(near)
+    assert index.nearest(10, 13, 8) is near
+    assert index.nearest(10, 13, 7) is None
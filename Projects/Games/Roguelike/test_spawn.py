@@ -0,0 +1,37 @@
+import libtcodpy as libtcod
+
+from spawn import AliasTable, SpawnTable, from_level
+
+
+def test_from_level():
+    table = [[2, 1], [3, 4], [5, 6]]
+    assert [from_level(table, level) for level in range(0, 8)] == [0, 2, 2, 2, 3, 3, 5, 5]
+
+
+def test_alias_table_gives_each_choice_its_weight():
+    # every column and every point in it, which the random numbers pick evenly
+    weights = {'orc': 80, 'troll': 15, 'dragon': 5, 'nothing': 0}
+    table = AliasTable(weights)
+    counts = dict.fromkeys(weights, 0)
+    for column in range(len(table.choices)):
+        for point in range(table.total):
+            choice = table.choices[column] if point < table.threshold[column] else table.choices[table.alias[column]]
+            counts[choice] += 1
+    assert counts == {choice: weight * len(table.choices) for (choice, weight) in weights.items()}
+
+
+def test_alias_table_samples():
+    rng = libtcod.random_new_from_seed(1)
+    table = AliasTable({'a': 3, 'b': 1})
+    samples = [table.sample(rng) for _ in range(4000)]
+    assert 2800 < samples.count('a') < 3200
+    assert AliasTable({'only': 7}).sample(rng) == 'only'
+    assert AliasTable({'none': 0}).sample(rng) is None
+
+
+def test_spawn_table_at_a_level():
+    rng = libtcod.random_new_from_seed(2)
+    table = SpawnTable([[2, 1], [4, 3]], {'orc': [[80, 1]], 'troll': [[15, 3]]}, 2)
+    assert table.maximum == 2
+    assert {table.choose(rng) for _ in range(50)} == {'orc'}
+    assert all(0 <= table.count(rng) <= 2 for _ in range(50))
@@ -0,0 +1,33 @@
+from tilemap import TileMap
+
+
+def test_carve_makes_tiles_passable():
+    tile_map = TileMap(10, 8)
+    tile_map.carve(2, 3, 5, 6)
+    assert not tile_map.blocked[2:5, 3:6].any()
+    assert not tile_map.block_sight[2:5, 3:6].any()
+    assert tile_map.blocked.sum() == 10 * 8 - 3 * 3
+
+
+def test_tile_views_read_and_write_the_arrays():
+    tile_map = TileMap(10, 8)
+    tile = tile_map[4][5]
+    assert tile.blocked and tile.block_sight and not tile.explored
+    tile.explored = True
+    assert tile_map.explored[4, 5]
+    assert len(tile_map) == 10 and len(tile_map[0]) == 8
+
+
+def test_setters_that_change_the_map_bump_the_version():
+    tile_map = TileMap(10, 8)
+    version = tile_map.version
+    tile_map[1][1].blocked = False
+    assert tile_map.version > version
+
+    version = tile_map.version
+    tile_map[1][1].block_sight = False
+    assert tile_map.version > version
+
+    version = tile_map.version
+    tile_map[1][1].explored = True  # (explored tiles don't change paths or sight)
+    assert tile_map.version == version
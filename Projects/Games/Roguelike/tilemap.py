@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class TileMap:
+    # the map of the dungeon, stored as one typed array per tile property instead of a
+    # Tile object per tile. arrays are indexed [x, y], just like the old list of lists.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        # fill map with "blocked" tiles that also block sight
+        self.blocked = np.ones((width, height), dtype=bool)
+        self.block_sight = np.ones((width, height), dtype=bool)
+
+        # all tiles start unexplored
+        self.explored = np.zeros((width, height), dtype=bool)
+
+        # goes up every time blocked or block_sight changes, so FOV results, distance maps... computed
+        # before can be told apart
+        self.version = 0
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x):
+        # map[x][y] still works, and gives a Tile view of that position
+        return TileColumn(self, x)
+
+    def carve(self, x1, y1, x2, y2):
+        # make all tiles with x1 <= x < x2 and y1 <= y < y2 passable
+        self.blocked[x1:x2, y1:y2] = False
+        self.block_sight[x1:x2, y1:y2] = False
+        self.version += 1
+
+    def touch(self):
+        # call this after writing to the blocked or block_sight arrays directly
+        self.version += 1
+
+
+class TileColumn:
+    # one column of the map, only exists so that map[x][y] keeps working
+    __slots__ = ('tile_map', 'x')
+
+    def __init__(self, tile_map, x):
+        self.tile_map = tile_map
+        self.x = x
+
+    def __len__(self):
+        return self.tile_map.height
+
+    def __getitem__(self, y):
+        return Tile(self.tile_map, self.x, y)
+
+
+class Tile:
+    # a tile of the map and its properties. this is only a view: reading or
+    # changing a property goes straight to the map's arrays.
+    __slots__ = ('tile_map', 'x', 'y')
+
+    def __init__(self, tile_map, x, y):
+        self.tile_map = tile_map
+        self.x = x
+        self.y = y
+
+    @property
+    def blocked(self):
+        return bool(self.tile_map.blocked[self.x, self.y])
+
+    @blocked.setter
+    def blocked(self, value):
+        self.tile_map.blocked[self.x, self.y] = value
+        self.tile_map.version += 1
+
+    @property
+    def block_sight(self):
+        return bool(self.tile_map.block_sight[self.x, self.y])
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.tile_map.block_sight[self.x, self.y] = value
+        self.tile_map.version += 1
+
+    @property
+    def explored(self):
+        return bool(self.tile_map.explored[self.x, self.y])
+
+    @explored.setter
+    def explored(self, value):
+        self.tile_map.explored[self.x, self.y] = value